@@ -9,8 +9,14 @@ import logging
 import re
 import time
 import sys
-import struct
 import decimal
+import hashlib
+import bisect
+import math
+import array
+import json
+import queue
+import threading
 
 import vxi11
 
@@ -21,10 +27,91 @@ try:
 except AttributeError:
     clock = time.time
 
+class ValueLadder(object):
+    """
+    A sorted set of possible values of a setting (like the 1-2-5 steps of the
+    timebase scale) allowing to find the value closest to any number
+    by binary search.
+
+    :ivar values: the possible values in ascending order
+    """
+
+    def __init__(self, values):
+        self.values = tuple(sorted(set(values)))
+        self._scaled = {}
+
+    @classmethod
+    def from_range(cls, min_val, max_val, mantissae=(1, 2, 5)):
+        """
+        Creates the ladder of values like 1, 2, 5, 10, 20, 50, ... from min_val to max_val.
+        """
+        exponent = int('{0:e}'.format(min_val).split('e')[1])
+        values = []
+        while True:
+            for mantissa in mantissae:
+                value = float('{0}e{1}'.format(mantissa, exponent))
+                if value > max_val * (1 + 1e-9):
+                    return cls(values)
+                if value >= min_val * (1 - 1e-9):
+                    values.append(value)
+            exponent += 1
+
+    def closest(self, value):
+        """ The possible value closest to ``value`` (the lower one in case of a tie) """
+        values = self.values
+        idx = bisect.bisect_left(values, value)
+        if idx == 0:
+            return values[0]
+        if idx == len(values):
+            return values[-1]
+        lower, upper = values[idx-1], values[idx]
+        return lower if value - lower <= upper - value else upper
+
+    def scaled(self, factor):
+        """
+        The ladder with all values multiplied by ``factor``.
+        The result is cached, so asking for the same factor again is cheap.
+        """
+        factor = float(factor)
+        if factor not in self._scaled:
+            self._scaled[factor] = ValueLadder(val * factor for val in self.values)
+        return self._scaled[factor]
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, value):
+        return value in self.values
+
 class DS1054Z(vxi11.Instrument):
     """
     This class represents the oscilloscope.
 
+    On construction, the scope is asked for its identification (``*IDN?``)
+    which has to match :py:attr:`IDN_PATTERN`. You can save this round trip:
+
+    * by passing the known identification string as ``idn=...``
+      (e.g. from a previous discovery, see :py:mod:`ds1054z.netscan`), or
+    * by passing ``lazy=True`` which defers the identification until
+      the first message is sent to the scope (or one of the identity
+      attributes below is accessed).
+
+    By default, the scope is talked to via VXI-11. Pass ``transport='tcp'``
+    to use the raw SCPI socket instead (port 5555, or ``port=...``),
+    which saves the RPC overhead on every message (see :py:mod:`ds1054z.transport`).
+
+    Pass ``cache_size=...`` (in bytes) to keep the waveforms read from the
+    stopped scope in memory, so reading them again doesn't need another
+    transfer (see :py:mod:`ds1054z.cache`).
+
+    An instance can be shared by several threads. Each message exchange
+    and each multi-message operation (like reading a waveform) holds an
+    internal lock, so requests of different threads never interleave.
+    Use :py:meth:`transaction` to group your own messages the same way.
+
     :ivar product: like ``'DS1054Z'`` (depending on your device)
     :ivar vendor:  should be ``'RIGOL TECHNOLOGIES'``
     :ivar serial:  e.g. ``'DS1ZA118171631'``
@@ -35,7 +122,7 @@ class DS1054Z(vxi11.Instrument):
     ENCODING = 'utf-8'
     H_GRID = 12
     SAMPLES_ON_DISPLAY = 1200
-    DISPLAY_DATA_BYTES = 100000
+    DISPLAY_DATA_CHUNK = 16384
     SCALE_MANTISSAE = (1, 2, 5)
     MIN_TIMEBASE_SCALE = 5E-9
     MAX_TIMEBASE_SCALE = 50E0
@@ -44,30 +131,108 @@ class DS1054Z(vxi11.Instrument):
     MIN_PROBE_RATIO = 0.01
     MAX_PROBE_RATIO = 1000
     CHANNEL_LIST = ("CHAN1", "CHAN2", "CHAN3", "CHAN4", "MATH")
+    PROBE_RATIO_LADDER = ValueLadder.from_range(MIN_PROBE_RATIO, MAX_PROBE_RATIO, SCALE_MANTISSAE)
+    TIMEBASE_SCALE_LADDER = ValueLadder.from_range(MIN_TIMEBASE_SCALE, MAX_TIMEBASE_SCALE, SCALE_MANTISSAE)
+    CHANNEL_SCALE_LADDER = ValueLadder.from_range(MIN_CHANNEL_SCALE, MAX_CHANNEL_SCALE, SCALE_MANTISSAE)
+    MEMORY_DEPTH_LADDER = ValueLadder((12000, 120000, 1200000, 12000000, 24000000,
+                                       6000,  60000,  600000,  6000000, 12000000,
+                                       3000,  30000,  300000,  3000000,  6000000))
+    possible_probe_ratio_values = PROBE_RATIO_LADDER.values
+    possible_timebase_scale_values = TIMEBASE_SCALE_LADDER.values
+    possible_channel_scale_values = CHANNEL_SCALE_LADDER.values
+    possible_memory_depth_values = MEMORY_DEPTH_LADDER.values
+    ANALOG_CHANNEL_LIST = ("CHAN1", "CHAN2", "CHAN3", "CHAN4")
+    MAX_CONCATENATED_LENGTH = 500
+    MEASUREMENT_ITEMS = ('vmax', 'vmin', 'vpp', 'vtop', 'vbase', 'vamp', 'vavg', 'vrms', 'overshoot', 'preshoot',
+                         'marea', 'mparea', 'period', 'frequency', 'rtime', 'ftime', 'pwidth', 'nwidth', 'pduty', 'nduty',
+                         'rdelay', 'fdelay', 'rphase', 'fphase', 'tvmax', 'tvmin', 'pslewrate', 'nslewrate',
+                         'vupper', 'vmid', 'vlower', 'variance', 'pvrms')
+    MEASUREMENT_TYPES = ('CURRent', 'MAXimum', 'MINimum', 'AVERages', 'DEViation')
+    #: The value returned by the scope if a measurement cannot be taken
+    INVALID_MEASUREMENT = 9.9e37
+    NON_SETTING_COMMANDS = (':WAV', 'WAV', ':RUN', ':STOP', ':SING', ':TFOR')
+    #: bytes per sample and maximum number of samples per ``:WAVeform:DATA?`` request
+    WAVEFORM_FORMATS = {'BYT': (1, 250000), 'WOR': (2, 125000), 'ASC': (None, 15625)}
+    #: how often a failed ``:WAVeform:DATA?`` request is repeated
+    CHUNK_RETRIES = 3
+    #: seconds to wait before the first retry, doubled for every further one
+    CHUNK_RETRY_DELAY = 0.1
+    CHUNK_ERRORS = (IOError, OSError, vxi11.vxi11.Vxi11Exception, vxi11.rpc.RPCError)
 
     def __init__(self, host, *args, **kwargs):
+        idn = kwargs.pop('idn', None)
+        lazy = kwargs.pop('lazy', False)
+        transport = kwargs.pop('transport', 'vxi11')
+        port = kwargs.pop('port', None)
+        cache_size = kwargs.pop('cache_size', None)
         self.start = clock()
+        self._io_lock = threading.RLock()
         super(DS1054Z, self).__init__(host, *args, **kwargs)
-        idn = self.idn
+        if transport == 'vxi11':
+            self.transport = None
+        elif transport == 'tcp':
+            from ds1054z.transport import ScpiSocket, SCPI_PORT
+            self.transport = ScpiSocket(self.host, port or SCPI_PORT)
+        elif hasattr(transport, 'write_raw') and hasattr(transport, 'read_raw'):
+            self.transport = transport
+        else:
+            raise NameError('Unknown transport: {0}'.format(transport))
+        self._waveform_source = None
+        self.waveform_cache = None
+        if cache_size:
+            from ds1054z.cache import WaveformCache
+            self.waveform_cache = WaveformCache(cache_size)
+        #: advanced by every message possibly changing the acquired data (see :py:mod:`ds1054z.cache`)
+        self.acquisition_generation = 0
+        self.concatenated_queries = True
+        self._setup_hash = None
+        self._probe_ratios = {}
+        self._identity = None
+        if idn is not None or not lazy:
+            self._identify(idn)
+
+    def _identify(self, idn=None):
+        """
+        Checks the identification string of the device (asking for it if not given).
+        """
+        if idn is None:
+            # mark the identification as being in progress for write_raw()
+            self._identity = ()
+            try:
+                idn = self.idn
+            except:
+                self._identity = None
+                raise
         match = re.match(self.IDN_PATTERN, idn)
         if not match:
+            self._identity = None
             msg = "Unknown device identification:\n%s\n" \
                   "If you believe this device should be supported " \
                   "by this package, feel free to contact " \
                   "the maintainer with this information." % idn
             raise NameError(msg)
-        idn = idn.split(',')
-        self.vendor = idn[0]
-        self.product = idn[1]
-        self.serial = idn[2]
-        self.firmware = idn[3]
-        self.mask_begin_num = None
-        self.possible_probe_ratio_values = self._populate_possible_values('PROBE_RATIO')
-        self.possible_timebase_scale_values = self._populate_possible_values('TIMEBASE_SCALE')
-        self.possible_channel_scale_values = self._populate_possible_values('CHANNEL_SCALE')
-        self.possible_memory_depth_values = (12000, 120000, 1200000, 12000000, 24000000,
-                                              6000,  60000,  600000,  6000000, 12000000,
-                                              3000,  30000,  300000,  3000000,  6000000)
+        self._identity = tuple(idn.split(',')[:4])
+
+    def _identity_part(self, idx):
+        if not self._identity:
+            self._identify()
+        return self._identity[idx]
+
+    @property
+    def vendor(self):
+        return self._identity_part(0)
+
+    @property
+    def product(self):
+        return self._identity_part(1)
+
+    @property
+    def serial(self):
+        return self._identity_part(2)
+
+    @property
+    def firmware(self):
+        return self._identity_part(3)
 
     def clock(self):
         return clock() - self.start
@@ -75,15 +240,80 @@ class DS1054Z(vxi11.Instrument):
     def log_timing(self, msg):
         logger.info('{0:.3f} - {1}'.format(self.clock(), msg))
 
+    def open(self):
+        if self.transport is not None:
+            self.transport.open(self.timeout)
+        else:
+            super(DS1054Z, self).open()
+
+    def close(self):
+        if getattr(self, 'transport', None) is not None:
+            self.transport.close()
+        else:
+            super(DS1054Z, self).close()
+
+    def transaction(self):
+        """
+        The lock serializing the communication with the scope.
+        Hold it to send several messages without other threads getting in between:
+
+        >>> with scope.transaction():
+        ...     scope.write(':WAVeform:SOURce CHAN2')
+        ...     preamble = scope.waveform_preamble
+
+        The lock is reentrant, all methods of this class can be called while holding it.
+        Methods reading chunks ahead in a background thread (like
+        :py:meth:`get_waveform_envelope` or :py:meth:`iter_waveform_samples`)
+        read them in the calling thread instead while it holds the lock.
+        """
+        return self._io_lock
+
     def write_raw(self, cmd, *args, **kwargs):
-        self.log_timing('starting write')
-        logger.debug('sending: ' + repr(cmd))
-        super(DS1054Z, self).write_raw(cmd, *args, **kwargs)
-        self.log_timing('finishing write')
+        with self._io_lock:
+            if self._identity is None:
+                self._identify()
+            self.log_timing('starting write')
+            logger.debug('sending: ' + repr(cmd))
+            if self.transport is not None:
+                self.transport.write_raw(cmd, timeout=self.timeout)
+            else:
+                super(DS1054Z, self).write_raw(cmd, *args, **kwargs)
+            self.log_timing('finishing write')
+            self._note_write(cmd)
+
+    def _note_write(self, cmd):
+        """
+        Keeps track of settings possibly changed by a message sent to the scope.
+        """
+        command = cmd.lstrip().upper()
+        # only the header tells a query: the argument may be binary data (like a setup blob)
+        header = command.split(None, 1)[0] if command else b''
+        if b'?' in header:
+            return
+        if not command.lstrip(b':').startswith((b'WAV', b'STOP')):
+            # anything but selecting the waveform to read or stopping may change the acquired data
+            self.acquisition_generation += 1
+        # a reset or a recalled setup changes everything, the probes as well
+        reset = header in (b'*RST', b'*RCL')
+        if b'PROB' in header or b':SYST' in header or reset:
+            self._probe_ratios.clear()
+        if b':SYST' in header or reset or (header.lstrip(b':').startswith(b'WAV')
+                                           and b':STAR' not in header and b':STOP' not in header):
+            # the waveform source has to be selected again before reading more chunks
+            self._waveform_source = None
+        if command.startswith(b':SYST:SET ') or command.startswith(b':SYSTEM:SETUP '):
+            return
+        if command.startswith(tuple(c.encode('ascii') for c in self.NON_SETTING_COMMANDS)):
+            return
+        self._setup_hash = None
 
     def read_raw(self, *args, **kwargs):
         self.log_timing('starting read')
-        data = super(DS1054Z, self).read_raw(*args, **kwargs)
+        with self._io_lock:
+            if self.transport is not None:
+                data = self.transport.read_raw(*args, timeout=self.timeout, **kwargs)
+            else:
+                data = super(DS1054Z, self).read_raw(*args, **kwargs)
         self.log_timing('finished reading {0} bytes'.format(len(data)))
         if len(data) > 200:
             logger.debug('received a long answer: {0} ... {1}'.format(format_hex(data[0:10]), format_hex(data[-10:])))
@@ -91,6 +321,14 @@ class DS1054Z(vxi11.Instrument):
             logger.debug('received: ' + repr(data))
         return data
 
+    def ask(self, message, *args, **kwargs):
+        with self._io_lock:
+            return super(DS1054Z, self).ask(message, *args, **kwargs)
+
+    def ask_raw(self, data, *args, **kwargs):
+        with self._io_lock:
+            return super(DS1054Z, self).ask_raw(data, *args, **kwargs)
+
     def query(self, message, *args, **kwargs):
         """
         Write a message to the scope and read back the answer.
@@ -112,6 +350,78 @@ class DS1054Z(vxi11.Instrument):
         data = message.encode(self.ENCODING)
         return self.ask_raw(data, *args, **kwargs)
 
+    def _query_ieee_block(self, message, into=None):
+        """
+        Writes a query and reads the data of the IEEE block answering it.
+
+        With the raw socket transport, the data is received right into the
+        buffer into (like :py:meth:`ds1054z.transport.ScpiSocket.read_ieee_block`),
+        via VXI-11 it is copied there.
+
+        :param into: Optional writable buffer at least as large as the data
+        :return: The data (into or the part of it filled, if given)
+        :rtype: bytes-like
+        """
+        with self._io_lock:
+            if hasattr(self.transport, 'read_ieee_block'):
+                self.write(message)
+                self.log_timing('starting read')
+                data = self.transport.read_ieee_block(into=into, timeout=self.timeout)
+                self.log_timing('finished reading {0} bytes'.format(len(data)))
+                return data
+            data = DS1054Z.decode_ieee_block(self.query_raw(message))
+        if into is None:
+            return data
+        if len(data) > len(into):
+            raise IOError('Received a block of {0} bytes, expected at most {1}'.format(len(data), len(into)))
+        into[:len(data)] = data
+        return into if len(into) == len(data) else memoryview(into)[:len(data)]
+
+    def query_many(self, messages):
+        """
+        Sends multiple queries and returns the list of answers.
+
+        The queries are concatenated with ``;`` and sent as a single message
+        (or as few messages as possible, see :py:attr:`MAX_CONCATENATED_LENGTH`)
+        saving a round trip to the scope for every additional query.
+        If the number of answers doesn't match the number of queries, the scope
+        apparently didn't accept the concatenated message. In this case
+        (and for all later calls), the queries will be sent one by one,
+        over a new connection not delivering any leftover answers.
+
+        Only use this for queries with short text answers.
+        Binary blocks like ``:WAVeform:DATA?`` have to be read with :py:meth:`query_raw`.
+
+        >>> scope.query_many([':TIMebase:MAIN:SCALe?', ':ACQuire:SRATe?'])
+        ['1.000000e-03', '1.000000e+09']
+
+        :param messages: The SCPI queries (each one starting with a colon).
+        :type messages: list of str
+        :return: The answers in the order of the queries
+        :rtype: list of str
+        """
+        with self._io_lock:
+            return self._query_many(list(messages))
+
+    def _query_many(self, messages):
+        answers = []
+        while messages and self.concatenated_queries:
+            batch = [messages.pop(0)]
+            while messages and len(';'.join(batch + messages[:1])) <= self.MAX_CONCATENATED_LENGTH:
+                batch.append(messages.pop(0))
+            batch_answers = self.query(';'.join(batch)).split(';')
+            if len(batch_answers) != len(batch):
+                logger.info('The scope did not accept concatenated queries. '
+                            'Falling back to single queries.')
+                self.concatenated_queries = False
+                # the scope may still hold answers to the concatenated message
+                self._reset_connection()
+                messages = batch + messages
+                break
+            answers += [answer.strip() for answer in batch_answers]
+        answers += [self.query(message) for message in messages]
+        return answers
+
     def _interpret_channel(self, channel):
         """ wrapper to allow specifying channels by their name (str) or by their number (int) """
         if type(channel) == int:
@@ -178,7 +488,8 @@ class DS1054Z(vxi11.Instrument):
         keys = 'fmt, typ, pnts, cnt, xinc, xorig, xref, yinc, yorig, yref'.split(', ')
         return dict(zip(keys, self.waveform_preamble))
 
-    def get_waveform_samples(self, channel, mode='NORMal'):
+    def get_waveform_samples(self, channel, mode='NORMal', fmt='BYTE', start=None, stop=None, time_range=None,
+                             progress=None, cancel=None):
         """
         Returns the waveform voltage samples of the specified channel.
 
@@ -197,27 +508,102 @@ class DS1054Z(vxi11.Instrument):
         horizontally so that it starts or ends inside the screen area,
         the missing data points are being set to float('nan') in the list.
 
+        The fmt argument selects the transfer format (see :py:meth:`get_waveform_bytes`).
+        BYTE is the most compact one and thus the fastest to transfer.
+
+        When reading the internal memory, you can restrict the
+        transfer to a window of samples with start/stop or time_range
+        (see :py:meth:`get_waveform_bytes`). The timestamp of the
+        n-th returned sample (starting at 0) is then ``xorig + (start - 1 + n) * xinc``.
+
+        Long transfers can be watched and aborted with progress and cancel
+        (see :py:meth:`get_waveform_bytes`).
+
         :param channel: The channel name (like 'CHAN1' or 1).
         :type channel: int or str
         :param str mode: can be 'NORMal', 'MAX', or 'RAW'
+        :param str fmt: can be 'BYTE', 'WORD', or 'ASCii'
+        :param int start: The first sample to read (starting at 1)
+        :param int stop: The last sample to read (inclusive)
+        :param tuple time_range: (begin, end) of the window in seconds relative to the trigger
+        :param progress: Optional callable called as ``progress(bytes_done, bytes_total, bytes_per_second)``
+        :param cancel: Optional cancellation token like a :py:class:`threading.Event`
         :return: voltage samples
         :rtype: list of float values
         """
 
-        buff = self.get_waveform_bytes(channel, mode=mode)
-        fmt, typ, pnts, cnt, xinc, xorig, xref, yinc, yorig, yref = self.waveform_preamble
-        samples = list(struct.unpack(str(len(buff))+'B', buff))
-        samples = [(val - yorig - yref)*yinc for val in samples]
-        if self.mask_begin_num:
-            at_begin = self.mask_begin_num[0]
-            num = self.mask_begin_num[1]
-            if at_begin:
-                samples = [float('nan')] * num + samples[num:]
-            else:
-                samples = samples[:-num] + [float('nan')] * num
-        return samples
+        waveform = self.get_waveform(channel, mode=mode, fmt=fmt, start=start, stop=stop, time_range=time_range,
+                                     progress=progress, cancel=cancel)
+        return waveform.samples()
+
+    def get_waveform(self, channel, mode='NORMal', fmt='BYTE', start=None, stop=None, time_range=None,
+                     progress=None, cancel=None):
+        """
+        Reads the waveform of a channel into a :py:class:`Waveform`.
+
+        In contrast to :py:meth:`get_waveform_samples`, the data is kept
+        as received (one byte per sample in BYTE format) along with the
+        preamble needed to convert it. The voltages and timestamps are only
+        calculated when accessed.
+
+        Arguments as for :py:meth:`get_waveform_samples`.
 
-    def get_waveform_bytes(self, channel, mode='NORMal'):
+        :rtype: Waveform
+        """
+        channel = self._interpret_channel(channel)
+        buff, preamble, mask = self._capture_waveform(channel, mode, fmt, start, stop, time_range, progress, cancel)
+        waveform = Waveform(buff, preamble, channel=channel, mode=mode, fmt=fmt, mask=mask)
+        if (start, stop, time_range) != (None, None, None):
+            waveform.first = DS1054Z.waveform_window(waveform.preamble_dict, start, stop, time_range)[0]
+        return waveform
+
+    @staticmethod
+    def decode_waveform_data(buff, fmt='BYTE', preamble=None):
+        """
+        Converts the waveform data as returned by :py:meth:`get_waveform_bytes` to volts.
+
+        * BYTE: one unsigned byte per sample
+        * WORD: one little-endian unsigned 16 bit integer per sample
+        * ASCii: comma separated voltage values in scientific notation
+
+        :param bytes buff: the waveform data
+        :param str fmt: the format of the data: 'BYTE', 'WORD', or 'ASCii'
+        :param tuple preamble: the :py:attr:`waveform_preamble` belonging to the data
+                               (not needed for ASCii data).
+        :return: voltage samples
+        :rtype: list of float values
+        """
+        fmt = fmt.upper()[:3]
+        if fmt == 'ASC':
+            text = buff.decode('ascii').strip().rstrip(',')
+            if not text:
+                return []
+            try:
+                # parsing all values at once is much faster than calling float() on each
+                return [float(val) for val in json.loads('[' + text + ']')]
+            except ValueError:
+                return [float(val) for val in text.split(',')]
+        yinc, yorig, yref = preamble[7:10]
+        offset = yorig + yref
+        if fmt == 'BYT':
+            values = buff
+        elif fmt == 'WOR':
+            values = array.array('H')
+            values.frombytes(bytes(buff))
+            if sys.byteorder == 'big':
+                values.byteswap()
+        else:
+            raise NameError('Unknown waveform format: {0}'.format(fmt))
+        if not values:
+            return []
+        if max(values) < 256:
+            # look up the voltage for each possible value instead of calculating it every time
+            table = [(val - offset) * yinc for val in range(256)]
+            return list(map(table.__getitem__, values))
+        return [(val - offset) * yinc for val in values]
+
+    def get_waveform_bytes(self, channel, mode='NORMal', fmt='BYTE', start=None, stop=None, time_range=None,
+                           progress=None, cancel=None):
         """
         Get the waveform data for a specific channel as :py:obj:`bytes`.
         (In most cases you would want to use the higher level
@@ -235,31 +621,112 @@ class DS1054Z(vxi11.Instrument):
 
         In case the internal memory will be read, the data request will
         automatically be split into chunks if it's impossible to read
-        all bytes at once.
+        all bytes at once. For BYTE and WORD, the chunks are received
+        into a single preallocated :py:obj:`bytearray`, which is returned
+        (don't modify it if a waveform cache is used, the cache holds the same object).
+
+        The data is returned in the transfer format requested with fmt
+        (see :py:meth:`decode_waveform_data`). BYTE needs one byte
+        per sample, WORD two, and ASCii about 13.
+
+        Reading the internal memory can be restricted to a window,
+        either by sample numbers (start/stop, like ``:WAVeform:STARt``
+        and ``:WAVeform:STOP``) or by a time range relative to the trigger
+        which is translated to sample numbers via the preamble's xinc and xorig.
+        Only the samples within the window will be transferred.
+
+        The progress callback is called after every chunk with the number
+        of bytes received so far, the total number of bytes to expect (None for ASCii,
+        whose size isn't known in advance) and the transfer rate in bytes per second.
+        The cancel token is checked before every chunk is requested. Once
+        its ``is_set()`` returns True, :py:exc:`TransferCancelled` is raised.
+        As a chunk is always read completely, no answer is left pending on the
+        scope and it can be used right away for the next request.
 
         :param channel: The channel name (like CHAN1, ...). Alternatively specify the channel by its number (as integer).
         :type channel: int or str
         :param str mode: can be NORMal, MAXimum, or RAW
+        :param str fmt: can be BYTE, WORD, or ASCii
+        :param int start: The first sample to read (starting at 1)
+        :param int stop: The last sample to read (inclusive)
+        :param tuple time_range: (begin, end) of the window in seconds relative to the trigger
+        :param progress: Optional callable called as ``progress(bytes_done, bytes_total, bytes_per_second)``
+        :param cancel: Optional cancellation token like a :py:class:`threading.Event`
         :return: The waveform data
-        :rtype: bytes
+        :rtype: bytes or bytearray
         """
-        channel = self._interpret_channel(channel)
-        if mode.upper().startswith('NORM') or (self.running and mode.upper().startswith('MAX')):
-            return self._get_waveform_bytes_screen(channel, mode=mode)
-        else:
-            return self._get_waveform_bytes_internal(channel, mode=mode)
+        return self._capture_waveform(channel, mode, fmt, start, stop, time_range, progress, cancel)[0]
+
+    def _capture_waveform(self, channel, mode, fmt, start, stop, time_range, progress, cancel):
+        """
+        Reads a waveform in a single transaction (or takes it from the :py:attr:`waveform_cache`).
 
-    def _get_waveform_bytes_screen(self, channel, mode='NORMal'):
+        :return: (data, preamble, mask) with mask as for :py:attr:`Waveform.mask`
+        """
+        channel = self._interpret_channel(channel)
+        cache = self.waveform_cache
+        if cache is None:
+            return self._transfer_waveform(channel, mode, fmt, start, stop, time_range, progress, cancel)
+        # (a time range may come as a list, e.g. decoded from JSON)
+        key = (channel, mode.upper()[:3], fmt.upper()[:3], start, stop,
+               None if time_range is None else tuple(time_range))
+        with self._io_lock:
+            _check_cancel(cancel, 0)
+            started = time.time()
+            stopped = not self.running
+            if not stopped:
+                # the scope is acquiring: everything cached so far is outdated
+                self.acquisition_generation += 1
+            else:
+                capture = cache.get(self.acquisition_generation, key)
+                if capture is not None:
+                    if progress:
+                        progress(len(capture[0]), len(capture[0]), _rate(len(capture[0]), started))
+                    return capture
+            capture = self._transfer_waveform(channel, mode, fmt, start, stop, time_range, progress, cancel)
+            # reading the raw memory stops the scope, so the data stays valid
+            if stopped or mode.upper().startswith('RAW'):
+                cache.put(self.acquisition_generation, key, capture, len(capture[0]))
+            return capture
+
+    def _transfer_waveform(self, channel, mode, fmt, start, stop, time_range, progress, cancel):
+        window = (start, stop, time_range) != (None, None, None)
+        with self._io_lock:
+            if mode.upper().startswith('NORM') or (self.running and mode.upper().startswith('MAX')):
+                if window:
+                    raise NameError("A window can only be read from the internal memory (use mode='RAW').")
+                _check_cancel(cancel, 0)
+                started = time.time()
+                buff, preamble, mask = self._get_waveform_bytes_screen(channel, mode=mode, fmt=fmt)
+                if progress:
+                    progress(len(buff), len(buff), _rate(len(buff), started))
+                return buff, preamble, mask
+            source, preamble = self._setup_waveform_internal(channel, mode, fmt)
+            if fmt.upper().startswith('ASC'):
+                chunks = self._waveform_chunks(source, preamble, start, stop, time_range, progress, cancel)
+                return b"".join(chunk for offset, chunk in chunks), preamble, None
+            # the chunks are received right into their place of a single buffer
+            keys = 'fmt, typ, pnts, cnt, xinc, xorig, xref, yinc, yorig, yref'.split(', ')
+            pos, pnts = DS1054Z.waveform_window(dict(zip(keys, preamble)), start, stop, time_range)
+            buff = bytearray(max(0, pnts - pos + 1) * self.WAVEFORM_FORMATS[fmt.upper()[:3]][0])
+            for offset, chunk in self._waveform_chunks(source, preamble, start, stop, time_range, progress, cancel,
+                                                       buff=buff):
+                pass
+            return buff, preamble, None
+
+    def _get_waveform_bytes_screen(self, channel, mode='NORMal', fmt='BYTE'):
         """
         This function returns the waveform bytes from the scope if you desire
         to read the bytes corresponding to the screen content.
+
+        :return: (data, preamble, mask)
         """
         channel = self._interpret_channel(channel)
         assert mode.upper().startswith('NOR') or mode.upper().startswith('MAX')
-        self.write(":WAVeform:SOURce " + channel)
-        self.write(":WAVeform:FORMat BYTE")
-        self.write(":WAVeform:MODE " + mode)
-        wp = self.waveform_preamble_dict
+        self._select_waveform_source(channel, mode, fmt)
+        preamble = self.waveform_preamble
+        keys = 'fmt, typ, pnts, cnt, xinc, xorig, xref, yinc, yorig, yref'.split(', ')
+        wp = dict(zip(keys, preamble))
         pnts = wp['pnts']
         starting_at = 1
         stopping_at = self.SAMPLES_ON_DISPLAY
@@ -281,73 +748,275 @@ class DS1054Z(vxi11.Instrument):
         self.write(":WAVeform:STOP {0}".format(stopping_at))
         tmp_buff = self.query_raw(":WAVeform:DATA?")
         buff = DS1054Z.decode_ieee_block(tmp_buff)
-        assert len(buff) == pnts
+        if fmt.upper().startswith('ASC'):
+            buff = buff.strip().rstrip(b',') + b','
+        else:
+            assert len(buff) == pnts * self.WAVEFORM_FORMATS[fmt.upper()[:3]][0]
         if pnts < self.SAMPLES_ON_DISPLAY:
             logger.info('Accessing screen values when the waveform is not entirely ')
             logger.info('filling the screen - padding missing bytes with 0x00!')
             num = self.SAMPLES_ON_DISPLAY - pnts
-            zero_bytes = b"\x00" * num
+            if fmt.upper().startswith('ASC'):
+                zero_bytes = b"0," * num
+            else:
+                zero_bytes = b"\x00" * num * self.WAVEFORM_FORMATS[fmt.upper()[:3]][0]
             if starting_at == 1:
                 buff += zero_bytes
-                self.mask_begin_num = (0, num)
-            else:
-                buff = zero_bytes + buff
-                self.mask_begin_num = (1, num)
-        else:
-            self.mask_begin_num = None
-        return buff
+                return buff, preamble, (pnts, self.SAMPLES_ON_DISPLAY)
+            buff = zero_bytes + buff
+            return buff, preamble, (0, num)
+        return buff, preamble, None
 
-    def _get_waveform_bytes_internal(self, channel, mode='RAW'):
+    def iter_waveform_chunks(self, channel, mode='RAW', fmt='BYTE', start=None, stop=None, time_range=None, prefetch=0,
+                             progress=None, cancel=None):
         """
-        This function returns the waveform bytes from the scope if you desire
-        to read the bytes corresponding to the internal (deep) memory.
+        Reads the internal (deep) memory of a channel chunk by chunk.
+
+        This returns a generator yielding the data of each ``:WAVeform:DATA?``
+        request as soon as it arrived, so it can be processed while
+        the rest of the memory is still to be read.
+        The scope will be stopped first (if it's running).
+
+        With prefetch > 0, the chunks are read by a background thread
+        up to prefetch chunks ahead of the consumer, so the transfer of the next
+        chunk overlaps with processing the current one.
+
+        Other threads may talk to the scope between two chunks. If they read
+        another waveform in the meantime, the source is selected again before
+        the next chunk. They must not restart the acquisition, though.
+
+        :param channel: The channel name (like CHAN1, ...). Alternatively specify the channel by its number (as integer).
+        :type channel: int or str
+        :param str mode: can be MAXimum or RAW
+        :param str fmt: can be BYTE, WORD, or ASCii
+        :param int start: The first sample to read (starting at 1)
+        :param int stop: The last sample to read (inclusive)
+        :param tuple time_range: (begin, end) of the window in seconds relative to the trigger
+        :param int prefetch: The number of chunks to read ahead in a background thread (0: no thread)
+        :param progress: Optional progress callback (see :py:meth:`get_waveform_bytes`)
+        :param cancel: Optional cancellation token (see :py:meth:`get_waveform_bytes`)
+        :return: generator of (offset, chunk) tuples with the offset being
+                 the index of the first sample of the chunk (starting at 0)
+        """
+        return self._iter_waveform_chunks(channel, mode, fmt, start, stop, time_range, prefetch, progress, cancel)[1]
+
+    def _iter_waveform_chunks(self, channel, mode, fmt, start, stop, time_range, prefetch, progress, cancel):
+        """
+        Like :py:meth:`iter_waveform_chunks`.
+
+        :return: (preamble, chunks) with the preamble read when selecting the source
+        """
+        source, preamble = self._setup_waveform_internal(channel, mode, fmt)
+        chunks = self._waveform_chunks(source, preamble, start, stop, time_range, progress, cancel)
+        if prefetch:
+            chunks = _prefetched(chunks, prefetch, self._io_lock)
+        return preamble, chunks
+
+    def iter_waveform_samples(self, channel, mode='RAW', fmt='BYTE', start=None, stop=None, time_range=None, prefetch=2):
+        """
+        Like :py:meth:`iter_waveform_chunks` but yielding voltages.
+
+        By default, the next chunks are transferred in a background thread
+        while the current one is converted to volts and processed by the consumer.
+
+        :return: generator of (offset, samples) tuples with the offset being
+                 the index of the first sample of the chunk (starting at 0)
+        """
+        source, preamble = self._setup_waveform_internal(channel, mode, fmt)
+        chunks = self._waveform_chunks(source, preamble, start, stop, time_range)
+        if prefetch:
+            chunks = _prefetched(chunks, prefetch, self._io_lock)
+        if fmt.upper().startswith('ASC'):
+            preamble = None
+        return ((offset, DS1054Z.decode_waveform_data(chunk, fmt, preamble)) for offset, chunk in chunks)
+
+    def _setup_waveform_internal(self, channel, mode, fmt):
+        """
+        Prepares reading the internal memory.
+
+        :return: (source, preamble) with source being the (channel, mode, fmt) tuple
+                 to pass to :py:meth:`_read_waveform_chunk`
         """
         channel = self._interpret_channel(channel)
         assert mode.upper().startswith('MAX') or mode.upper().startswith('RAW')
-        if self.running:
-            self.stop()
+        with self._io_lock:
+            if self.running:
+                self.stop()
+            self._select_waveform_source(channel, mode, fmt)
+            return (channel, mode, fmt), self.waveform_preamble
+
+    def _select_waveform_source(self, channel, mode, fmt):
         self.write(":WAVeform:SOURce " + channel)
-        self.write(":WAVeform:FORMat BYTE")
+        self.write(":WAVeform:FORMat " + fmt)
         self.write(":WAVeform:MODE " + mode)
-        wp = self.waveform_preamble_dict
-        pnts = wp['pnts']
-        buff = b""
-        max_byte_len = 250000
-        pos = 1
-        while len(buff) < pnts:
-            self.write(":WAVeform:STARt {0}".format(pos))
-            end_pos = min(pnts, pos+max_byte_len-1)
-            self.write(":WAVeform:STOP {0}".format(end_pos))
-            tmp_buff = self.query_raw(":WAVeform:DATA?")
-            buff += DS1054Z.decode_ieee_block(tmp_buff)
-            pos += max_byte_len
-        return buff
-
-    def _populate_possible_values(self, which):
-        """
-        Populates list of possible values.
-
-        Uses MIN_which, MAX_which, and SCALE_MANTISSAE attributes.
-        """
-        min_val = getattr(self, 'MIN_' + which.upper())
-        max_val = getattr(self, 'MAX_' + which.upper())
-        mantissae = self.SCALE_MANTISSAE
-        possible_values = []
-        # initialize with the decimal mantissa and exponent for min_val
-        mantissa_idx = mantissae.index(int('{0:e}'.format(min_val)[0]))
-        exponent = int('{0:e}'.format(min_val).split('e')[1])
-        value = min_val
-        while value <= max_val:
-            # add the value to the list of possible values
-            possible_values.append(value)
-            # construct the next value:
-            mantissa_idx += 1
-            mantissa_idx %= len(mantissae)
-            if mantissa_idx == 0: exponent += 1
-            value = '{0}e{1}'.format(mantissae[mantissa_idx], exponent)
-            value = decimal.Decimal(value)
-            value = float(value)
-        return possible_values
+        self._waveform_source = (channel, mode, fmt)
+
+    def _waveform_chunks(self, source, preamble, start, stop, time_range, progress=None, cancel=None, buff=None):
+        """
+        Reads the window of the internal memory chunk by chunk.
+        If a bytearray buff of the size of the whole window is given (not for
+        ASCii data), the chunks are received into it.
+
+        :return: generator of (offset, chunk) tuples
+        """
+        keys = 'fmt, typ, pnts, cnt, xinc, xorig, xref, yinc, yorig, yref'.split(', ')
+        pos, pnts = DS1054Z.waveform_window(dict(zip(keys, preamble)), start, stop, time_range)
+        bytes_per_sample, max_points = self.WAVEFORM_FORMATS[source[2].upper()[:3]]
+        total = max(0, pnts - pos + 1) * bytes_per_sample if bytes_per_sample else None
+        done = 0
+        started = time.time()
+        while pos <= pnts:
+            _check_cancel(cancel, done)
+            end_pos = min(pnts, pos+max_points-1)
+            into = None
+            if buff is not None:
+                into = memoryview(buff)[done:done+(end_pos-pos+1)*bytes_per_sample]
+            chunk = self._read_waveform_chunk(source, pos, end_pos, into=into)
+            done += len(chunk)
+            if progress:
+                progress(done, total, _rate(done, started))
+            yield pos - 1, chunk
+            pos += max_points
+
+    def _read_waveform_chunk(self, source, pos, end_pos, into=None):
+        """
+        Reads the samples pos to end_pos of the internal memory of the
+        source (channel, mode, fmt) selected by :py:meth:`_setup_waveform_internal`.
+        Failed or incomplete reads are retried (see :py:attr:`CHUNK_RETRIES`).
+        The data is received into the buffer into if given (see :py:meth:`_query_ieee_block`).
+        """
+        bytes_per_sample = self.WAVEFORM_FORMATS[source[2].upper()[:3]][0]
+        for attempt in range(self.CHUNK_RETRIES + 1):
+            try:
+                with self._io_lock:
+                    if self._waveform_source != source:
+                        # somebody else read a waveform since the last chunk
+                        self._select_waveform_source(*source)
+                    self.write(":WAVeform:STARt {0}".format(pos))
+                    self.write(":WAVeform:STOP {0}".format(end_pos))
+                    chunk = self._query_ieee_block(":WAVeform:DATA?", into=into)
+                if bytes_per_sample is None:
+                    chunk = chunk.strip().rstrip(b',') + b','
+                    received = chunk.count(b',')
+                else:
+                    received = len(chunk) // bytes_per_sample
+                if received != end_pos - pos + 1:
+                    raise IOError('Received {0} instead of {1} samples'.format(received, end_pos - pos + 1))
+                return chunk
+            except self.CHUNK_ERRORS as e:
+                if attempt == self.CHUNK_RETRIES:
+                    raise
+                delay = self.CHUNK_RETRY_DELAY * 2 ** attempt
+                logger.warning('Reading samples {0} to {1} failed ({2}), retrying in {3:.2f} s'.format(pos, end_pos, e, delay))
+                time.sleep(delay)
+                # start over with a fresh connection, the old one might still deliver the failed answer
+                self._reset_connection()
+
+    def _reset_connection(self):
+        """ Closes the connection (discarding any pending answer), the next message reopens it """
+        try:
+            self.close()
+        except Exception:
+            self.link = None
+            self.client = None
+
+    def start_waveform_transfer(self, channel, mode='RAW', fmt='BYTE', start=None, stop=None, time_range=None):
+        """
+        Prepares a read of the internal memory that can be continued after a failure.
+
+        >>> transfer = scope.start_waveform_transfer(1)
+        >>> try:
+        ...     data = transfer.read()
+        ... except IOError:
+        ...     # reconnect, then continue where the transfer stopped
+        ...     data = transfer.resume(DS1054Z(host))
+
+        Arguments as for :py:meth:`iter_waveform_chunks`.
+
+        :rtype: WaveformTransfer
+        """
+        return WaveformTransfer(self, channel, mode=mode, fmt=fmt, start=start, stop=stop, time_range=time_range)
+
+    @staticmethod
+    def waveform_window(wp, start=None, stop=None, time_range=None):
+        """
+        Translates a window of the internal memory to sample numbers.
+
+        :param dict wp: The :py:attr:`waveform_preamble_dict`
+        :param int start: The first sample (starting at 1), defaults to the first one
+        :param int stop: The last sample (inclusive), defaults to the last one
+        :param tuple time_range: (begin, end) in seconds relative to the trigger.
+                                 Restricts the window to the samples taken within this time range.
+        :return: (start, stop) clipped to the available samples.
+                 start is larger than stop if the window is empty.
+        :rtype: tuple of int
+        """
+        start = 1 if start is None else max(1, int(start))
+        stop = wp['pnts'] if stop is None else min(wp['pnts'], int(stop))
+        if time_range is not None:
+            begin, end = time_range
+            # sample number n (starting at 1) was taken at xorig + (n - 1) * xinc
+            start = max(start, int(math.ceil((begin - wp['xorig']) / wp['xinc'] - 1e-9)) + 1)
+            stop = min(stop, int(math.floor((end - wp['xorig']) / wp['xinc'] + 1e-9)) + 1)
+        return start, stop
+
+    def get_waveform_envelope(self, channel, points=10000, mode='RAW'):
+        """
+        Reads the internal (deep) memory of a channel and reduces it
+        to a min/max envelope of about ``points`` values.
+
+        The memory is split into consecutive buckets of equal size and for
+        each bucket the minimum and maximum sample is kept. In contrast to
+        simply taking every n-th sample, short peaks and glitches remain visible.
+        The envelope is calculated chunk by chunk while the data arrives,
+        so the whole memory is never held at once.
+
+        :param channel: The channel name (like CHAN1, ...). Alternatively specify the channel by its number (as integer).
+        :type channel: int or str
+        :param int points: The maximum number of buckets
+        :param str mode: can be MAXimum or RAW
+        :return: (minima, maxima, samples_per_bucket) with minima and maxima
+                 being lists of voltages. The last bucket may hold fewer samples.
+        :rtype: tuple
+        """
+        mins = bytearray()
+        maxs = bytearray()
+        rest = b""
+        source, preamble = self._setup_waveform_internal(channel, mode, 'BYTE')
+        bucket = max(1, -(-preamble[2] // points))
+        # the next chunks are read while calculating the envelope of the current one
+        chunks = _prefetched(self._waveform_chunks(source, preamble, None, None, None), 2, self._io_lock)
+        for offset, chunk in chunks:
+            if rest:
+                chunk = rest + chunk
+            usable = len(chunk) - len(chunk) % bucket
+            for i in range(0, usable, bucket):
+                part = chunk[i:i+bucket]
+                mins.append(min(part))
+                maxs.append(max(part))
+            rest = chunk[usable:]
+        if rest:
+            mins.append(min(rest))
+            maxs.append(max(rest))
+        return (DS1054Z.decode_waveform_data(bytes(mins), 'BYTE', preamble),
+                DS1054Z.decode_waveform_data(bytes(maxs), 'BYTE', preamble),
+                bucket)
+
+    def closest_timebase_scale(self, value):
+        """ The possible timebase scale (in s/div) closest to ``value`` """
+        return self.TIMEBASE_SCALE_LADDER.closest(value)
+
+    def closest_probe_ratio(self, value):
+        """ The possible probe ratio closest to ``value`` """
+        return self.PROBE_RATIO_LADDER.closest(float(value))
+
+    def closest_channel_scale(self, value, probe_ratio=1.0):
+        """ The default channel scale step (in V/div) closest to ``value`` for the given probe ratio """
+        return self.CHANNEL_SCALE_LADDER.scaled(probe_ratio).closest(value)
+
+    def closest_memory_depth(self, value):
+        """ The possible memory depth closest to ``value`` """
+        return self.MEMORY_DEPTH_LADDER.closest(value)
 
     @property
     def timebase_offset(self):
@@ -388,7 +1057,7 @@ class DS1054Z(vxi11.Instrument):
 
     @timebase_scale.setter
     def timebase_scale(self, new_timebase):
-        new_timebase = min(self.possible_timebase_scale_values, key=lambda x:abs(x-new_timebase))
+        new_timebase = self.closest_timebase_scale(new_timebase)
         self.write(":TIMebase:MAIN:SCALe {0}".format(new_timebase))
 
     @property
@@ -487,6 +1156,54 @@ class DS1054Z(vxi11.Instrument):
         n_data_bytes = int(ieee_bytes[2:n_header_bytes].decode('ascii'))
         return ieee_bytes[n_header_bytes:n_header_bytes + n_data_bytes]
 
+    @staticmethod
+    def encode_ieee_block(data):
+        """
+        Prepends the header of a IEEE (definite length) binary data block to the data.
+
+        This is the inverse of :py:meth:`decode_ieee_block`.
+        """
+        length = str(len(data))
+        return '#{0}{1}'.format(len(length), length).encode('ascii') + data
+
+    def save_setup(self):
+        """
+        Reads the complete setup of the scope with a single ``:SYSTem:SETup?`` query.
+
+        The result can be stored and later be sent back to the scope
+        with :py:meth:`restore_setup`.
+
+        :return: The setup as binary data
+        :rtype: bytes
+        """
+        blob = DS1054Z.decode_ieee_block(self.query_raw(':SYSTem:SETup?'))
+        self._setup_hash = hashlib.sha1(blob).hexdigest()
+        return blob
+
+    def restore_setup(self, blob, force=False):
+        """
+        Applies a setup previously read with :py:meth:`save_setup` in a single transfer.
+
+        The hash of the last setup saved or restored is remembered.
+        As long as no settings were changed via this instance in the meantime,
+        restoring the identical setup again is skipped.
+        Changes made at the front panel of the scope cannot be noticed, though.
+        Use ``force=True`` in this case.
+
+        :param bytes blob: The setup data as returned by :py:meth:`save_setup`
+        :param bool force: Send the setup even if it's believed to be active already.
+        :return: Whether the setup was sent to the scope
+        :rtype: bool
+        """
+        with self._io_lock:
+            digest = hashlib.sha1(blob).hexdigest()
+            if digest == self._setup_hash and not force:
+                logger.info('Setup already active, not sending it again.')
+                return False
+            self.write_raw(b':SYSTem:SETup ' + DS1054Z.encode_ieee_block(blob))
+            self._setup_hash = digest
+            return True
+
     @property
     def idn(self):
         """
@@ -511,6 +1228,125 @@ class DS1054Z(vxi11.Instrument):
         """ Generate a trigger signal forcefully. """
         self.write(":TFORce")
 
+    def wait_for_status(self, states, timeout=10.0, interval=0.005):
+        """
+        Polls ``:TRIGger:STATus?`` until the scope reports one of the given states.
+
+        :param states: The states to wait for, like ``('STOP',)``.
+                       Possible states are TD, WAIT, RUN, AUTO, and STOP.
+        :type states: str or tuple of str
+        :param float timeout: Give up after this amount of time in seconds.
+        :param float interval: Time to sleep between two queries in seconds.
+        :return: The state reached or None if the timeout elapsed.
+        :rtype: str or None
+        """
+        if isinstance(states, str):
+            states = (states,)
+        deadline = clock() + timeout
+        while True:
+            status = self.query(':TRIGger:STATus?')
+            if status in states:
+                return status
+            if clock() >= deadline:
+                return None
+            time.sleep(interval)
+
+    def acquire_single(self, timeout=10.0, interval=0.005):
+        """
+        Performs a single acquisition: Sets the scope to the single trigger mode
+        and waits until it triggered (and stopped) or the timeout elapsed.
+
+        ``*OPC?`` is asked right after ``:SINGle``, so the status polled
+        afterwards isn't the one of the previous acquisition. If the trigger
+        condition is met right away, the scope is found stopped at the first poll.
+
+        :param float timeout: Maximum time to wait for the trigger in seconds.
+        :param float interval: Time to sleep between two status queries in seconds.
+        :return: Whether the scope triggered within the timeout
+        :rtype: bool
+        """
+        with self._io_lock:
+            self.single()
+            self.query('*OPC?')
+        return self.wait_for_status('STOP', timeout=timeout, interval=interval) is not None
+
+    def start_recording(self, frames, interval=None):
+        """
+        Starts a waveform recording: the scope stores the next ``frames``
+        acquisitions in its memory at hardware speed.
+        Read them back with :py:meth:`iter_recorded_frames` once
+        :py:attr:`recording` turned False.
+
+        :param int frames: The number of frames to record
+        :param float interval: The time between two frames in seconds (optional)
+        """
+        with self._io_lock:
+            self.write(":FUNCtion:WRECord:ENABle ON")
+            self.write(":FUNCtion:WRECord:FEND {0}".format(int(frames)))
+            if interval is not None:
+                self.write(":FUNCtion:WRECord:FINTerval {0}".format(interval))
+            self.write(":FUNCtion:WRECord:OPERate RUN")
+
+    @property
+    def recording(self):
+        """ Whether a waveform recording is in progress """
+        return self.query(":FUNCtion:WRECord:OPERate?") == "RUN"
+
+    @property
+    def recorded_frames(self):
+        """
+        The number of frames available for replay
+        (the end frame of the replay, ``:FUNCtion:WREPlay:FEND?``).
+        """
+        return int(self.query(":FUNCtion:WREPlay:FEND?"))
+
+    def iter_recorded_frames(self, channel, first=1, last=None, mode='RAW', fmt='BYTE'):
+        """
+        Reads back the frames of a waveform recording one after the other.
+
+        All frames are read into the same preallocated buffer: the data
+        yielded is a :py:obj:`memoryview` of this buffer which is only valid
+        until the next frame is read. Copy it (``bytes(data)``) or write it
+        to a file right away.
+
+        >>> scope.start_recording(100)
+        >>> while scope.recording: time.sleep(0.1)
+        >>> with open('frames.bin', 'wb') as f:
+        ...     for frame, data in scope.iter_recorded_frames(1):
+        ...         f.write(data)
+
+        :param channel: The channel name (like CHAN1, ...). Alternatively specify the channel by its number (as integer).
+        :type channel: int or str
+        :param int first: The first frame to read
+        :param int last: The last frame to read, defaults to :py:attr:`recorded_frames`
+        :param str mode: The waveform mode to read (see :py:meth:`get_waveform_bytes`)
+        :param str fmt: The waveform format to read (see :py:meth:`get_waveform_bytes`)
+        :return: generator of (frame, data) tuples
+        """
+        if last is None:
+            last = self.recorded_frames
+        buff = bytearray()
+        for frame in range(first, last + 1):
+            size = 0
+            # the frame must not change while it's read, but the lock isn't held while yielding
+            with self._io_lock:
+                self.write(":FUNCtion:WREPlay:FCURrent {0}".format(frame))
+                if mode.upper().startswith('NORM'):
+                    chunks = [(0, self.get_waveform_bytes(channel, mode=mode, fmt=fmt))]
+                else:
+                    chunks = self.iter_waveform_chunks(channel, mode=mode, fmt=fmt)
+                for offset, chunk in chunks:
+                    end = size + len(chunk)
+                    if end > len(buff):
+                        try:
+                            buff.extend(bytes(end - len(buff)))
+                        except BufferError:
+                            # the data of the previous frame is still referenced
+                            buff = buff + bytes(end - len(buff))
+                    buff[size:end] = chunk
+                    size = end
+            yield frame, memoryview(buff)[:size]
+
     def set_waveform_mode(self, mode='NORMal'):
         """ Changing the waveform mode """
         self.write('WAVeform:MODE ' + mode)
@@ -554,21 +1390,22 @@ class DS1054Z(vxi11.Instrument):
 
         This property will be updated every time you access it.
         """
-        mdep = self.query(":ACQuire:MDEPth?")
-        if mdep == "AUTO":
-            curr_running = self.running
-            curr_mode = self.query(':WAVeform:MODE?')
-            if curr_running:
-                self.stop()
-            if curr_mode.startswith('NORM'):
-                # in this case we need to switch to RAW mode to find out the memory depth
-                self.write(':WAVeform:MODE RAW')
-                mdep = self.waveform_preamble_dict['pnts']
-                self.write(':WAVeform:MODE ' + curr_mode)
-            else:
-                mdep = self.waveform_preamble_dict['pnts']
-            if curr_running:
-                self.run()
+        with self._io_lock:
+            mdep = self.query(":ACQuire:MDEPth?")
+            if mdep == "AUTO":
+                curr_running = self.running
+                curr_mode = self.query(':WAVeform:MODE?')
+                if curr_running:
+                    self.stop()
+                if curr_mode.startswith('NORM'):
+                    # in this case we need to switch to RAW mode to find out the memory depth
+                    self.write(':WAVeform:MODE RAW')
+                    mdep = self.waveform_preamble_dict['pnts']
+                    self.write(':WAVeform:MODE ' + curr_mode)
+                else:
+                    mdep = self.waveform_preamble_dict['pnts']
+                if curr_running:
+                    self.run()
         return int(float(mdep))
 
     @property
@@ -611,7 +1448,7 @@ class DS1054Z(vxi11.Instrument):
             raise NameError("Cannot set memory depth when not running.")
         if type(mdepth) in (float, int):
             # determin closest memory depth:
-            new_mdepth = min(self.possible_memory_depth_values, key=lambda x:abs(x-mdepth))
+            new_mdepth = self.closest_memory_depth(mdepth)
         else:
             new_mdepth = mdepth
         assert new_mdepth == 'AUTO' or new_mdepth in self.possible_memory_depth_values
@@ -624,9 +1461,58 @@ class DS1054Z(vxi11.Instrument):
         The bitmap bytes of the current screen content.
         This property will be updated every time you access it.
         """
-        self.write(":DISPlay:DATA? ON,OFF,PNG")
-        logger.info("Receiving screen capture...")
-        buff = self.read_raw(self.DISPLAY_DATA_BYTES)
+        return self.get_display_data()
+
+    def get_display_data(self, progress=None, cancel=None):
+        """
+        Reads the bitmap bytes of the current screen content (see :py:attr:`display_data`).
+
+        Via VXI-11, the image is received in pieces of :py:attr:`DISPLAY_DATA_CHUNK` bytes.
+        progress and cancel work like with :py:meth:`get_waveform_bytes`, they are
+        handled between the pieces. When cancelled, the connection is closed so the
+        rest of the image still held by the scope is discarded.
+        (The raw socket transport receives the image as a whole, right into a bytearray.)
+
+        :param progress: Optional callable called as ``progress(bytes_done, bytes_total, bytes_per_second)``
+        :param cancel: Optional cancellation token like a :py:class:`threading.Event`
+        :return: The PNG image data
+        :rtype: bytes or bytearray
+        """
+        _check_cancel(cancel, 0)
+        started = time.time()
+        if hasattr(self.transport, 'read_ieee_block'):
+            logger.info("Receiving screen capture...")
+            data = self._query_ieee_block(":DISPlay:DATA? ON,OFF,PNG")
+            if progress:
+                progress(len(data), len(data), _rate(len(data), started))
+            logger.info("read {0} bytes in .display_data".format(len(data)))
+            return data
+        with self._io_lock:
+            self.write(":DISPlay:DATA? ON,OFF,PNG")
+            logger.info("Receiving screen capture...")
+            buff = self.read_raw(self.DISPLAY_DATA_CHUNK)
+            n_header_bytes = int(chr(bytearray(buff)[1])) + 2
+            # the block is followed by a newline character
+            total = n_header_bytes + int(buff[2:n_header_bytes]) + 1
+            received = len(buff)
+            if self.transport is None:
+                pieces = [buff]
+                while received < total:
+                    if progress:
+                        progress(received, total, _rate(received, started))
+                    if cancel is not None and cancel.is_set():
+                        self._reset_connection()
+                        _check_cancel(cancel, received)
+                    want = min(self.DISPLAY_DATA_CHUNK, total - received)
+                    piece = self.read_raw(want)
+                    pieces.append(piece)
+                    received += len(piece)
+                    if len(piece) < want:
+                        # end of the message
+                        break
+                buff = b"".join(pieces)
+        if progress:
+            progress(len(buff), len(buff), _rate(len(buff), started))
         logger.info("read {0} bytes in .display_data".format(len(buff)))
         return DS1054Z.decode_ieee_block(buff)
 
@@ -636,11 +1522,8 @@ class DS1054Z(vxi11.Instrument):
         The list of channels currently displayed on the scope.
         This property will be updated every time you access it.
         """
-        channel_list = []
-        for channel in self.CHANNEL_LIST:
-            if self.query(":{0}:DISPlay?".format(channel)) == '1':
-                channel_list.append(channel)
-        return channel_list
+        answers = self.query_many(":{0}:DISPlay?".format(channel) for channel in self.CHANNEL_LIST)
+        return [channel for channel, answer in zip(self.CHANNEL_LIST, answers) if answer == '1']
 
     def display_channel(self, channel, enable=True):
         """
@@ -662,7 +1545,9 @@ class DS1054Z(vxi11.Instrument):
         Returns the probe ratio for a specific channel
         """
         channel = self._interpret_channel(channel)
-        return float(self.query(':{0}:PROBe?'.format(channel)))
+        ratio = float(self.query(':{0}:PROBe?'.format(channel)))
+        self._probe_ratios[channel] = ratio
+        return ratio
 
     def set_probe_ratio(self, channel, ratio):
         """
@@ -675,10 +1560,10 @@ class DS1054Z(vxi11.Instrument):
         :type channel: int or str
         :param float ratio: Ratio of the probe connected to the channel
         """
-        ratio = float(ratio)
-        ratio = min(self.possible_probe_ratio_values, key=lambda x:abs(x-ratio))
+        ratio = self.closest_probe_ratio(ratio)
         channel = self._interpret_channel(channel)
         self.write(":{0}:PROBe {1}".format(channel, ratio))
+        self._probe_ratios[channel] = ratio
 
 
     def get_channel_offset(self, channel):
@@ -721,7 +1606,7 @@ class DS1054Z(vxi11.Instrument):
         channel = self._interpret_channel(channel)
         return float(self.query(':{0}:SCALe?'.format(channel)))
 
-    def set_channel_scale(self, channel, volts, use_closest_match=False):
+    def set_channel_scale(self, channel, volts, use_closest_match=False, probe_ratio=None):
         """
         The default steps according to the programming guide:
 
@@ -735,14 +1620,143 @@ class DS1054Z(vxi11.Instrument):
         :type channel: int or str
         :param float volts: the new value for the vertical channel scaling
         :param bool use_closest_match: round new scale value to closest match from the default steps
+        :param float probe_ratio: the probe ratio of the channel for use_closest_match.
+            If not given, it is queried from the scope (it may have been
+            changed on the front panel). Pass it to save that round trip.
         """
         channel = self._interpret_channel(channel)
         if use_closest_match:
-            probe_ratio = self.get_probe_ratio(channel)
-            possible_channel_scale_values = [val * probe_ratio for val in self.possible_channel_scale_values]
-            volts = min(possible_channel_scale_values, key=lambda x:abs(x-volts))
+            if probe_ratio is None:
+                probe_ratio = self.get_probe_ratio(channel)
+            volts = self.closest_channel_scale(volts, probe_ratio)
         self.write(":{0}:SCALe {1}".format(channel, volts))
 
+    def get_channel_settings(self, channels=None):
+        """
+        Snapshot of the vertical settings of multiple channels,
+        fetched with a single call to :py:meth:`query_many`.
+
+        >>> scope.get_channel_settings([1])
+        {'CHAN1': {'display': True, 'scale': 1.0, 'offset': 0.0, 'probe_ratio': 10.0,
+                   'coupling': 'DC', 'bwlimit': 'OFF', 'invert': False, 'units': 'VOLT'}}
+
+        :param channels: The channels to query (names like 'CHAN1' or numbers).
+                         Defaults to all analog channels.
+        :type channels: list of int or str
+        :return: A dictionary of settings for each channel
+        :rtype: dict of dict
+        """
+        if channels is None:
+            channels = self.ANALOG_CHANNEL_LIST
+        channels = [self._interpret_channel(channel) for channel in channels]
+        settings = (
+            ('display',     'DISPlay',  lambda val: val == '1'),
+            ('scale',       'SCALe',    float),
+            ('offset',      'OFFSet',   float),
+            ('probe_ratio', 'PROBe',    float),
+            ('coupling',    'COUPling', str),
+            ('bwlimit',     'BWLimit',  str),
+            ('invert',      'INVert',   lambda val: val == '1'),
+            ('units',       'UNITs',    str),
+        )
+        queries = [':{0}:{1}?'.format(channel, cmd) for channel in channels for _, cmd, _ in settings]
+        answers = iter(self.query_many(queries))
+        snapshot = {}
+        for channel in channels:
+            snapshot[channel] = {name: conv(next(answers)) for name, _, conv in settings}
+        return snapshot
+
+    def get_profile(self, channels=None):
+        """
+        Reads the current settings of the scope as a profile (see :py:mod:`ds1054z.profiles`)
+        with a single call to :py:meth:`query_many`.
+
+        :param channels: The channels to include. Defaults to all analog channels.
+        :type channels: list of int or str
+        :return: The profile
+        :rtype: dict
+        """
+        from ds1054z.profiles import SCOPE_SETTINGS, CHANNEL_SETTINGS, TRIGGER_SETTINGS
+        if channels is None:
+            channels = self.ANALOG_CHANNEL_LIST
+        channels = [self._interpret_channel(channel) for channel in channels]
+        entries = [(sec, None, name, cmd, kind) for sec, name, cmd, kind in SCOPE_SETTINGS]
+        for channel in channels:
+            entries += [('channels', channel, name, ':{0}:{1}'.format(channel, cmd), kind)
+                        for name, cmd, kind in CHANNEL_SETTINGS]
+        entries += [(sec, None, name, cmd, kind) for sec, name, cmd, kind in TRIGGER_SETTINGS]
+        answers = self.query_many(cmd + '?' for _, _, _, cmd, kind in entries)
+        profile = {}
+        for (sec, channel, name, cmd, kind), answer in zip(entries, answers):
+            if kind == 'bool':
+                value = answer in ('1', 'ON')
+            elif kind == 'enum' or answer == 'AUTO':
+                value = answer
+            elif kind == 'memory_depth':
+                value = int(float(answer))
+            else:
+                value = float(answer)
+            section = profile.setdefault(sec, {})
+            if channel:
+                section = section.setdefault(channel, {})
+            section[name] = value
+        return profile
+
+    def apply_profile(self, profile, dry_run=False, force=False):
+        """
+        Applies a configuration profile (see :py:mod:`ds1054z.profiles`) to the scope.
+
+        The current values of all settings mentioned in the profile are read
+        in bulk via :py:meth:`query_many`. Only those settings differing from
+        the profile are sent to the scope, so switching between similar profiles
+        costs little more than the settings that actually change.
+
+        :param dict profile: The profile to apply
+        :param bool dry_run: Only determine the commands, don't send them.
+        :param bool force: Don't read back the current settings, send all of them.
+                           Useful if you know that all settings in the profile differ.
+        :return: The commands sent to the scope (or that would have been sent)
+        :rtype: list of str
+        """
+        from ds1054z.profiles import profile_settings, differs, format_value
+        with self._io_lock:
+            settings = profile_settings(profile)
+            # The channel scale snapping depends on the probe ratio:
+            probe_ratios = {ch: self.closest_probe_ratio(val) for cmd, kind, val, ch in settings if kind == 'probe_ratio'}
+            if force:
+                probe_ratios.update((ch, val) for ch, val in self._probe_ratios.items() if ch not in probe_ratios)
+            probes_to_query = sorted(set(ch for cmd, kind, val, ch in settings
+                                         if kind == 'channel_scale' and ch not in probe_ratios))
+            queries = [] if force else [cmd + '?' for cmd, kind, val, ch in settings]
+            queries += [':{0}:PROBe?'.format(ch) for ch in probes_to_query]
+            answers = self.query_many(queries)
+            for ch, answer in zip(probes_to_query, answers[len(queries)-len(probes_to_query):]):
+                probe_ratios[ch] = float(answer)
+            if force:
+                answers = [None] * len(settings)
+            commands = []
+            changed_probes = set()
+            for (cmd, kind, value, ch), current in zip(settings, answers):
+                if kind == 'timebase_scale':
+                    value = self.closest_timebase_scale(float(value))
+                elif kind == 'probe_ratio':
+                    value = self.closest_probe_ratio(value)
+                elif kind == 'channel_scale':
+                    value = self.closest_channel_scale(float(value), self.closest_probe_ratio(probe_ratios[ch]))
+                elif kind == 'memory_depth' and str(value).upper() != 'AUTO':
+                    value = self.closest_memory_depth(float(value))
+                # changing the probe ratio rescales the channel, so scale and offset need to be sent again
+                rescaled = ch in changed_probes and kind in ('channel_scale', 'float')
+                if force or rescaled or differs(kind, current, value):
+                    commands.append('{0} {1}'.format(cmd, format_value(kind, value)))
+                    if kind == 'probe_ratio':
+                        changed_probes.add(ch)
+            if not dry_run:
+                for command in commands:
+                    self.write(command)
+                self._probe_ratios.update(probe_ratios)
+            return commands
+
     def get_channel_measurement(self, channel, item, type="CURRent"):
         """
         Measures value on a channel
@@ -753,11 +1767,264 @@ class DS1054Z(vxi11.Instrument):
         :param str type: Type of measurement, can be CURRent, MAXimum, MINimum, AVERages, DEViation
         """
         channel = self._interpret_channel(channel)
-        ret = float(self.query(":MEASure:STATistic:item? {0},{1},{2}".format(type, item, channel)))
-        if ret == 9.9e37: # This is a value which means that the measurement cannot be taken for some reason (channel disconnected/no edge in the trace etc.)
+        return self._measurement_value(self.query(":MEASure:STATistic:item? {0},{1},{2}".format(type, item, channel)))
+
+    def get_channel_measurements(self, channels, items, type="CURRent"):
+        """
+        Measures multiple values on multiple channels.
+
+        All queries are sent concatenated with :py:meth:`query_many`,
+        so the whole table costs only a single round trip (or a few for very many items).
+
+        >>> scope.get_channel_measurements([1, 2], ['vpp', 'frequency'])
+        {'CHAN1': {'vpp': 3.28, 'frequency': 1000.0}, 'CHAN2': {'vpp': 0.4, 'frequency': None}}
+
+        :param channels: The channels to measure on (names like CHAN1 or numbers)
+        :type channels: list of int or str
+        :param items: The items to measure (see :py:meth:`get_channel_measurement`)
+        :type items: list of str
+        :param str type: Type of measurement, can be CURRent, MAXimum, MINimum, AVERages, DEViation
+        :return: The measured values by channel and item.
+                 Values that cannot be measured are None.
+        :rtype: dict
+        """
+        channels = [self._interpret_channel(channel) for channel in channels]
+        items = list(items)
+        queries = [":MEASure:STATistic:item? {0},{1},{2}".format(type, item, channel)
+                   for channel in channels for item in items]
+        answers = iter(self.query_many(queries))
+        return {channel: {item: self._measurement_value(next(answers)) for item in items} for channel in channels}
+
+    def measurement_logger(self, channels, items, interval=1.0, **kwargs):
+        """
+        Creates a :py:class:`ds1054z.monitor.MeasurementLogger` polling
+        the measurement items in a background thread.
+        Use it as a context manager or call its start() and stop() methods.
+
+        :param channels: The channels to measure on (names like CHAN1 or numbers)
+        :param items: The items to measure (see :py:meth:`get_channel_measurement`)
+        :param float interval: The time between two readings in seconds
+        :rtype: ds1054z.monitor.MeasurementLogger
+        """
+        from ds1054z.monitor import MeasurementLogger
+        return MeasurementLogger(self, channels, items, interval=interval, **kwargs)
+
+    def _measurement_value(self, answer):
+        ret = float(answer)
+        if ret >= self.INVALID_MEASUREMENT: # This is a value which means that the measurement cannot be taken for some reason (channel disconnected/no edge in the trace etc.)
             return None
         return ret
 
+class TransferCancelled(Exception):
+    """ Raised when a transfer was aborted via its cancellation token """
+
+def _check_cancel(cancel, done):
+    if cancel is not None and cancel.is_set():
+        raise TransferCancelled('Transfer cancelled after {0} bytes'.format(done))
+
+def _rate(done, started):
+    """ The transfer rate in bytes per second """
+    return done / max(time.time() - started, 1e-9)
+
+class Waveform(object):
+    """
+    The data of a waveform as read from the scope (see :py:meth:`DS1054Z.get_waveform`).
+
+    Only the received bytes and the preamble are stored, which takes a
+    fraction of the memory a list of floats would need. The voltages and
+    timestamps are calculated on first access and kept from then on
+    (as compact :py:class:`array.array` of doubles).
+
+    :ivar data: The waveform data (bytes, bytearray or memoryview) in the transfer format fmt
+    :ivar preamble: The :py:attr:`DS1054Z.waveform_preamble` of the data
+    :ivar channel: The channel name (like 'CHAN1')
+    :ivar mode: The waveform mode the data was read with
+    :ivar fmt: The transfer format: 'BYTE', 'WORD', or 'ASCii'
+    :ivar first: The number of the first sample in the scope's memory (starting at 1)
+    :ivar mask: (begin, end) range of sample indices without valid data
+                (padding of screen reads, see :py:meth:`DS1054Z.get_waveform_samples`), or None
+    """
+
+    __slots__ = ('data', 'preamble', 'channel', 'mode', 'fmt', 'first', 'mask', '_volts', '_times')
+
+    def __init__(self, data, preamble, channel=None, mode=None, fmt='BYTE', first=1, mask=None):
+        self.data = data
+        self.preamble = tuple(preamble)
+        self.channel = channel
+        self.mode = mode
+        self.fmt = fmt
+        self.first = first
+        self.mask = mask
+        self._volts = None
+        self._times = None
+
+    def __len__(self):
+        bytes_per_sample = DS1054Z.WAVEFORM_FORMATS[self.fmt.upper()[:3]][0]
+        if bytes_per_sample is None:
+            return bytes(self.data).count(b',')
+        return len(self.data) // bytes_per_sample
+
+    def __repr__(self):
+        return '<Waveform {0} {1} samples of {2}>'.format(len(self), self.fmt, self.channel)
+
+    @property
+    def preamble_dict(self):
+        """ The preamble as dictionary (see :py:attr:`DS1054Z.waveform_preamble_dict`) """
+        keys = 'fmt, typ, pnts, cnt, xinc, xorig, xref, yinc, yorig, yref'.split(', ')
+        return dict(zip(keys, self.preamble))
+
+    def samples(self):
+        """
+        Converts the data to volts (without caching the result).
+        The samples within :py:attr:`mask` are float('nan').
+
+        :rtype: list of float values
+        """
+        preamble = None if self.fmt.upper().startswith('ASC') else self.preamble
+        samples = DS1054Z.decode_waveform_data(self.data, self.fmt, preamble)
+        if self.mask:
+            begin, end = self.mask
+            samples[begin:end] = [float('nan')] * (end - begin)
+        return samples
+
+    @property
+    def volts(self):
+        """ The voltage samples (calculated on first access) """
+        if self._volts is None:
+            self._volts = array.array('d', self.samples())
+        return self._volts
+
+    @property
+    def times(self):
+        """ The timestamps of the samples relative to the trigger (calculated on first access) """
+        if self._times is None:
+            xinc, xorig = self.preamble[4:6]
+            first = self.first - 1
+            self._times = array.array('d', (xorig + (first + n) * xinc for n in range(len(self))))
+        return self._times
+
+    def clear_cache(self):
+        """ Drops the calculated voltages and timestamps to free their memory """
+        self._volts = None
+        self._times = None
+
+class WaveformTransfer(object):
+    """
+    A read of the internal memory of the scope which can be resumed
+    after it failed (see :py:meth:`DS1054Z.start_waveform_transfer`).
+
+    The chunks received so far are kept, resuming only requests the missing samples.
+
+    :ivar preamble: The :py:attr:`DS1054Z.waveform_preamble` of the data
+    :ivar position: The next sample to read (starting at 1)
+    """
+
+    def __init__(self, ds, channel, mode='RAW', fmt='BYTE', start=None, stop=None, time_range=None):
+        self.ds = ds
+        self.channel = ds._interpret_channel(channel)
+        self.mode = mode
+        self.fmt = fmt
+        self.source, self.preamble = ds._setup_waveform_internal(self.channel, mode, fmt)
+        keys = 'fmt, typ, pnts, cnt, xinc, xorig, xref, yinc, yorig, yref'.split(', ')
+        self.position, self.stop = DS1054Z.waveform_window(dict(zip(keys, self.preamble)), start, stop, time_range)
+        self.chunks = []
+
+    @property
+    def done(self):
+        return self.position > self.stop
+
+    def read(self):
+        """
+        Reads the remaining samples.
+
+        :return: The data of all samples of the transfer
+        :rtype: bytes
+        """
+        max_points = self.ds.WAVEFORM_FORMATS[self.fmt.upper()[:3]][1]
+        while not self.done:
+            end_pos = min(self.stop, self.position + max_points - 1)
+            self.chunks.append(self.ds._read_waveform_chunk(self.source, self.position, end_pos))
+            self.position = end_pos + 1
+        return b"".join(self.chunks)
+
+    def resume(self, ds=None):
+        """
+        Continues the transfer, optionally through a new connection to the scope.
+
+        :param ds: The (reconnected) scope, defaults to the one the transfer was started with
+        :return: The data of all samples of the transfer
+        :rtype: bytes
+        """
+        if ds is not None:
+            self.ds = ds
+        if self.ds._setup_waveform_internal(self.channel, self.mode, self.fmt)[1] != self.preamble:
+            raise IOError('The waveform changed since the transfer started, it cannot be resumed.')
+        return self.read()
+
+#: The time a consumer holding the lock waits for the prefetching thread before giving up (in seconds)
+PREFETCH_LOCK_GRACE = 1.0
+
+def _prefetched(iterable, depth, lock=None):
+    """
+    Iterates over iterable in a background thread, up to depth items ahead of the consumer.
+    Exceptions raised in the background thread are raised in the consumer.
+
+    The items of iterable need the (reentrant) lock. If the consumer already
+    holds it when the iteration starts, there is no background thread, the
+    items are produced in the consumer's thread. If it takes the lock in the
+    middle of the iteration, the background thread can't continue:
+    a RuntimeError is raised instead of waiting forever.
+    """
+    if lock is not None and lock._is_owned():
+        for item in iterable:
+            yield item
+        return
+    items = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+    def put(entry):
+        # gives up once the consumer stopped (it doesn't take items anymore)
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.01)
+                return True
+            except queue.Full:
+                pass
+        return False
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as e:
+            put((done, e))
+    thread = threading.Thread(target=produce, name='prefetch')
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            if lock is not None and lock._is_owned():
+                # only an item the background thread already finished reading can still arrive
+                try:
+                    item, error = items.get(timeout=PREFETCH_LOCK_GRACE)
+                except queue.Empty:
+                    raise RuntimeError('The lock of the scope was taken while reading ahead in a background thread, '
+                                       'start the iteration within the transaction() instead')
+            else:
+                item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        # the consumer stopped early: the producer ends after its current item
+        stop.set()
+        if lock is None or not lock._is_owned():
+            # (which needs the lock, so it can't be waited for while holding it)
+            thread.join()
+
 def format_hex(byte_str):
     if sys.version_info >= (3, 0):
         return ' '.join( [ "{:02X}".format(x)  for x in byte_str ] )
@@ -3,71 +3,183 @@ from jvframework.logger import log
 import time
 import os
 import io
-import pkg_resources
-import csv
 import sys
 from itertools import zip_longest
 
 from ds1054z import DS1054Z
-from PIL import Image, ImageOps, ImageEnhance, ImageFile
 
-ImageFile.LOAD_TRUNCATED_IMAGES = True
+# Pillow and csv are only needed by some of the functions below
+# and are imported there to keep importing this module cheap.
+
+
+def _import_pil():
+    from PIL import Image, ImageFile
+
+    ImageFile.LOAD_TRUNCATED_IMAGES = True
+    return Image
+
+
+VOLTAGE_SCALE = 500  # Volts/division
+CURRENT_SCALE = 1  # kA/division
+
+BENCH_PROFILE = {
+    "acquire": {"type": "NORMal", "memory_depth": "AUTO"},
+    "timebase": {
+        "mode": "MAIN",
+        "delay_enable": False,
+        "scale": 50e-6,  # Seconds
+        "offset": 200e-6,
+    },
+    "channels": {
+        "CHAN1": {
+            "coupling": "DC",
+            "bwlimit": "OFF",
+            "invert": False,
+            "units": "VOLTage",
+            "probe_ratio": 1000,  # Multiplier (1x, 10x, 100x...)
+            "scale": VOLTAGE_SCALE,  # Volts/division
+            "offset": -2 * VOLTAGE_SCALE,  # Divisions * volts/division
+        },
+        "CHAN2": {
+            "coupling": "DC",
+            "bwlimit": "OFF",
+            "invert": False,
+            "units": "AMPere",
+            "probe_ratio": 10,  # Multiplier (1x, 10x, 100x...)
+            "scale": CURRENT_SCALE,  # kA/division
+            "offset": -2 * CURRENT_SCALE,  # Divisions * kA/division
+        },
+    },
+    "trigger": {
+        "mode": "EDGE",
+        "source": "CHANnel2",
+        "slope": "POSitive",  # {POSitive|NEGative|RFALl}
+        "noise_reject": True,
+        "coupling": "DC",
+        "level": 0.5,
+    },
+}
+
+
+def initial_setup(ds, setup_file=None, profile=BENCH_PROFILE):
+    """
+    Configure the scope for our bench. If setup_file is given and exists, the
+    setup is restored from it in one transfer, otherwise the profile is applied
+    (sending only the settings that differ) and stored in setup_file for the next time.
+    """
+    try:
+        if setup_file and os.path.exists(setup_file):
+            restore_setup(ds, setup_file)
+            return True
+        commands = ds.apply_profile(profile)
+        log(f"Applied profile with {len(commands)} changed settings")
+        if setup_file:
+            save_setup(ds, setup_file)
+        return True
+    except Exception as e:
+        log(e)
+        return {"error": str(e)}
 
 
-def initial_setup(ds):
+def apply_profile(ds, filepath):
+    """
+    Apply a JSON profile file (see ds1054z.profiles), writing only changed settings.
+    Returns the list of commands sent to the scope.
+    """
     try:
-        # Acquire
-        ds.write(":ACQuire:TYPE NORMal")
-        ds.write(":ACQuire:MDEPth AUTO")
-
-        # Horizontal Scale
-        ds.write(":TIMebase:MODE MAIN")
-        ds.write(":TIMebase:DELay:ENABle OFF")
-        ds.timebase_offset = 200e-6
-        ds.timebase_scale = 50e-6  # Seconds
-
-        # Channel 1
-        ds.write(":CHANnel1:COUPling DC")
-        ds.write(":CHANnel1:BWLimit OFF")
-        ds.write(":CHANnel1:INVert OFF")
-        ds.write(":CHANnel1:UNITs VOLTage")
-        ds.set_probe_ratio("CHAN1", 1000)  # Multiplier (1x, 10x, 100x...)
-
-        voltage_scale = 500  # Volts/division
-        voltage_offset = -2 * voltage_scale  # Divisions * volts/division
-        ds.set_channel_scale("CHAN1", voltage_scale)  # Volts/division
-        ds.set_channel_offset("CHAN1", voltage_offset)  # Volts
-
-        # Channel 2
-        ds.write(":CHANnel2:COUPling DC")
-        ds.write(":CHANnel2:BWLimit OFF")
-        ds.write(":CHANnel2:INVert OFF")
-        ds.write(":CHANnel2:UNITs AMPere")
-        ds.set_probe_ratio("CHAN2", 10)  # Multiplier (1x, 10x, 100x...)
-
-        current_scale = 1  # kA/division
-        current_offset = -2 * current_scale  # Divisions * kA/division
-        ds.set_channel_scale("CHAN2", current_scale)  # kA/division
-        ds.set_channel_offset("CHAN2", current_offset)  # kA
-
-        # Trigger
-        ds.write(":TRIGger:MODE EDGE")
-        ds.write(":TRIGger:EDGe:SOURce CHANnel2")
-        ds.write(":TRIGger:EDGe:SLOPe POSitive")  # {POSitive|NEGative|RFALl}
-        ds.write(":TRIGger:NREJect ON")
-        ds.write(":TRIGger:COUPling DC")
-        ds.write(":TRIGger:EDGe:LEVel 0.5")
+        from ds1054z.profiles import load_profile
+
+        return ds.apply_profile(load_profile(filepath))
+    except Exception as e:
+        log(e)
+        return {"error": str(e)}
+
+
+def save_setup(ds, filepath):
+    """
+    Store the complete scope setup (:SYSTem:SETup?) in a binary file
+    """
+    try:
+        blob = ds.save_setup()
+        with open(filepath, mode="wb") as f:
+            f.write(blob)
+        log(f"Saved setup of {len(blob)} bytes to {filepath}")
         return True
     except Exception as e:
         log(e)
         return {"error": str(e)}
 
 
-def screenshot_simple(ds, filepath):
+def restore_setup(ds, filepath, force=False):
+    """
+    Apply a setup file written by save_setup() in a single transfer.
+    Returns False if the identical setup was already active.
+    """
+    try:
+        with open(filepath, mode="rb") as f:
+            blob = f.read()
+        return ds.restore_setup(blob, force=force)
+    except Exception as e:
+        log(e)
+        return {"error": str(e)}
+
+
+def _register(catalog, ds, filepath, kind, waveforms=(), channels=None):
+    """
+    Add a saved file to the capture catalog (see ds1054z.catalog), if one is given.
+    A failure to register is logged but doesn't fail the save.
+    """
+    if catalog is None:
+        return
+    try:
+        catalog.register_capture(ds, filepath, kind, waveforms, channels=channels)
+    except Exception as e:
+        log("Could not register the capture in the catalog:", e)
+
+
+def _publish(publisher, waveforms):
+    """
+    Publish captures to local consumers (see ds1054z.shm), if a publisher is given.
+    A failure to publish is logged but doesn't fail the save.
+    """
+    if publisher is None:
+        return
+    try:
+        for waveform in waveforms:
+            publisher.publish(waveform)
+    except Exception as e:
+        log("Could not publish the capture:", e)
+
+
+def publish_capture(
+    ds, publisher, *channels, mode="NORMal", progress=None, cancel=None
+):
+    """
+    Read the waveforms of the channels (default: the displayed ones) and only
+    publish them to shared memory (see ds1054z.shm), without saving a file.
+    Returns the sequence numbers of the published captures.
+    """
+    try:
+        channels = channels or ds.displayed_channels
+        seqs = []
+        for channel in channels:
+            waveform = ds.get_waveform(
+                channel, mode=mode, progress=progress, cancel=cancel
+            )
+            seqs.append(publisher.publish(waveform))
+        return seqs
+    except Exception as e:
+        log(e)
+        return {"error": str(e)}
+
+
+def screenshot_simple(ds, filepath, catalog=None):
     try:
+        Image = _import_pil()
         im = Image.open(io.BytesIO(ds.display_data))
         im = im.convert("RGB")
         im.save(filepath, format="png")
+        _register(catalog, ds, filepath, "screenshot", channels=ds.displayed_channels)
         return filepath
     except Exception as e:
         log(e)
@@ -82,6 +194,8 @@ def screenshot_fancy(
     overlay_alpha=1,
     printable=False,
     verbose=False,
+    catalog=None,
+    publisher=None,
     **kwargs,
 ):
     try:
@@ -102,11 +216,14 @@ def screenshot_fancy(
             log("Could not detect the image file type extension from the filename")
             return False
         # getting and saving the image
+        Image = _import_pil()
+        from PIL import ImageOps, ImageEnhance
+        from importlib.resources import files
+
         im = Image.open(io.BytesIO(ds.display_data))
-        overlay_filename = pkg_resources.resource_filename(
-            "ds1054z", "resources/overlay.png"
+        overlay = Image.open(
+            files("ds1054z").joinpath("resources/overlay.png").open("rb")
         )
-        overlay = Image.open(overlay_filename)
         alpha_100_percent = Image.new(overlay.mode, overlay.size, color=(0, 0, 0, 0))
         overlay = Image.blend(alpha_100_percent, overlay, overlay_alpha)
         im.putalpha(255)
@@ -122,6 +239,7 @@ def screenshot_fancy(
         else:
             im = im.convert("RGB")
         im.save(filepath, format=ext[1:])
+        _register(catalog, ds, filepath, "screenshot", channels=ds.displayed_channels)
         if not verbose:
             log(filepath)
         else:
@@ -132,8 +250,12 @@ def screenshot_fancy(
         return {"error": str(e)}
 
 
-def save_waveform_simple(ds, work_dir, filename, channels):
+def save_waveform_simple(
+    ds, work_dir, filename, channels, catalog=None, publisher=None
+):
     try:
+        import csv
+
         wave_file = os.path.join(*[work_dir, filename])
         log(f"Writing {len(channels)} waveforms to {work_dir}/{filename}")
         with open(
@@ -144,9 +266,13 @@ def save_waveform_simple(ds, work_dir, filename, channels):
             csv_writer = csv.writer(f)
             log("Opened file for writing:", wave_file)
             csv_writer.writerow(ds.waveform_time_values_decimal)
+            waveforms = []
             for channel in channels:
-                waveform = ds.get_waveform_samples(channel)
-                csv_writer.writerow(waveform)
+                waveform = ds.get_waveform(channel)
+                csv_writer.writerow(waveform.volts)
+                waveforms.append(waveform)
+        _register(catalog, ds, wave_file, "waveform", waveforms)
+        _publish(publisher, waveforms)
         return True
     except Exception as e:
         log(e)
@@ -162,20 +288,45 @@ def save_data(
     with_time=True,
     mode="NORMal",
     verbose=False,
+    progress=None,
+    cancel=None,
+    catalog=None,
+    publisher=None,
     **kwargs,
 ):
+    """
+    Save the waveforms of all displayed channels to a csv/txt file.
+    With a .gz, .xz or .zst extension appended (like data.csv.gz), the file
+    is compressed while writing (see ds1054z.storage).
+    progress and cancel are handed to ds.get_waveform() for every channel,
+    so a long RAW transfer can be watched and aborted (e.g. with a threading.Event).
+    With a catalog (see ds1054z.catalog), the file is registered there.
+    With a publisher (see ds1054z.shm), each waveform is also published
+    to local consumers as soon as it is read (before the next channel is).
+    """
     try:
-        ext = os.path.splitext(filename)[-1]
+        from ds1054z.storage import codec_from_filename, open_compressed
+
+        basename, codec = codec_from_filename(filename)
+        ext = os.path.splitext(basename)[-1]
         if not ext:
             log("Could not detect the file type extension from the filename")
             return False
         filepath = os.path.join(work_dir, filename)
         kind = ext[1:]
         if kind in ("csv", "txt"):
-            data = []
+            import csv
+
             channels = ds.displayed_channels
+            waveforms = []
             for channel in channels:
-                data.append(ds.get_waveform_samples(channel, mode=mode))
+                waveform = ds.get_waveform(
+                    channel, mode=mode, progress=progress, cancel=cancel
+                )
+                # consumers get each channel right away, not after the last one
+                _publish(publisher, [waveform])
+                waveforms.append(waveform)
+            data = [waveform.volts for waveform in waveforms]
             if with_time:
                 data.insert(0, ds.waveform_time_values_decimal)
             lengths = [len(samples) for samples in data]
@@ -184,6 +335,8 @@ def save_data(
                 sys.exit(1)
 
             def csv_open(filepath):
+                if codec is not None:
+                    return open_compressed(filepath, "wt", codec, newline="")
                 if sys.version_info >= (3, 0):
                     return open(filepath, "w", newline="")
                 else:
@@ -202,6 +355,7 @@ def save_data(
                     else:
                         vals = ["{:.2e}".format(val) for val in vals]
                     csv_writer.writerow(vals)
+            _register(catalog, ds, filepath, "data", waveforms)
         else:
             log("This tool cannot handle the requested --type")
         if not verbose:
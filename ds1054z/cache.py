@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.cache` - Caching waveform data of a stopped scope
+===============================================================================
+
+As long as the scope is stopped, reading the same channel again returns
+exactly the same data. With a cache, :py:class:`ds1054z.DS1054Z` keeps
+the waveforms it read and serves repeated requests without transferring
+them again:
+
+>>> scope = DS1054Z('192.168.0.23', cache_size=256 * 1024 * 1024)
+>>> scope.stop()
+>>> samples = scope.get_waveform_samples(1, mode='RAW')  # transferred
+>>> samples = scope.get_waveform_samples(1, mode='RAW')  # from the cache
+
+Each cached waveform belongs to an acquisition generation. The generation
+is advanced by every message that may change the acquired data
+(like ``:RUN``, ``:SINGle``, ``:TFORce`` or any changed setting) and
+whenever the scope is found not to be stopped (``:TRIGger:STATus?`` is asked before
+each read, which costs one round trip instead of the whole transfer).
+Waveforms of older generations are never served.
+
+Changes made at the front panel while the scope remains stopped
+(like scrolling the waveform) can't be noticed. Call :py:meth:`WaveformCache.clear`
+(or access the scope without a cache) in that case.
+"""
+
+import collections
+
+class WaveformCache(object):
+    """
+    A least recently used cache of waveform data with a memory budget.
+
+    It is used by :py:class:`ds1054z.DS1054Z` while holding its lock,
+    it isn't thread-safe on its own.
+
+    :param int max_bytes: The maximum total size of the cached data in bytes
+    :ivar int hits: The number of requests served from the cache
+    :ivar int misses: The number of requests not found in the cache
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.generation = None
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, generation, key):
+        """
+        The value cached for key within the generation, or None.
+        An entry found is marked as the most recently used.
+        """
+        if generation != self.generation:
+            self.clear()
+            self.generation = generation
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, generation, key, value, size):
+        """
+        Stores a value of the given size (in bytes).
+        The least recently used entries are dropped to stay within the budget.
+        Values larger than the whole budget aren't stored at all.
+        """
+        if generation != self.generation:
+            self.clear()
+            self.generation = generation
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        if size > self.max_bytes:
+            return
+        while self.nbytes + size > self.max_bytes:
+            _, (_, old_size) = self._entries.popitem(last=False)
+            self.nbytes -= old_size
+        self._entries[key] = (value, size)
+        self.nbytes += size
+
+    def clear(self):
+        """ Drops all cached data """
+        self._entries.clear()
+        self.nbytes = 0
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.catalog` - An index of saved captures
+====================================================================
+
+Every file written by the save functions of :py:mod:`ds1054z.api`
+(waveform data, screenshots, JSON) can be registered in a local SQLite
+database together with its metadata: time, scope serial number, channels,
+waveform preambles, a hash of the scope settings and summary measurements
+of each channel (vmax, vmin, vpp and vavg). Selecting captures is then
+an index lookup instead of reading all the files again:
+
+>>> from ds1054z.catalog import CaptureCatalog
+>>> catalog = CaptureCatalog('captures.sqlite')
+>>> catalog.register_capture(scope, 'pulse_0001.csv', 'data', waveforms)
+>>> week_ago = time.time() - 7 * 24 * 3600
+>>> for capture in catalog.find(since=week_ago, conditions=[('CHAN2', 'vmax', '>', 3.0)]):
+...     print(capture['path'], capture['measurements']['CHAN2']['vmax'])
+
+The catalog can be used from several threads.
+"""
+
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+
+#: The summary measurements stored per channel (see :py:func:`summarize`)
+SUMMARY_ITEMS = ('vmax', 'vmin', 'vpp', 'vavg')
+
+#: The comparison operators allowed in the conditions of :py:meth:`CaptureCatalog.find`
+OPERATORS = ('<', '<=', '>', '>=', '=', '!=')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    serial TEXT,
+    settings_hash TEXT,
+    info TEXT
+);
+CREATE TABLE IF NOT EXISTS channels (
+    capture_id INTEGER NOT NULL REFERENCES captures(id) ON DELETE CASCADE,
+    channel TEXT NOT NULL,
+    preamble TEXT,
+    PRIMARY KEY (capture_id, channel)
+);
+CREATE TABLE IF NOT EXISTS measurements (
+    capture_id INTEGER NOT NULL REFERENCES captures(id) ON DELETE CASCADE,
+    channel TEXT NOT NULL,
+    item TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS captures_time ON captures (time);
+CREATE INDEX IF NOT EXISTS channels_channel ON channels (channel, capture_id);
+CREATE INDEX IF NOT EXISTS measurements_value ON measurements (channel, item, value);
+CREATE INDEX IF NOT EXISTS measurements_capture ON measurements (capture_id);
+"""
+
+def summarize(samples):
+    """
+    The summary measurements of a list of voltage samples (NaN values are ignored).
+
+    :return: {item: value} for the :py:data:`SUMMARY_ITEMS`, all None without valid samples
+    :rtype: dict
+    """
+    valid = [v for v in samples if v == v]
+    if not valid:
+        return {item: None for item in SUMMARY_ITEMS}
+    vmax, vmin = max(valid), min(valid)
+    return {'vmax': vmax, 'vmin': vmin, 'vpp': vmax - vmin, 'vavg': math.fsum(valid) / len(valid)}
+
+def settings_hash(ds):
+    """ A hash of the current settings of the scope (see :py:meth:`ds1054z.DS1054Z.get_profile`) """
+    profile = json.dumps(ds.get_profile(), sort_keys=True)
+    return hashlib.sha1(profile.encode('utf-8')).hexdigest()
+
+class CaptureCatalog(object):
+    """
+    The SQLite index of saved captures.
+
+    :param str path: The database file (created if missing)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA foreign_keys = ON')
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def register(self, path, kind, timestamp=None, serial=None, settings_hash=None,
+                 preambles=None, measurements=None, channels=None, info=None):
+        """
+        Adds a capture to the catalog.
+
+        :param str path: The file the capture was saved to
+        :param str kind: What kind of file it is, like 'data', 'waveform', 'screenshot' or 'json'
+        :param float timestamp: The time of the capture (seconds since the epoch), defaults to now
+        :param str serial: The serial number of the scope
+        :param str settings_hash: See :py:func:`settings_hash`
+        :param dict preambles: {channel: waveform preamble tuple}
+        :param dict measurements: {channel: {item: value}}
+        :param channels: The channels of the capture, defaults to those of preambles and measurements
+        :param dict info: Any further data to store (JSON serializable)
+        :return: The id of the capture
+        :rtype: int
+        """
+        preambles = preambles or {}
+        measurements = measurements or {}
+        if channels is None:
+            channels = sorted(set(preambles) | set(measurements))
+        with self._lock:
+            with self._db:
+                cursor = self._db.execute(
+                    'INSERT INTO captures (time, kind, path, serial, settings_hash, info) VALUES (?, ?, ?, ?, ?, ?)',
+                    (time.time() if timestamp is None else timestamp, kind, path, serial, settings_hash,
+                     json.dumps(info) if info is not None else None))
+                capture_id = cursor.lastrowid
+                self._db.executemany(
+                    'INSERT INTO channels (capture_id, channel, preamble) VALUES (?, ?, ?)',
+                    [(capture_id, channel, json.dumps(list(preambles[channel])) if channel in preambles else None)
+                     for channel in channels])
+                self._db.executemany(
+                    'INSERT INTO measurements (capture_id, channel, item, value) VALUES (?, ?, ?, ?)',
+                    [(capture_id, channel, item, value)
+                     for channel, values in measurements.items() for item, value in values.items()])
+        return capture_id
+
+    def register_capture(self, ds, path, kind, waveforms=(), channels=None, timestamp=None, info=None):
+        """
+        Adds a capture to the catalog, taking the metadata from the scope
+        and the summary measurements from the waveforms.
+
+        :param ds: The scope (:py:class:`ds1054z.DS1054Z`)
+        :param str path: The file the capture was saved to
+        :param str kind: What kind of file it is (see :py:meth:`register`)
+        :param waveforms: The :py:class:`ds1054z.Waveform` objects saved to the file
+        :param channels: The channels of the capture, defaults to those of the waveforms
+        :return: The id of the capture
+        :rtype: int
+        """
+        preambles = {}
+        measurements = {}
+        for waveform in waveforms:
+            preambles[waveform.channel] = waveform.preamble
+            measurements[waveform.channel] = summarize(waveform.volts)
+        if channels is None:
+            channels = [waveform.channel for waveform in waveforms]
+        return self.register(path, kind, timestamp=timestamp, serial=ds.serial, settings_hash=settings_hash(ds),
+                             preambles=preambles, measurements=measurements, channels=channels, info=info)
+
+    def find(self, since=None, until=None, kind=None, serial=None, channel=None, settings_hash=None,
+             conditions=(), limit=None):
+        """
+        Looks up captures.
+
+        :param float since: Only captures taken at or after this time (seconds since the epoch)
+        :param float until: Only captures taken before this time
+        :param str kind: Only captures of this kind
+        :param str serial: Only captures of this scope
+        :param str channel: Only captures including this channel
+        :param str settings_hash: Only captures taken with these settings
+        :param conditions: (channel, item, operator, value) tuples the summary
+                           measurements have to fulfill, like ``('CHAN2', 'vmax', '>', 3.0)``
+        :param int limit: The maximum number of captures to return (the latest ones)
+        :return: The captures (latest first) as dictionaries with the keys
+                 id, time, kind, path, serial, settings_hash, info, channels, preambles and measurements
+        :rtype: list of dict
+        """
+        where = []
+        params = []
+        for column, op, value in (('time', '>=', since), ('time', '<', until), ('kind', '=', kind),
+                                  ('serial', '=', serial), ('settings_hash', '=', settings_hash)):
+            if value is not None:
+                where.append('c.{0} {1} ?'.format(column, op))
+                params.append(value)
+        if channel is not None:
+            where.append('EXISTS (SELECT 1 FROM channels h WHERE h.capture_id = c.id AND h.channel = ?)')
+            params.append(channel)
+        for ch, item, op, value in conditions:
+            if op not in OPERATORS:
+                raise NameError('Unknown operator: {0}'.format(op))
+            where.append('EXISTS (SELECT 1 FROM measurements m WHERE m.capture_id = c.id '
+                         'AND m.channel = ? AND m.item = ? AND m.value {0} ?)'.format(op))
+            params += [ch, item, value]
+        sql = 'SELECT c.id, c.time, c.kind, c.path, c.serial, c.settings_hash, c.info FROM captures c'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY c.time DESC, c.id DESC'
+        if limit is not None:
+            sql += ' LIMIT {0:d}'.format(limit)
+        with self._lock:
+            captures = []
+            by_id = {}
+            for row in self._db.execute(sql, params):
+                capture = dict(zip(('id', 'time', 'kind', 'path', 'serial', 'settings_hash', 'info'), row))
+                capture['info'] = json.loads(capture['info']) if capture['info'] is not None else None
+                capture.update(channels=[], preambles={}, measurements={})
+                captures.append(capture)
+                by_id[capture['id']] = capture
+            ids = list(by_id)
+            # SQLite limits the number of parameters per statement
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i+500]
+                marks = ','.join('?' * len(batch))
+                for capture_id, ch, preamble in self._db.execute(
+                        'SELECT capture_id, channel, preamble FROM channels WHERE capture_id IN ({0}) '
+                        'ORDER BY capture_id, channel'.format(marks), batch):
+                    by_id[capture_id]['channels'].append(ch)
+                    if preamble is not None:
+                        by_id[capture_id]['preambles'][ch] = tuple(json.loads(preamble))
+                for capture_id, ch, item, value in self._db.execute(
+                        'SELECT capture_id, channel, item, value FROM measurements WHERE capture_id IN ({0})'.format(marks),
+                        batch):
+                    by_id[capture_id]['measurements'].setdefault(ch, {})[item] = value
+        return captures
+
+    def remove(self, capture_id):
+        """ Removes a capture from the catalog (the file isn't touched) """
+        with self._lock:
+            with self._db:
+                self._db.execute('DELETE FROM captures WHERE id = ?', (capture_id,))
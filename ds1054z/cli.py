@@ -14,7 +14,6 @@ import textwrap
 import logging
 import time
 import io
-import pkg_resources
 import sys
 import os
 import itertools
@@ -83,6 +82,9 @@ def main():
     action_desc = 'Discover and list scopes on your network and exit'
     discover_parser = subparsers.add_parser('discover',
         description=action_desc, help=action_desc)
+    discover_parser.add_argument('--network', '-n', metavar='CIDR',
+        help='Probe all hosts of this IP range (like 10.0.1.0/24) instead of using '
+             'Zeroconf. Useful on networks where multicast is blocked.')
     # ds1054z info
     action_desc = 'Print information about your oscilloscope'
     cmd_parser = subparsers.add_parser('info', parents=[device_parser],
@@ -159,18 +161,24 @@ def main():
     tforce_parser = subparsers.add_parser('shell', parents=[device_parser],
         description=action_desc, help=action_desc)
     # ds1054z measure
-    action_desc = 'Measure a value on a channel'
+    action_desc = 'Measure values on one or more channels'
     measure_parser = subparsers.add_parser('measure', parents=[device_parser],
         description=action_desc, help=action_desc)
-    measure_parser.add_argument('--channel', '-c', choices=(1, 2, 3, 4), type=int, required=True,
-        help='Channel from which to take the measurement')
-    measure_parser.add_argument('--type', '-t', choices=('CURRent', 'MAXimum', 'MINimum', 'AVERages', 'DEViation'), default='CURRent')
-    measure_parser.add_argument('item', choices=('vmax', 'vmin', 'vpp', 'vtop', 'vbase', 'vamp', 'vavg', 'vrms', 'overshoot', 'preshoot', 'marea', 'mparea', 'period', 'frequency', 'rtime', 'ftime', 'pwidth', 'nwidth', 'pduty', 'nduty', 'rdelay', 'fdelay', 'rphase', 'fphase', 'tvmax', 'tvmin', 'pslewrate', 'nslewrate', 'vupper', 'vmid', 'vlower', 'variance', 'pvrms'),
-        help='Value to measure')
+    measure_parser.add_argument('--channel', '-c', choices=(1, 2, 3, 4), type=int, required=True, action='append',
+        help='Channel from which to take the measurement (can be given multiple times)')
+    measure_parser.add_argument('--type', '-t', choices=DS1054Z.MEASUREMENT_TYPES, default='CURRent')
+    measure_parser.add_argument('item', type=measurement_items,
+        help='Value to measure, multiple ones separated by commas like vpp,frequency. '
+             'Choices: ' + ', '.join(DS1054Z.MEASUREMENT_ITEMS))
     args = parser.parse_args()
 
     if args.version:
-        print(pkg_resources.get_distribution("ds1054z").version)
+        try:
+            from importlib.metadata import version
+        except ImportError:
+            from pkg_resources import get_distribution
+            version = lambda name: get_distribution(name).version
+        print(version("ds1054z"))
         sys.exit(0)
 
     if args.debug:
@@ -182,12 +190,17 @@ def main():
         sys.exit(2)
 
     if args.action == 'discover':
-        try:
-            from ds1054z.discovery import discover_devices
-        except:
-            print('Discovery depends on the zeroconf Python package which is missing.')
-            sys.exit(1)
-        devices = discover_devices()
+        if args.network:
+            from ds1054z.netscan import scan_network
+            devices = scan_network(args.network)
+        else:
+            try:
+                from ds1054z.discovery import discover_devices
+            except:
+                print('Discovery depends on the zeroconf Python package which is missing. '
+                      'Use --network to scan an IP range instead.')
+                sys.exit(1)
+            devices = discover_devices()
         for device in devices:
             if args.verbose:
                 print("Found a {model} with the IP Address {ip}.".format(**device))
@@ -234,29 +247,37 @@ def main():
             ds.timebase_scale = args.timebase
         if args.timebase_offset:
             ds.timebase_offset = args.timebase_offset
-        wp = ds.waveform_preamble_dict
+        queries = [':ACQuire:SRATe?', ':TIMebase:MAIN:SCALe?', ':TIMebase:MAIN:OFFSet?']
+        queries += [':{0}:DISPlay?'.format(channel) for channel in DS1054Z.CHANNEL_LIST]
+        answers = ds.query_many(queries)
+        sample_rate, timebase_scale, timebase_offset = (float(val) for val in answers[:3])
+        displayed_channels = [ch for ch, val in zip(DS1054Z.CHANNEL_LIST, answers[3:]) if val == '1']
         if args.verbose:
-            displayed_channels = ds.displayed_channels
-            print("Sample Rate: {0}Sa/s".format(DS1054Z.format_si_prefix(ds.sample_rate)))
-            print("Timebase: {0}s/div".format(DS1054Z.format_si_prefix(ds.timebase_scale)))
-            print("Timebase Offset: {0}s".format(DS1054Z.format_si_prefix(ds.timebase_offset)))
+            print("Sample Rate: {0}Sa/s".format(DS1054Z.format_si_prefix(sample_rate)))
+            print("Timebase: {0}s/div".format(DS1054Z.format_si_prefix(timebase_scale)))
+            print("Timebase Offset: {0}s".format(DS1054Z.format_si_prefix(timebase_offset)))
             ds.set_waveform_mode('NORMal')
             tv = ds.waveform_time_values
             t_from = DS1054Z.format_si_prefix(tv[0],  unit='s')
             t_to =   DS1054Z.format_si_prefix(tv[-1], unit='s')
             print("The time axis goes from {0} to {1}".format(t_from, t_to))
             print("Displayed Channels: {0}".format(' '.join(displayed_channels)))
+            analog_channels = [ch for ch in displayed_channels if ch in DS1054Z.ANALOG_CHANNEL_LIST]
+            channel_settings = ds.get_channel_settings(analog_channels)
             for channel in displayed_channels:
                 print("  Channel {0}:".format(channel))
-                print("    Scale: {0}V/div".format(DS1054Z.format_si_prefix(ds.get_channel_scale(channel))))
-                print("    Offset: {0}V".format(ds.get_channel_offset(channel)))
-                print("    Probe Ratio: {}".format(ds.get_probe_ratio(channel)))
-                print("    ---".format(DS1054Z.format_si_prefix(ds.get_channel_scale(channel))))
+                if channel not in channel_settings:
+                    continue
+                cs = channel_settings[channel]
+                print("    Scale: {0}V/div".format(DS1054Z.format_si_prefix(cs['scale'])))
+                print("    Offset: {0}V".format(cs['offset']))
+                print("    Probe Ratio: {}".format(cs['probe_ratio']))
+                print("    ---")
         else:
-            print('sample_rate={}'.format(ds.sample_rate))
-            print('timebase_scale={}'.format(ds.timebase_scale))
-            print('timebase_offset={}'.format(ds.timebase_offset))
-            print('displayed_channels={}'.format(','.join(ds.displayed_channels)))
+            print('sample_rate={}'.format(sample_rate))
+            print('timebase_scale={}'.format(timebase_scale))
+            print('timebase_offset={}'.format(timebase_offset))
+            print('displayed_channels={}'.format(','.join(displayed_channels)))
 
     if args.action == 'properties':
         for prop in args.properties:
@@ -284,8 +305,8 @@ def main():
         if not ext: parser.error('could not detect the image file type extension from the filename')
         # getting and saving the image
         im = Image.open(io.BytesIO(ds.display_data))
-        overlay_filename = pkg_resources.resource_filename("ds1054z","resources/overlay.png")
-        overlay = Image.open(overlay_filename)
+        from importlib.resources import files
+        overlay = Image.open(files("ds1054z").joinpath("resources/overlay.png").open('rb'))
         alpha_100_percent =  Image.new(overlay.mode, overlay.size, color=(0,0,0,0))
         overlay = Image.blend(alpha_100_percent, overlay, args.overlay)
         im.putalpha(255)
@@ -362,9 +383,23 @@ def main():
         run_shell(ds)
 
     if args.action == 'measure':
-        v = ds.get_channel_measurement(args.channel, args.item, type=args.type)
-        if v is not None:
-            print(v)
+        table = ds.get_channel_measurements(args.channel, args.item, type=args.type)
+        if len(args.channel) == 1 and len(args.item) == 1:
+            v = table['CHAN{0}'.format(args.channel[0])][args.item[0]]
+            if v is not None:
+                print(v)
+        else:
+            print('\t'.join(['channel'] + args.item))
+            for channel, values in table.items():
+                print('\t'.join([channel] + ['-' if values[item] is None else str(values[item]) for item in args.item]))
+
+def measurement_items(value):
+    """ argparse type for a comma separated list of measurement items """
+    items = [item.strip() for item in value.split(',')]
+    for item in items:
+        if item not in DS1054Z.MEASUREMENT_ITEMS:
+            raise argparse.ArgumentTypeError('invalid measurement item: {0}'.format(item))
+    return items
 
 def run_shell(ds):
     """ ds : DS1054Z instance """
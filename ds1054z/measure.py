@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.measure` - Measurements computed on the host
+==========================================================================
+
+Instead of asking the scope for every single ``:MEASure`` item,
+the measurements can be calculated from the waveform samples
+that have been read anyway:
+
+>>> from ds1054z.measure import measure
+>>> waveform = scope.get_waveform(1, mode='RAW')
+>>> wp = waveform.preamble_dict
+>>> measure(waveform.samples(), wp['xinc'], wp['xorig'], items=['vpp', 'frequency', 'pduty'])
+{'vpp': 3.28, 'frequency': 1000.2, 'pduty': 0.5}
+
+The items are named like the ones of ``:MEASure:ITEM`` and follow the
+definitions of the scope: the levels vupper, vmid and vlower are at 90%, 50%
+and 10% of the amplitude between vbase and vtop, time measurements refer
+to crossings of those levels (linearly interpolated between samples).
+Items that can't be determined (like the period of a waveform
+without any two rising edges) are None, just like the scope's
+invalid readings with :py:meth:`ds1054z.DS1054Z.get_channel_measurement`.
+
+The delay and phase between two channels (rdelay, fdelay, rphase, fphase)
+are calculated with :py:func:`measure_delay`.
+
+Everything is done with plain Python: a full table of all items for
+a capture of N samples costs a handful of passes over the data and no round trips,
+and a few items only cost the passes they need.
+"""
+
+import math
+
+#: The items calculated by :py:func:`measure`
+ITEMS = ('vmax', 'vmin', 'vpp', 'vtop', 'vbase', 'vamp', 'vupper', 'vmid', 'vlower',
+         'vavg', 'vrms', 'variance', 'overshoot', 'preshoot', 'marea', 'mparea', 'pvrms',
+         'period', 'frequency', 'rtime', 'ftime', 'pwidth', 'nwidth', 'pduty', 'nduty',
+         'tvmax', 'tvmin', 'pslewrate', 'nslewrate')
+
+#: The items calculated by :py:func:`measure_delay`
+DELAY_ITEMS = ('rdelay', 'fdelay', 'rphase', 'fphase')
+
+#: The levels vupper, vmid and vlower in percent of the amplitude (the scope's defaults)
+THRESHOLDS = (90.0, 50.0, 10.0)
+
+#: number of bins of the histogram used to find vtop and vbase
+HISTOGRAM_BINS = 256
+
+def _valid(samples):
+    """
+    The samples without the NaN values of padded screen reads
+    plus the number of NaN values removed from the beginning.
+    """
+    lead = 0
+    while lead < len(samples) and samples[lead] != samples[lead]:
+        lead += 1
+    return [v for v in samples[lead:] if v == v], lead
+
+def _top_base(samples, vmin, vmax):
+    """
+    vtop and vbase as the most frequent values in the upper and lower half of the range.
+    For waveforms without flat levels (like a sine) this falls back to vmax and vmin.
+    """
+    span = vmax - vmin
+    if span <= 0:
+        return vmax, vmin
+    bins = [0] * HISTOGRAM_BINS
+    sums = [0.0] * HISTOGRAM_BINS
+    scale = (HISTOGRAM_BINS - 1) / span
+    for v in samples:
+        i = int((v - vmin) * scale)
+        bins[i] += 1
+        sums[i] += v
+    half = HISTOGRAM_BINS // 2
+    upper = max(range(half, HISTOGRAM_BINS), key=bins.__getitem__)
+    lower = max(range(half), key=bins.__getitem__)
+    # a flat level holds a considerable share of the samples
+    threshold = len(samples) * 0.05
+    vtop = sums[upper] / bins[upper] if bins[upper] >= threshold else vmax
+    vbase = sums[lower] / bins[lower] if bins[lower] >= threshold else vmin
+    return vtop, vbase
+
+def crossings(samples, level, rising=True):
+    """
+    The fractional sample indices at which the samples cross a level.
+
+    :param list samples: The voltage samples
+    :param float level: The level to cross
+    :param bool rising: Find rising (True) or falling (False) crossings
+    :return: The positions of the crossings (linearly interpolated)
+    :rtype: list of float
+    """
+    positions = []
+    prev = samples[0] if samples else None
+    for i in range(1, len(samples)):
+        cur = samples[i]
+        if rising:
+            crossed = prev < level <= cur
+        else:
+            crossed = prev > level >= cur
+        if crossed:
+            positions.append(i - 1 + (level - prev) / (cur - prev))
+        prev = cur
+    return positions
+
+def _edge_time(samples, start, stop, rising, xinc):
+    """ The time from the start level to the stop level of the first complete edge """
+    starts = crossings(samples, start, rising)
+    stops = crossings(samples, stop, rising)
+    for s in starts:
+        for e in stops:
+            if e >= s:
+                return (e - s) * xinc
+    return None
+
+class _Calculation(object):
+    """
+    Calculates the items (and the intermediate values they depend on) on demand,
+    each one only once: ``calculation['pduty']`` only finds the crossings
+    of vmid, it doesn't compute vrms or the edge times.
+    """
+
+    def __init__(self, samples, xinc, xorig):
+        self.samples = samples
+        self.xinc = xinc
+        self.xorig = xorig
+        self.values = {}
+
+    def __getitem__(self, name):
+        if name not in self.values:
+            self.values[name] = getattr(self, '_' + name)()
+        return self.values[name]
+
+    def _vmax(self):
+        return max(self.samples)
+
+    def _vmin(self):
+        return min(self.samples)
+
+    def _vpp(self):
+        return self['vmax'] - self['vmin']
+
+    def _top_base(self):
+        return _top_base(self.samples, self['vmin'], self['vmax'])
+
+    def _vtop(self):
+        return self['top_base'][0]
+
+    def _vbase(self):
+        return self['top_base'][1]
+
+    def _vamp(self):
+        return self['vtop'] - self['vbase']
+
+    def _vupper(self):
+        return self['vbase'] + self['vamp'] * THRESHOLDS[0] / 100.0
+
+    def _vmid(self):
+        return self['vbase'] + self['vamp'] * THRESHOLDS[1] / 100.0
+
+    def _vlower(self):
+        return self['vbase'] + self['vamp'] * THRESHOLDS[2] / 100.0
+
+    def _total(self):
+        return math.fsum(self.samples)
+
+    def _vavg(self):
+        return self['total'] / len(self.samples)
+
+    def _vrms(self):
+        return math.sqrt(math.fsum(v * v for v in self.samples) / len(self.samples))
+
+    def _variance(self):
+        vavg = self['vavg']
+        return math.fsum((v - vavg) ** 2 for v in self.samples) / len(self.samples)
+
+    def _overshoot(self):
+        return (self['vmax'] - self['vtop']) / self['vamp'] if self['vamp'] else None
+
+    def _preshoot(self):
+        return (self['vbase'] - self['vmin']) / self['vamp'] if self['vamp'] else None
+
+    def _marea(self):
+        return self['total'] * self.xinc
+
+    def _tvmax(self):
+        return self.xorig + self.samples.index(self['vmax']) * self.xinc
+
+    def _tvmin(self):
+        return self.xorig + self.samples.index(self['vmin']) * self.xinc
+
+    def _rising(self):
+        return crossings(self.samples, self['vmid'], True) if self['vamp'] else []
+
+    def _falling(self):
+        return crossings(self.samples, self['vmid'], False) if self['vamp'] else []
+
+    def _period(self):
+        rising = self['rising']
+        if len(rising) < 2:
+            return None
+        return (rising[-1] - rising[0]) / (len(rising) - 1) * self.xinc
+
+    def _frequency(self):
+        return 1.0 / self['period'] if self['period'] else None
+
+    def _cycle(self):
+        """ The samples of the first complete period (from a rising edge to the next one) """
+        rising = self['rising']
+        if len(rising) < 2:
+            return None
+        return self.samples[int(math.ceil(rising[0])):int(math.ceil(rising[1]))]
+
+    def _mparea(self):
+        cycle = self['cycle']
+        return math.fsum(cycle) * self.xinc if cycle else None
+
+    def _pvrms(self):
+        cycle = self['cycle']
+        return math.sqrt(math.fsum(v * v for v in cycle) / len(cycle)) if cycle else None
+
+    def _pwidth(self):
+        rising = self['rising']
+        after = [f for f in self['falling'] if rising and f > rising[0]]
+        return (after[0] - rising[0]) * self.xinc if after else None
+
+    def _nwidth(self):
+        falling = self['falling']
+        after = [e for e in self['rising'] if falling and e > falling[0]]
+        return (after[0] - falling[0]) * self.xinc if after else None
+
+    def _pduty(self):
+        return self['pwidth'] / self['period'] if self['pwidth'] is not None and self['period'] else None
+
+    def _nduty(self):
+        return self['nwidth'] / self['period'] if self['nwidth'] is not None and self['period'] else None
+
+    def _rtime(self):
+        if not self['vamp']:
+            return None
+        return _edge_time(self.samples, self['vlower'], self['vupper'], True, self.xinc)
+
+    def _ftime(self):
+        if not self['vamp']:
+            return None
+        return _edge_time(self.samples, self['vupper'], self['vlower'], False, self.xinc)
+
+    def _pslewrate(self):
+        return (self['vupper'] - self['vlower']) / self['rtime'] if self['rtime'] else None
+
+    def _nslewrate(self):
+        return (self['vlower'] - self['vupper']) / self['ftime'] if self['ftime'] else None
+
+def measure(samples, xinc, xorig=0.0, items=ITEMS):
+    """
+    Calculates measurement items from waveform samples.
+    Only what the requested items need is computed (the levels alone don't
+    search any edges, the amplitudes don't sum the samples up, ...).
+
+    :param list samples: The voltage samples (NaN values are ignored)
+    :param float xinc: The time between two samples in seconds
+    :param float xorig: The time of the first sample relative to the trigger
+    :param items: The items to calculate (see :py:data:`ITEMS`)
+    :return: The measured values by item (None where the item couldn't be determined)
+    :rtype: dict
+    """
+    unknown = [item for item in items if item not in ITEMS]
+    if unknown:
+        raise NameError('Unknown measurement items: {0}'.format(', '.join(unknown)))
+    samples, lead = _valid(samples)
+    xorig += lead * xinc
+    if not samples:
+        return {item: None for item in items}
+    calculation = _Calculation(samples, xinc, xorig)
+    return {item: calculation[item] for item in items}
+
+def measure_delay(samples_a, samples_b, xinc, items=DELAY_ITEMS):
+    """
+    Calculates the delay and phase between two channels sampled at the same time.
+
+    The delay is the time from the first edge of channel A crossing its vmid level to
+    the next edge of the same direction of channel B. The phase relates it to the
+    period of channel A (in degrees).
+
+    :param list samples_a: The voltage samples of the reference channel
+    :param list samples_b: The voltage samples of the other channel
+    :param float xinc: The time between two samples in seconds
+    :param items: The items to calculate (see :py:data:`DELAY_ITEMS`)
+    :rtype: dict
+    """
+    unknown = [item for item in items if item not in DELAY_ITEMS]
+    if unknown:
+        raise NameError('Unknown measurement items: {0}'.format(', '.join(unknown)))
+    a = measure(samples_a, xinc, items=('vmid', 'period'))
+    b = measure(samples_b, xinc, items=('vmid',))
+    # NaN samples would break the crossings, padding is the same for both channels
+    samples_a, samples_b = _valid(samples_a)[0], _valid(samples_b)[0]
+    r = {}
+    for rising, delay, phase in ((True, 'rdelay', 'rphase'), (False, 'fdelay', 'fphase')):
+        r[delay] = r[phase] = None
+        if a['vmid'] is None or b['vmid'] is None:
+            continue
+        edges_a = crossings(samples_a, a['vmid'], rising)
+        edges_b = crossings(samples_b, b['vmid'], rising)
+        if not edges_a:
+            continue
+        later = [e for e in edges_b if e >= edges_a[0]]
+        if not later:
+            continue
+        r[delay] = (later[0] - edges_a[0]) * xinc
+        if a['period']:
+            r[phase] = r[delay] / a['period'] * 360.0
+    return {item: r[item] for item in items}
+
+def measure_channel(ds, channel, items=ITEMS, mode='NORMal'):
+    """
+    Reads the waveform of a channel and calculates the measurement items from it.
+
+    :param ds: The scope (:py:class:`ds1054z.DS1054Z`)
+    :param channel: The channel name (like 'CHAN1' or 1).
+    :param items: The items to calculate (see :py:data:`ITEMS`)
+    :param str mode: The waveform mode to read: NORMal, MAXimum or RAW
+    :rtype: dict
+    """
+    # the preamble read along with the samples (another thread may read a different channel meanwhile)
+    waveform = ds.get_waveform(channel, mode=mode)
+    wp = waveform.preamble_dict
+    return measure(waveform.samples(), wp['xinc'], wp['xorig'] + (waveform.first - 1) * wp['xinc'], items=items)
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.monitor` - Long-term logging of measurements
+==========================================================================
+
+A :py:class:`MeasurementLogger` polls a set of ``:MEASure`` items on a
+fixed interval in a background thread (using
+:py:meth:`ds1054z.DS1054Z.get_channel_measurements`, so every poll costs a
+single round trip). The readings go to a ring buffer of fixed size and
+are appended to a file in blocks:
+
+>>> from ds1054z.monitor import MeasurementLogger
+>>> with MeasurementLogger(scope, [1, 2], ['vpp', 'frequency'], interval=0.5, filename='log.csv') as mlog:
+...     time.sleep(3600)
+...     print(mlog.statistics()['CHAN1.vpp'])
+{'count': 7200, 'invalid': 0, 'min': 3.2, 'max': 3.36, 'mean': 3.28, 'std': 0.02, 'last': 3.28}
+
+Memory usage stays constant no matter how long the logger runs.
+The summary statistics are updated with every reading, so asking for
+them doesn't need to look at the buffer at all.
+
+The scope can still be used while the logger is running: the polls
+are serialized with the other requests (see :py:meth:`ds1054z.DS1054Z.transaction`),
+they just have to wait for a long waveform transfer to finish.
+"""
+
+import array
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class RunningStatistics(object):
+    """ Count, min, max, mean and standard deviation updated value by value (Welford's algorithm) """
+
+    __slots__ = ('count', 'invalid', 'min', 'max', 'mean', 'm2', 'last')
+
+    def __init__(self):
+        self.count = 0
+        self.invalid = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.last = None
+
+    def add(self, value):
+        self.last = value
+        if value is None:
+            self.invalid += 1
+            return
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def as_dict(self):
+        return {
+          'count': self.count,
+          'invalid': self.invalid,
+          'min': self.min,
+          'max': self.max,
+          'mean': self.mean if self.count else None,
+          'std': math.sqrt(self.m2 / self.count) if self.count else None,
+          'last': self.last,
+        }
+
+class MeasurementLogger(object):
+    """
+    Logs measurements of a :py:class:`ds1054z.DS1054Z` in a background thread.
+
+    The columns are named ``<channel>.<item>`` (like ``CHAN1.vpp``),
+    preceded by the column ``time`` (seconds since the epoch).
+    Invalid readings are stored as NaN.
+
+    :param ds: The scope
+    :param channels: The channels to measure on (names like CHAN1 or numbers)
+    :param items: The measurement items (see :py:meth:`ds1054z.DS1054Z.get_channel_measurement`)
+    :param float interval: The time between two readings in seconds
+    :param str type: Type of measurement, can be CURRent, MAXimum, MINimum, AVERages, DEViation
+    :param int capacity: The number of readings the ring buffer holds
+    :param str filename: The file to append the readings to (optional)
+    :param str file_format: 'csv' or 'bin'. The binary format consists of rows of
+                            little-endian doubles, one per column, without a header.
+    :param int flush_every: Write to the file after this many readings
+    """
+
+    def __init__(self, ds, channels, items, interval=1.0, type='CURRent', capacity=10000,
+                 filename=None, file_format='csv', flush_every=100):
+        if file_format not in ('csv', 'bin'):
+            raise NameError('Unknown file format: {0}'.format(file_format))
+        self.ds = ds
+        self.channels = [ds._interpret_channel(channel) for channel in channels]
+        self.items = list(items)
+        self.interval = interval
+        self.type = type
+        self.capacity = capacity
+        self.filename = filename
+        self.file_format = file_format
+        self.flush_every = min(flush_every, capacity)
+        self.columns = ['time'] + ['{0}.{1}'.format(ch, item) for ch in self.channels for item in self.items]
+        self._buffers = [array.array('d', bytes(8 * capacity)) for _ in self.columns]
+        self._stats = {column: RunningStatistics() for column in self.columns[1:]}
+        self._total = 0
+        self._unflushed = 0
+        self._lock = threading.Lock()
+        # serializes the writes to the file, the readings continue meanwhile
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """ Starts logging in a background thread """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='MeasurementLogger')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Stops the background thread and writes the remaining readings to the file """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        next_time = time.time()
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning('Measurement failed: {0}'.format(e))
+            next_time += self.interval
+            now = time.time()
+            if next_time < now:
+                # we fell behind: skip the missed readings instead of catching up
+                next_time = now
+            self._stop.wait(next_time - now)
+
+    def poll(self):
+        """ Takes a single reading (called by the background thread) """
+        now = time.time()
+        table = self.ds.get_channel_measurements(self.channels, self.items, type=self.type)
+        values = [table[ch][item] for ch in self.channels for item in self.items]
+        with self._lock:
+            pos = self._total % self.capacity
+            self._buffers[0][pos] = now
+            for column, buf, value in zip(self.columns[1:], self._buffers[1:], values):
+                buf[pos] = float('nan') if value is None else value
+                self._stats[column].add(value)
+            self._total += 1
+            self._unflushed += 1
+            flush = self._unflushed >= self.flush_every
+        if flush:
+            self.flush()
+
+    def _rows(self, count):
+        """ The last ``count`` readings from the ring buffer (call with the lock held) """
+        count = min(count, self._total, self.capacity)
+        first = self._total - count
+        return [[buf[i % self.capacity] for buf in self._buffers] for i in range(first, self._total)]
+
+    def flush(self):
+        """
+        Appends the readings not yet written to the file.
+        If writing fails, they are written with the next flush.
+        """
+        with self._flush_lock:
+            with self._lock:
+                count = self._unflushed
+                rows = self._rows(count)
+            if self.filename and rows:
+                self._write(rows)
+            with self._lock:
+                self._unflushed -= count
+
+    def _write(self, rows):
+        if self.file_format == 'csv':
+            new_file = not os.path.exists(self.filename)
+            with open(self.filename, 'a') as f:
+                if new_file:
+                    f.write(','.join(self.columns) + '\n')
+                for row in rows:
+                    f.write(','.join(repr(value) for value in row) + '\n')
+        else:
+            data = array.array('d', [value for row in rows for value in row])
+            if sys.byteorder == 'big':
+                data.byteswap()
+            with open(self.filename, 'ab') as f:
+                data.tofile(f)
+
+    def latest(self, count=1):
+        """
+        The most recent readings (oldest first).
+
+        :param int count: The number of readings (at most the capacity of the buffer)
+        :return: rows of values in the order of :py:attr:`columns`
+        :rtype: list of list
+        """
+        with self._lock:
+            return self._rows(count)
+
+    def statistics(self):
+        """
+        Summary statistics of all readings since the logger was created.
+
+        :return: {column: {'count', 'invalid', 'min', 'max', 'mean', 'std', 'last'}}
+        :rtype: dict
+        """
+        with self._lock:
+            return {column: stats.as_dict() for column, stats in self._stats.items()}
+
+    @property
+    def total(self):
+        """ The number of readings taken so far """
+        return self._total
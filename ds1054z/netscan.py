@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.netscan` - Unicast Discovery for Rigol DS1000Z-series scopes
+==========================================================================================
+
+On networks where multicast is blocked, the Zeroconf discovery in
+:py:mod:`ds1054z.discovery` won't find anything. This submodule
+sweeps an IP range instead: every address is probed concurrently
+for the raw SCPI port (and, optionally, for the VXI-11 portmapper)
+and each answering host is asked for its ``*IDN?`` string which has
+to match :py:attr:`ds1054z.DS1054Z.IDN_PATTERN`.
+
+>>> from ds1054z.netscan import scan_network
+>>> scan_network('192.168.0.0/24')
+[{'model': 'DS1054Z', 'ip': '192.168.0.23', 'idn': 'RIGOL TECHNOLOGIES,DS1054Z,...'}]
+
+In contrast to :py:mod:`ds1054z.discovery`, no additional packages are needed.
+As the identification is already known, it can be passed on to skip the
+``*IDN?`` round trip when connecting:
+
+>>> device = scan_network('192.168.0.0/24')[0]
+>>> scope = DS1054Z(device['ip'], idn=device['idn'])
+"""
+
+import ipaddress
+import re
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+from ds1054z import DS1054Z
+from ds1054z.transport import SCPI_PORT
+
+#: The ONC RPC portmapper port used by VXI-11
+PORTMAPPER_PORT = 111
+
+def _query_idn_raw(ip, port, timeout):
+    """
+    Connects to the raw SCPI port and asks for ``*IDN?``.
+
+    :return: The identification string or None if the host didn't answer.
+    """
+    try:
+        with socket.create_connection((ip, port), timeout=timeout) as sock:
+            sock.sendall(b'*IDN?\n')
+            answer = b''
+            while not answer.endswith(b'\n'):
+                chunk = sock.recv(256)
+                if not chunk:
+                    break
+                answer += chunk
+    except (socket.error, socket.timeout):
+        return None
+    return answer.decode(DS1054Z.ENCODING, 'replace').strip() or None
+
+def _query_idn_vxi11(ip, timeout):
+    """
+    Checks for a VXI-11 portmapper and, if present, asks for ``*IDN?`` via VXI-11.
+
+    :return: The identification string or None if the host didn't answer.
+    """
+    try:
+        socket.create_connection((ip, PORTMAPPER_PORT), timeout=timeout).close()
+    except (socket.error, socket.timeout):
+        return None
+    import vxi11
+    try:
+        instr = vxi11.Instrument(ip)
+        instr.timeout = timeout
+        try:
+            return instr.ask('*IDN?')
+        finally:
+            instr.close()
+    except Exception:
+        return None
+
+def probe_host(ip, port=SCPI_PORT, timeout=0.5, vxi11_fallback=True):
+    """
+    Probes a single host for a DS1000Z series scope.
+
+    :param str ip: The IP address to probe.
+    :param int port: The raw SCPI port to try first.
+    :param float timeout: Connect / read timeout in seconds.
+    :param bool vxi11_fallback: Try VXI-11 if the SCPI port is closed but a portmapper is running.
+    :return: The ``*IDN?`` string if a supported scope answered, None otherwise.
+    :rtype: str or None
+    """
+    idn = _query_idn_raw(ip, port, timeout)
+    if idn is None and vxi11_fallback:
+        idn = _query_idn_vxi11(ip, timeout)
+    if idn is None or not re.match(DS1054Z.IDN_PATTERN, idn):
+        return None
+    return idn
+
+def scan_network(network, port=SCPI_PORT, timeout=0.5, max_workers=128, vxi11_fallback=True):
+    """
+    Discovers Rigol DS1000Z series oscilloscopes by probing every host of an IP range.
+
+    The hosts are probed concurrently by a pool of at most ``max_workers`` threads.
+    With the default settings, a /24 network is swept in about one second.
+
+    :param str network: The IP range in CIDR notation, like ``'10.0.1.0/24'``. A single address works as well.
+    :param int port: The raw SCPI port to probe.
+    :param float timeout: Connect / read timeout per host in seconds.
+    :param int max_workers: The maximum number of hosts probed at the same time.
+    :param bool vxi11_fallback: Try VXI-11 if the SCPI port is closed but a portmapper is running.
+    :return: The list of discovered devices. Each entry is a dictionary containing a 'model', 'ip' and 'idn' entry.
+    :rtype: list of dict
+    """
+    network = ipaddress.ip_network(u'{0}'.format(network), strict=False)
+    hosts = [str(ip) for ip in network.hosts()] or [str(network.network_address)]
+    devices = []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(hosts))) as executor:
+        idns = executor.map(lambda ip: probe_host(ip, port, timeout, vxi11_fallback), hosts)
+        for ip, idn in zip(hosts, idns):
+            if idn is None:
+                continue
+            devices.append({
+              'model': idn.split(',')[1],
+              'ip': ip,
+              'idn': idn,
+            })
+    return devices
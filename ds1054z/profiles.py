@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.profiles` - Declarative scope configurations
+==========================================================================
+
+A profile describes the acquisition, timebase, channel and trigger settings
+of the scope as a (JSON compatible) dictionary:
+
+>>> profile = {
+...     'acquire':  {'type': 'NORMal', 'memory_depth': 'AUTO'},
+...     'timebase': {'mode': 'MAIN', 'delay_enable': False, 'scale': 50e-6, 'offset': 200e-6},
+...     'channels': {
+...         'CHAN1': {'probe_ratio': 1000, 'scale': 500, 'offset': -1000, 'coupling': 'DC'},
+...         'CHAN2': {'probe_ratio': 10, 'scale': 1, 'units': 'AMPere'},
+...     },
+...     'trigger':  {'mode': 'EDGE', 'source': 'CHANnel2', 'slope': 'POSitive', 'level': 0.5},
+... }
+>>> scope.apply_profile(profile)
+[':TIMebase:MAIN:SCALe 5e-05', ':CHAN2:PROBe 10.0']
+
+All sections and entries are optional. Applying a profile with
+:py:meth:`ds1054z.DS1054Z.apply_profile` reads back the current values
+of all settings mentioned in the profile in bulk and only sends those that differ.
+Scales and probe ratios are snapped to the nearest possible value beforehand,
+just like :py:meth:`ds1054z.DS1054Z.set_channel_scale` and friends do.
+"""
+
+import json
+import re
+
+#: (section, name, SCPI command, kind) in the order the settings need to be applied
+SCOPE_SETTINGS = (
+    ('acquire',  'type',          ':ACQuire:TYPE',          'enum'),
+    ('acquire',  'memory_depth',  ':ACQuire:MDEPth',        'memory_depth'),
+    ('timebase', 'mode',          ':TIMebase:MODE',         'enum'),
+    ('timebase', 'delay_enable',  ':TIMebase:DELay:ENABle', 'bool'),
+    ('timebase', 'scale',         ':TIMebase:MAIN:SCALe',   'timebase_scale'),
+    ('timebase', 'offset',        ':TIMebase:MAIN:OFFSet',  'float'),
+)
+
+#: (name, SCPI command, kind) of the settings per channel
+CHANNEL_SETTINGS = (
+    ('display',      'DISPlay',  'bool'),
+    ('coupling',     'COUPling', 'enum'),
+    ('bwlimit',      'BWLimit',  'enum'),
+    ('invert',       'INVert',   'bool'),
+    ('units',        'UNITs',    'enum'),
+    ('probe_ratio',  'PROBe',    'probe_ratio'),
+    ('scale',        'SCALe',    'channel_scale'),
+    ('offset',       'OFFSet',   'float'),
+)
+
+#: (section, name, SCPI command, kind) of the trigger settings, applied after the channels
+TRIGGER_SETTINGS = (
+    ('trigger',  'mode',          ':TRIGger:MODE',          'enum'),
+    ('trigger',  'source',        ':TRIGger:EDGe:SOURce',   'enum'),
+    ('trigger',  'slope',         ':TRIGger:EDGe:SLOPe',    'enum'),
+    ('trigger',  'noise_reject',  ':TRIGger:NREJect',       'bool'),
+    ('trigger',  'coupling',      ':TRIGger:COUPling',      'enum'),
+    ('trigger',  'level',         ':TRIGger:EDGe:LEVel',    'float'),
+)
+
+#: relative tolerance when comparing floating point settings
+FLOAT_TOLERANCE = 1e-4
+
+def load_profile(filename):
+    """
+    Loads a profile from a JSON file.
+
+    :param str filename: path to the JSON file
+    :rtype: dict
+    """
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+def short_form(value):
+    """
+    The SCPI short form of a keyword like ``'CHANnel2'`` -> ``'CHAN2'``.
+    Keywords given in all-uppercase letters are shortened according to the SCPI rules.
+    """
+    value = str(value).strip()
+    match = re.match(r'^([A-Za-z]+)(\d*)$', value)
+    if not match:
+        return value.upper()
+    letters, suffix = match.groups()
+    if letters != letters.upper():
+        letters = ''.join(c for c in letters if c.isupper())
+    elif len(letters) > 4:
+        letters = letters[:3] if letters[3] in 'AEIOU' else letters[:4]
+    return letters + suffix
+
+def _channel_name(channel):
+    channel = str(channel)
+    if channel.isdigit():
+        channel = 'CHAN' + channel
+    return short_form(channel)
+
+def profile_settings(profile):
+    """
+    Flattens a profile to a list of settings in the order they need to be applied.
+
+    :param dict profile: The profile
+    :return: A list of (command, kind, value, channel) tuples.
+             channel is None for settings not belonging to a channel.
+    :rtype: list of tuple
+    """
+    known_sections = ('acquire', 'timebase', 'channels', 'trigger')
+    for section in profile:
+        if section not in known_sections:
+            raise KeyError('Unknown profile section: {0}'.format(section))
+    settings = []
+    def add_section(section_settings, section):
+        entries = dict(profile.get(section) or {})
+        for sec, name, cmd, kind in section_settings:
+            if sec == section and name in entries:
+                settings.append((cmd, kind, entries.pop(name), None))
+        if entries:
+            raise KeyError('Unknown {0} settings: {1}'.format(section, ', '.join(entries)))
+    add_section(SCOPE_SETTINGS, 'acquire')
+    add_section(SCOPE_SETTINGS, 'timebase')
+    channels = {_channel_name(ch): entries for ch, entries in (profile.get('channels') or {}).items()}
+    for channel, entries in sorted(channels.items()):
+        entries = dict(entries)
+        for name, cmd, kind in CHANNEL_SETTINGS:
+            if name in entries:
+                settings.append((':{0}:{1}'.format(channel, cmd), kind, entries.pop(name), channel))
+        if entries:
+            raise KeyError('Unknown channel settings: {0}'.format(', '.join(entries)))
+    add_section(TRIGGER_SETTINGS, 'trigger')
+    return settings
+
+def format_value(kind, value):
+    """ The value as it is going to be sent to the scope """
+    if kind == 'bool':
+        return 'ON' if to_bool(value) else 'OFF'
+    return str(value)
+
+def to_bool(value):
+    if isinstance(value, str):
+        return value.strip().upper() in ('1', 'ON', 'TRUE')
+    return bool(value)
+
+def differs(kind, current, desired):
+    """
+    Compares the current answer of the scope (str) with the desired value.
+
+    :return: True if the setting needs to be sent to the scope
+    :rtype: bool
+    """
+    if kind == 'bool':
+        return to_bool(current) != to_bool(desired)
+    if kind == 'enum' or (kind == 'memory_depth' and str(desired).upper() == 'AUTO'):
+        return short_form(current) != short_form(desired)
+    try:
+        current, desired = float(current), float(desired)
+    except ValueError:
+        return True
+    return abs(current - desired) > FLOAT_TOLERANCE * max(abs(current), abs(desired))
@@ -1,16 +1,31 @@
 from jvframework.logger import log
 import asyncio
+import functools
+import threading
 import ds1054z
 import os
 import sys
 import json
 import ds1054z.api as dapi
+from ds1054z.catalog import CaptureCatalog
+from ds1054z.shm import CapturePublisher
 from jvframework.supervisor import start_supervisor
 from jvframework.misc import hdd_share, ssd_share, ensure_dir, json_decode, chmod
-from PIL import ImageFile
 
-ds = ds1054z.DS1054Z("10.0.1.106")
-ImageFile.LOAD_TRUNCATED_IMAGES = True
+# repeated reads of a stopped acquisition are served from memory
+ds = ds1054z.DS1054Z("10.0.1.106", cache_size=256 * 1024 * 1024)
+
+# index of all files saved below, kept on the local SSD
+catalog_dir = ssd_share("oscope")
+ensure_dir(catalog_dir, 0o777)
+catalog = CaptureCatalog(os.path.join(catalog_dir, "captures.sqlite"))
+
+# every waveform read is also published to local consumers (dashboard, analyzer, ...)
+# via shared memory, see ds1054z.shm.CaptureSubscriber; a slot holds 24M BYTE samples
+publisher = CapturePublisher("ds1054z_oscope", slots=8, slot_size=24 * 1000 * 1000)
+
+# set by the "cancel_transfer" api to abort a running save_data
+cancel_transfer = threading.Event()
 
 
 async def do_work(api, *args, logger=None, **kwargs):
@@ -59,8 +74,11 @@ async def do_work(api, *args, logger=None, **kwargs):
             ), "Require channel and path arguments for saving waveform"
             work_dir = hdd_share(args[0])
             ensure_dir(work_dir)
-            channels = args[1:]
-            return dapi.save_waveform_simple(ds, work_dir, channels)
+            filename = args[1]
+            channels = args[2:]
+            return dapi.save_waveform_simple(
+                ds, work_dir, filename, channels, catalog=catalog, publisher=publisher
+            )
         if api == "trigger_single":
             ds.single()
         if api in ["trigger_force", "force_trigger"]:
@@ -110,6 +128,9 @@ async def do_work(api, *args, logger=None, **kwargs):
             ) as f:
                 log("Opened file for writing:", json_file)
                 json.dump(js, f, indent=2)
+            catalog.register(
+                json_file, "json", info=js if isinstance(js, dict) else None
+            )
             return True
         if api in ["screenshot_simple", "screenshot"]:
             """
@@ -122,15 +143,38 @@ async def do_work(api, *args, logger=None, **kwargs):
             ensure_dir(work_dir, 0o777)
             filename = args[1]
             filepath = os.path.join(work_dir, filename)
-            return dapi.screenshot_simple(ds, filepath)
+            return dapi.screenshot_simple(ds, filepath, catalog=catalog)
         if api in ["screenshot_fancy"]:
             work_dir = hdd_share(args[0])
             ensure_dir(work_dir, 0o777)
             filename = args[1]
             filepath = os.path.join(work_dir, filename)
-            return dapi.screenshot_fancy(ds, filepath, *args, **kwargs)
+            return dapi.screenshot_fancy(ds, filepath, *args, catalog=catalog, **kwargs)
         if api == "initial_setup":
-            return dapi.initial_setup(ds)
+            return dapi.initial_setup(ds, *args)
+        if api == "apply_profile":
+            """
+            Apply a JSON configuration profile, only sending changed settings
+            args[0]: work_dir
+            args[1]: filename
+            """
+            assert len(args) >= 2, "Require (path, filename) arguments for the profile"
+            filepath = os.path.join(hdd_share(args[0]), args[1])
+            return dapi.apply_profile(ds, filepath)
+        if api in ["save_setup", "restore_setup"]:
+            """
+            Save the scope setup to / restore it from a binary file
+            args[0]: work_dir
+            args[1]: filename
+            kwargs: force=True to restore even if the setup seems active already
+            """
+            assert len(args) >= 2, "Require (path, filename) arguments for the setup file"
+            work_dir = hdd_share(args[0])
+            ensure_dir(work_dir, 0o777)
+            filepath = os.path.join(work_dir, args[1])
+            if api == "save_setup":
+                return dapi.save_setup(ds, filepath)
+            return dapi.restore_setup(ds, filepath, force=kwargs.get("force", False))
         if api == "save_data":
             """
             Save screenshot to file pulse_waveform_screenshot.png
@@ -140,7 +184,36 @@ async def do_work(api, *args, logger=None, **kwargs):
             work_dir = hdd_share(args[0])
             filename = args[1]
             ensure_dir(work_dir, 0o777)
-            return dapi.save_data(ds, work_dir, filename, *args, **kwargs)
+            # run in a worker thread so a "cancel_transfer" request can come in meanwhile
+            cancel_transfer.clear()
+            kwargs["cancel"] = cancel_transfer
+            kwargs["catalog"] = catalog
+            kwargs["publisher"] = publisher
+            work = functools.partial(
+                dapi.save_data, ds, work_dir, filename, *args, **kwargs
+            )
+            return await asyncio.get_event_loop().run_in_executor(None, work)
+        if api == "publish_capture":
+            """
+            Read waveforms and only publish them to shared memory, no file is written
+            args: CHAN1 CHAN2 ... (default: the displayed channels)
+            kwargs: mode="RAW" for the internal memory
+            returns the sequence numbers of the captures (see ds1054z.shm)
+            """
+            cancel_transfer.clear()
+            kwargs["cancel"] = cancel_transfer
+            work = functools.partial(
+                dapi.publish_capture, ds, publisher, *args, **kwargs
+            )
+            return await asyncio.get_event_loop().run_in_executor(None, work)
+        if api == "find_captures":
+            """
+            Look up saved captures in the catalog
+            kwargs: see ds1054z.catalog.CaptureCatalog.find, e.g.
+                    since=<epoch seconds>, channel="CHAN2",
+                    conditions=[["CHAN2", "vmax", ">", 3.0]]
+            """
+            return catalog.find(**kwargs)
         if api == "single_mode":
             return dapi.single_mode(ds)
         if api == "test":
@@ -155,7 +228,40 @@ async def do_work(api, *args, logger=None, **kwargs):
         return {"error (server)": str(e)}
 
 
+async def handle_packet(spvrc, recv_packet, scope_lock):
+    if "args" not in recv_packet:
+        log("No args found", logger=spvrc["logger"])
+        recv_packet["args"] = []
+    if "kwargs" not in recv_packet:
+        log("No kwargs found", logger=spvrc["logger"])
+        recv_packet["kwargs"] = {}
+
+    if recv_packet["api"] == "cancel_transfer":
+        # doesn't wait for the scope: it is busy with the transfer to cancel
+        cancel_transfer.set()
+        result = True
+    else:
+        async with scope_lock:
+            result = await do_work(
+                recv_packet["api"],
+                *recv_packet["args"],
+                logger=spvrc["logger"],
+                **recv_packet["kwargs"],
+            )
+    resp_packet = dict(recv_packet)
+    resp_packet.update({"result": result})
+
+    spvrc["to"].put(resp_packet)
+    log(
+        "Main thread sending packet to Supervisor: ",
+        resp_packet,
+        logger=spvrc["logger"],
+    )
+
+
 async def main():
+    # only one request talks to the scope at a time
+    scope_lock = asyncio.Lock()
     spvrc = start_supervisor(
         service_topic="jvber/tb0/oscope",
         client_id="spvr_tb0_oscope",
@@ -165,37 +271,22 @@ async def main():
 
     while True:
         try:
-            if not spvrc["from"].empty():
-                recv_packet = spvrc["from"].get()
-                log(
-                    "Main thread recieved packet from Supervisor: ",
-                    recv_packet,
-                    logger=spvrc["logger"],
-                )
-
-                if "api" in recv_packet:
-                    if "args" not in recv_packet:
-                        log("No args found", logger=spvrc["logger"])
-                        recv_packet["args"] = []
-                    if "kwargs" not in recv_packet:
-                        log("No kwargs found", logger=spvrc["logger"])
-                        recv_packet["kwargs"] = {}
-
-                    result = await do_work(
-                        recv_packet["api"],
-                        *recv_packet["args"],
-                        logger=spvrc["logger"],
-                        **recv_packet["kwargs"],
-                    )
-                    resp_packet = dict(recv_packet)
-                    resp_packet.update({"result": result})
-
-                spvrc["to"].put(resp_packet)
-                log(
-                    "Main thread sending packet to Supervisor: ",
-                    resp_packet,
-                    logger=spvrc["logger"],
-                )
+            if spvrc["from"].empty():
+                # let the running requests proceed
+                await asyncio.sleep(0.01)
+                continue
+            recv_packet = spvrc["from"].get()
+            log(
+                "Main thread recieved packet from Supervisor: ",
+                recv_packet,
+                logger=spvrc["logger"],
+            )
+
+            if "api" in recv_packet:
+                # handled concurrently, so a cancel_transfer isn't stuck behind the transfer
+                asyncio.ensure_future(handle_packet(spvrc, recv_packet, scope_lock))
+            else:
+                spvrc["to"].put(dict(recv_packet))
 
         except Exception as e:
             log("Exception (main)", e)
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.shm` - Sharing captures with local processes
+==========================================================================
+
+The process talking to the scope publishes every capture into a ring of
+slots in shared memory (:py:mod:`multiprocessing.shared_memory`). Any number
+of other processes on the same machine read them from there without a
+copy, without a round trip through the file system and without disturbing
+the publisher:
+
+>>> from ds1054z.shm import CapturePublisher
+>>> publisher = CapturePublisher('ds1054z', slots=4, slot_size=24000000)
+>>> publisher.publish(scope.get_waveform(1, mode='RAW'))
+1
+
+and in the consumer:
+
+>>> from ds1054z.shm import CaptureSubscriber
+>>> with CaptureSubscriber('ds1054z') as subscriber:
+...     for frame in subscriber:
+...         vmax = max(frame.waveform().volts)
+...         if frame.valid():  # not overwritten while it was processed
+...             print(frame.seq, frame.channel, vmax)
+...         frame.release()
+
+Each slot starts with a header (sequence number, time, channel, mode,
+format, first sample, mask, length and preamble) followed by the waveform
+data. The publisher writes a slot like a sequence lock: it first writes
+the new sequence number to the start of the header, then the data and the
+rest of the header and finally the sequence number again at the end of
+the header. A slot whose two numbers differ is being written. The data of
+a :py:class:`CaptureFrame` is a :py:class:`memoryview` into the shared
+memory, which stays valid until the publisher comes around the ring
+to the same slot again (after ``slots - 1`` further captures).
+:py:meth:`CaptureFrame.valid` tells whether that happened.
+
+A subscriber waiting for captures polls the sequence number of the
+latest one every 0.5 ms by default. With ``poll=0`` it spins instead and
+sees a new capture within microseconds, at the cost of a busy CPU core.
+``tests/bench_shm.py`` measures this with a consumer in another process:
+publishing 24M samples takes a few milliseconds (copying them into the slot),
+after which the consumer has them within about 0.1 ms (spinning) or 0.3 ms
+(polling).
+"""
+
+import struct
+import time
+
+from multiprocessing import shared_memory
+
+from ds1054z import Waveform
+
+#: Identifies the shared memory of a publisher
+MAGIC = b'DS1Z'
+
+FORMAT_VERSION = 1
+
+# magic, version, slots, slot size, latest sequence number
+_HEADER = struct.Struct('<4sIIQQ')
+_HEADER_SIZE = 64
+
+# sequence number (begin), time, channel, mode, format, first sample, mask (begin, end), length,
+# preamble (4 integers and 6 floats), sequence number (end)
+_SLOT = struct.Struct('<Qd16s8s8sqqqq4q6dQ')
+_SLOT_HEADER_SIZE = 256
+
+_LATEST = _HEADER.size - 8
+_SEQ_END = _SLOT.size - 8
+
+def _untracked(name, create=False, size=0):
+    """
+    Opens shared memory without the resource tracker removing it when this process ends:
+    it has to survive a restart of the publisher, only :py:meth:`CapturePublisher.close` removes it.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    except TypeError:
+        # before Python 3.13, every process using the memory registers it for removal
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+def _unlink(shm):
+    """ Removes shared memory opened with :py:func:`_untracked` """
+    if not hasattr(shm, '_track'):
+        # before Python 3.13, unlink() unregisters the memory from the resource tracker
+        from multiprocessing import resource_tracker
+        resource_tracker.register(shm._name, 'shared_memory')
+    shm.unlink()
+
+def _text(value):
+    return value.rstrip(b'\0').decode('ascii') or None
+
+class CaptureFrame(object):
+    """
+    A capture in a slot of the shared memory (see :py:meth:`CaptureSubscriber.latest`).
+
+    The attributes are those of :py:class:`ds1054z.Waveform` plus:
+
+    :ivar int seq: The sequence number of the capture (counting from 1)
+    :ivar float timestamp: The time it was published (seconds since the epoch)
+    :ivar memoryview data: The waveform data, directly in the shared memory
+    """
+
+    def __init__(self, buf, offset, seq):
+        values = _SLOT.unpack_from(buf, offset)
+        self.seq = seq
+        self.timestamp = values[1]
+        self.channel, self.mode, self.fmt = (_text(value) for value in values[2:5])
+        self.first = values[5]
+        self.mask = tuple(values[6:8]) if values[6] >= 0 else None
+        length = values[8]
+        self.preamble = values[9:19]
+        self._buf = buf
+        self._offset = offset
+        start = offset + _SLOT_HEADER_SIZE
+        self.data = buf[start:start+length]
+
+    def valid(self):
+        """ Whether the slot still holds this capture (and thus the data is intact) """
+        return struct.unpack_from('<Q', self._buf, self._offset)[0] == self.seq
+
+    def waveform(self, copy=False):
+        """
+        The capture as :py:class:`ds1054z.Waveform`.
+
+        :param bool copy: Copy the data out of the shared memory (so it stays
+                          intact even after the publisher reused the slot)
+        :rtype: ds1054z.Waveform
+        """
+        data = bytes(self.data) if copy else self.data
+        return Waveform(data, self.preamble, channel=self.channel, mode=self.mode, fmt=self.fmt,
+                        first=self.first, mask=self.mask)
+
+    def release(self):
+        """ Releases the view into the shared memory (needed before the subscriber is closed) """
+        self.data.release()
+
+    def __repr__(self):
+        return '<CaptureFrame {0} of {1}, {2} bytes>'.format(self.seq, self.channel, len(self.data))
+
+class CapturePublisher(object):
+    """
+    Publishes captures to a ring of slots in shared memory.
+
+    There must be only one publisher per name. If shared memory of
+    the same name and layout exists already (left by a previous publisher),
+    it is reused and the sequence numbers continue, so the subscribers
+    don't have to reconnect. For that, the shared memory outlives the
+    process of the publisher: only ``close(unlink=True)`` removes it.
+
+    :param str name: The name of the shared memory
+    :param int slots: The number of captures kept
+    :param int slot_size: The maximum size of the waveform data of a capture in bytes
+    :ivar int seq: The sequence number of the latest capture (0 before the first one)
+    """
+
+    def __init__(self, name='ds1054z', slots=4, slot_size=24000000):
+        self.name = name
+        self.slots = slots
+        self.slot_size = slot_size
+        size = _HEADER_SIZE + slots * (_SLOT_HEADER_SIZE + slot_size)
+        try:
+            self._shm = _untracked(name, create=True, size=size)
+        except FileExistsError:
+            self._shm = _untracked(name)
+            if _HEADER.unpack_from(self._shm.buf, 0)[:4] == (MAGIC, FORMAT_VERSION, slots, slot_size):
+                self.seq = _HEADER.unpack_from(self._shm.buf, 0)[4]
+                return
+            self._shm.close()
+            _unlink(self._shm)
+            self._shm = _untracked(name, create=True, size=size)
+        self.seq = 0
+        _HEADER.pack_into(self._shm.buf, 0, MAGIC, FORMAT_VERSION, slots, slot_size, 0)
+
+    def publish(self, waveform, timestamp=None):
+        """
+        Copies a capture into the next slot.
+
+        :param waveform: The capture
+        :type waveform: ds1054z.Waveform
+        :param float timestamp: The time of the capture, defaults to now
+        :return: The sequence number of the capture
+        :rtype: int
+        """
+        length = len(waveform.data)
+        if length > self.slot_size:
+            raise ValueError('{0} bytes of waveform data exceed the slot size of {1}'.format(length, self.slot_size))
+        buf = self._shm.buf
+        seq = self.seq + 1
+        offset = _HEADER_SIZE + ((seq - 1) % self.slots) * (_SLOT_HEADER_SIZE + self.slot_size)
+        # mark the slot as being written, readers of the previous capture in it see it invalid from now on
+        struct.pack_into('<Q', buf, offset, seq)
+        start = offset + _SLOT_HEADER_SIZE
+        buf[start:start+length] = waveform.data
+        mask = waveform.mask or (-1, -1)
+        preamble = tuple(waveform.preamble)
+        _SLOT.pack_into(buf, offset, seq, time.time() if timestamp is None else timestamp,
+                        (waveform.channel or '').encode('ascii'), (waveform.mode or '').encode('ascii'),
+                        waveform.fmt.encode('ascii'), waveform.first, mask[0], mask[1], length,
+                        *(tuple(int(v) for v in preamble[:4]) + tuple(float(v) for v in preamble[4:]) + (0,)))
+        # the slot is complete
+        struct.pack_into('<Q', buf, offset + _SEQ_END, seq)
+        struct.pack_into('<Q', buf, _LATEST, seq)
+        self.seq = seq
+        return seq
+
+    def close(self, unlink=True):
+        """
+        Detaches from the shared memory.
+
+        :param bool unlink: Also remove the shared memory (new subscribers can't attach anymore)
+        """
+        self._shm.close()
+        if unlink:
+            _unlink(self._shm)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CaptureSubscriber(object):
+    """
+    Reads the captures of a :py:class:`CapturePublisher` from shared memory.
+
+    :param str name: The name of the shared memory
+    :param float poll: The time between two checks for a new capture in seconds (0: busy waiting)
+    :ivar int seq: The sequence number of the last capture returned by :py:meth:`wait`
+    """
+
+    def __init__(self, name='ds1054z', poll=0.0005):
+        self.name = name
+        self.poll = poll
+        self._shm = _untracked(name)
+        magic, version, self.slots, self.slot_size, self.seq = _HEADER.unpack_from(self._shm.buf, 0)
+        if magic != MAGIC or version > FORMAT_VERSION:
+            self._shm.close()
+            raise IOError('Not the shared memory of a capture publisher: {0}'.format(name))
+
+    @property
+    def latest_seq(self):
+        """ The sequence number of the latest capture published """
+        return struct.unpack_from('<Q', self._shm.buf, _LATEST)[0]
+
+    def frame(self, seq):
+        """
+        The capture of the given sequence number.
+
+        :return: The capture or None if it isn't in the ring (anymore) or being overwritten
+        :rtype: CaptureFrame
+        """
+        if seq < 1:
+            return None
+        buf = self._shm.buf
+        offset = _HEADER_SIZE + ((seq - 1) % self.slots) * (_SLOT_HEADER_SIZE + self.slot_size)
+        if struct.unpack_from('<Q', buf, offset + _SEQ_END)[0] != seq:
+            return None
+        frame = CaptureFrame(buf, offset, seq)
+        if not frame.valid():
+            frame.release()
+            return None
+        return frame
+
+    def latest(self):
+        """
+        The latest capture.
+
+        :return: The capture or None if nothing was published yet
+        :rtype: CaptureFrame
+        """
+        while True:
+            seq = self.latest_seq
+            if not seq:
+                return None
+            frame = self.frame(seq)
+            if frame is not None:
+                return frame
+
+    def wait(self, timeout=None):
+        """
+        Waits for the next capture after the one returned before.
+
+        Captures are skipped if the subscriber falls behind by more than the
+        ring holds, so :py:attr:`CaptureFrame.seq` may jump.
+
+        :param float timeout: The maximum time to wait in seconds (None: forever)
+        :return: The capture or None on timeout
+        :rtype: CaptureFrame
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            latest = self.latest_seq
+            if latest > self.seq:
+                for seq in range(max(self.seq + 1, latest - self.slots + 1), latest + 1):
+                    frame = self.frame(seq)
+                    if frame is not None:
+                        self.seq = seq
+                        return frame
+            if deadline is not None and time.time() >= deadline:
+                return None
+            if self.poll:
+                time.sleep(self.poll)
+
+    def __iter__(self):
+        """ Waits for one new capture after the other """
+        while True:
+            yield self.wait()
+
+    def close(self):
+        """ Detaches from the shared memory. All frames have to be released before. """
+        self._shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
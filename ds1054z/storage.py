@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.storage` - Compressed capture files
+==================================================================
+
+Captures are written to files compressed on the fly, chunk by chunk as the
+data arrives from the scope, so a deep memory read never has to be held
+in memory as a whole:
+
+>>> from ds1054z.storage import save_capture, load_waveform
+>>> save_capture(scope, 1, 'pulse_0001.cap.gz', mode='RAW')
+>>> waveform = load_waveform('pulse_0001.cap.gz')
+>>> waveform.volts
+
+The codecs are ``'gzip'`` and ``'lzma'`` of the standard library and ``'zstd'``
+if the Python package :py:mod:`zstandard` is installed (``pip install ds1054z[zstd]``).
+When reading, the codec is detected from the first bytes of the file.
+
+8 bit samples (``fmt='BYTE'``) are passed through a delta filter before
+compression: every byte is replaced by its difference to the previous one
+(modulo 256). A signal sampled much faster than it changes then turns into
+a few small values, which compress much better than the ADC values
+themselves. The filter is lossless.
+
+A capture file is the compressed stream of a JSON header line (channel, mode,
+format, preamble, filter, ...) followed by the waveform data.
+
+``tests/bench_storage.py`` compares the codecs and levels on pulse data
+and on an oversampled sine, both with 1 ADC count of noise. gzip at level 1
+with the delta filter compresses both about 2.5 times at roughly 40 MB/s,
+well ahead of the transfer from the scope, which makes it the default.
+Higher gzip levels gain about 10 % at a sixth of the speed; lzma gains
+about 25 % but writes only about 1 MB/s. Without the delta filter,
+the sine compresses only 1.7 times. On the noisy pulses, the filter makes
+no difference either way.
+"""
+
+import functools
+import gzip
+import io
+import json
+import lzma
+
+from ds1054z import DS1054Z, Waveform
+
+#: The codec used if none is given
+DEFAULT_CODEC = 'gzip'
+
+#: The compression level used for each codec if none is given
+DEFAULT_LEVELS = {'gzip': 1, 'lzma': 6, 'zstd': 3}
+
+#: The codecs by file name extension (see :py:func:`codec_from_filename`)
+EXTENSIONS = {'.gz': 'gzip', '.xz': 'lzma', '.zst': 'zstd'}
+
+#: The first bytes of a file compressed with each codec
+MAGIC = {b'\x1f\x8b': 'gzip', b'\xfd7zXZ\x00': 'lzma', b'\x28\xb5\x2f\xfd': 'zstd'}
+
+#: Identifies the header line of a capture file
+FORMAT_NAME = 'ds1054z-capture'
+
+FORMAT_VERSION = 1
+
+# The filters work on blocks of this many bytes at a time,
+# small enough for the intermediate integers to stay in the CPU cache
+_BLOCK_SIZE = 8192
+
+def codec_from_filename(filename):
+    """
+    The codec belonging to the extension of a file name.
+
+    :return: (filename without the compression extension, codec) with codec being None for other extensions
+    :rtype: tuple
+    """
+    for extension, codec in EXTENSIONS.items():
+        if filename.endswith(extension):
+            return filename[:-len(extension)], codec
+    return filename, None
+
+def detect_codec(path):
+    """ The codec a file was compressed with (None for an uncompressed file) """
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for magic, codec in MAGIC.items():
+        if head.startswith(magic):
+            return codec
+    return None
+
+def open_compressed(path, mode='rb', codec=DEFAULT_CODEC, level=None, encoding=None, newline=None):
+    """
+    Opens a file for streaming through a codec.
+
+    :param str path: The file name
+    :param str mode: 'rb', 'wb', 'rt' or 'wt'. Text modes take encoding and newline as :py:func:`open` does.
+    :param str codec: 'gzip', 'lzma', 'zstd' or None (no compression).
+                      It is detected from the file contents when reading.
+    :param int level: The compression level (see :py:data:`DEFAULT_LEVELS`)
+    :return: A file object
+    """
+    reading = mode.startswith('r')
+    if reading:
+        codec = detect_codec(path)
+    elif level is None:
+        level = DEFAULT_LEVELS.get(codec)
+    binary_mode = mode[0] + 'b'
+    if codec is None:
+        f = open(path, binary_mode)
+    elif codec == 'gzip':
+        f = gzip.open(path, binary_mode) if reading else gzip.open(path, binary_mode, compresslevel=level)
+    elif codec == 'lzma':
+        f = lzma.open(path, binary_mode, preset=level)
+    elif codec == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('The zstd codec depends on the zstandard package (pip install ds1054z[zstd])')
+        raw = open(path, binary_mode)
+        if reading:
+            f = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        else:
+            f = zstandard.ZstdCompressor(level=level).stream_writer(raw, closefd=True)
+    else:
+        raise NameError('Unknown codec: {0}'.format(codec))
+    if 't' in mode:
+        f = io.TextIOWrapper(f, encoding=encoding, newline=newline)
+    return f
+
+@functools.lru_cache(maxsize=4)
+def _masks(n):
+    """ The high bit and the low seven bits of each of n bytes, as integers """
+    high = int.from_bytes(b'\x80' * n, 'little')
+    return high, high - (high >> 7)
+
+def delta_encode(data, previous=0):
+    """
+    Replaces each byte by its difference to the previous one (modulo 256).
+
+    The bytes are processed as large integers, subtracting all of them
+    at once without borrows between neighbours.
+
+    :param data: The 8 bit samples (bytes-like)
+    :param int previous: The sample before the data (the last one of the previous chunk of a stream)
+    :rtype: bytes
+    """
+    data = bytes(data)
+    blocks = []
+    for pos in range(0, len(data), _BLOCK_SIZE):
+        block = data[pos:pos+_BLOCK_SIZE]
+        n = len(block)
+        high, low = _masks(n)
+        a = int.from_bytes(block, 'little')
+        b = ((a << 8) | previous) & ((1 << (8 * n)) - 1)
+        blocks.append((((a | high) - (b & low)) ^ ((a ^ b ^ high) & high)).to_bytes(n, 'little'))
+        previous = block[-1]
+    return b''.join(blocks)
+
+def delta_decode(data, previous=0):
+    """
+    Reverts :py:func:`delta_encode` by summing up the differences (modulo 256).
+
+    Each block is summed up as a large integer adding shifted copies
+    of itself (1, 2, 4, ... bytes), then the last sample of the previous
+    block is added to all of its bytes.
+
+    :param data: The delta filtered bytes
+    :param int previous: The last sample decoded before (of the previous chunk of a stream)
+    :rtype: bytes
+    """
+    data = bytes(data)
+    blocks = []
+    for pos in range(0, len(data), _BLOCK_SIZE):
+        block = data[pos:pos+_BLOCK_SIZE]
+        n = len(block)
+        high, low = _masks(n)
+        mask = (1 << (8 * n)) - 1
+        x = int.from_bytes(block, 'little')
+        shift = 8
+        while shift < 8 * n:
+            y = (x << shift) & mask
+            x = ((x & low) + (y & low)) ^ ((x ^ y) & high)
+            shift <<= 1
+        block = x.to_bytes(n, 'little')
+        if previous:
+            block = block.translate(bytes(range(previous, 256)) + bytes(range(previous)))
+        blocks.append(block)
+        previous = block[-1]
+    return b''.join(blocks)
+
+class CaptureWriter(object):
+    """
+    Writes the waveform data of one channel to a compressed capture file, chunk by chunk.
+
+    The arguments describing the data are those of :py:class:`ds1054z.Waveform`.
+
+    :param str path: The file to write
+    :param preamble: The :py:attr:`ds1054z.DS1054Z.waveform_preamble` of the data
+    :param str codec: 'gzip', 'lzma', 'zstd' or None (no compression)
+    :param int level: The compression level (see :py:data:`DEFAULT_LEVELS`)
+    :param bool delta: Whether to apply the delta filter, by default only for BYTE data
+    :ivar int nbytes: The number of data bytes written so far
+    """
+
+    def __init__(self, path, preamble, channel=None, mode=None, fmt='BYTE', first=1, mask=None,
+                 codec=DEFAULT_CODEC, level=None, delta=None):
+        if delta is None:
+            delta = fmt.upper().startswith('BYT')
+        self.path = path
+        self.header = {
+            'format': FORMAT_NAME, 'version': FORMAT_VERSION, 'filter': 'delta' if delta else None,
+            'channel': channel, 'mode': mode, 'fmt': fmt, 'first': first,
+            'mask': list(mask) if mask else None, 'preamble': list(preamble),
+        }
+        self.nbytes = 0
+        self._previous = 0
+        self._file = open_compressed(path, 'wb', codec, level)
+        self._file.write(json.dumps(self.header).encode('utf-8') + b'\n')
+
+    def write(self, data):
+        """ Appends waveform data (bytes-like) """
+        if not data:
+            return
+        if self.header['filter'] == 'delta':
+            data, self._previous = delta_encode(data, self._previous), data[-1]
+        self._file.write(data)
+        self.nbytes += len(data)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CaptureReader(object):
+    """
+    Reads a capture file written by :py:class:`CaptureWriter`.
+
+    :param str path: The file to read (the codec is detected)
+    :ivar dict header: The description of the data (channel, mode, fmt, first, mask, preamble, filter)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open_compressed(path, 'rb')
+        head = b''
+        while b'\n' not in head:
+            more = self._file.read(4096)
+            if not more:
+                break
+            head += more
+        line, _, self._pending = head.partition(b'\n')
+        try:
+            self.header = json.loads(line.decode('utf-8'))
+        except ValueError:
+            self.header = None
+        if not isinstance(self.header, dict) or self.header.get('format') != FORMAT_NAME:
+            self._file.close()
+            raise IOError('Not a capture file: {0}'.format(path))
+        if self.header['version'] > FORMAT_VERSION:
+            self._file.close()
+            raise IOError('Unsupported capture file version: {0}'.format(self.header['version']))
+
+    def iter_chunks(self, chunk_size=1024*1024):
+        """
+        Reads the waveform data chunk by chunk.
+
+        :param int chunk_size: The number of bytes to decompress at a time
+        :return: generator of (offset, chunk) tuples like :py:meth:`ds1054z.DS1054Z.iter_waveform_chunks`
+                 (with the offset counted in bytes)
+        """
+        previous = 0
+        offset = 0
+        pending, self._pending = self._pending, b''
+        while True:
+            data = pending + self._file.read(chunk_size)
+            pending = b''
+            if not data:
+                return
+            if self.header['filter'] == 'delta':
+                data = delta_decode(data, previous)
+                previous = data[-1]
+            yield offset, data
+            offset += len(data)
+
+    def read(self):
+        """ All of the (remaining) waveform data as bytes """
+        return b''.join(chunk for offset, chunk in self.iter_chunks())
+
+    def waveform(self):
+        """
+        All of the waveform data as :py:class:`ds1054z.Waveform`.
+
+        :rtype: ds1054z.Waveform
+        """
+        header = self.header
+        return Waveform(self.read(), header['preamble'], channel=header['channel'], mode=header['mode'],
+                        fmt=header['fmt'], first=header['first'],
+                        mask=tuple(header['mask']) if header['mask'] else None)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def save_waveform(waveform, path, codec=DEFAULT_CODEC, level=None, delta=None):
+    """
+    Saves a :py:class:`ds1054z.Waveform` to a capture file.
+
+    Arguments as for :py:class:`CaptureWriter`.
+    """
+    with CaptureWriter(path, waveform.preamble, channel=waveform.channel, mode=waveform.mode, fmt=waveform.fmt,
+                       first=waveform.first, mask=waveform.mask, codec=codec, level=level, delta=delta) as writer:
+        writer.write(waveform.data)
+
+def load_waveform(path):
+    """
+    Loads a capture file as :py:class:`ds1054z.Waveform`.
+
+    :rtype: ds1054z.Waveform
+    """
+    with CaptureReader(path) as reader:
+        return reader.waveform()
+
+def save_capture(ds, channel, path, mode='RAW', fmt='BYTE', start=None, stop=None, time_range=None,
+                 codec=DEFAULT_CODEC, level=None, delta=None, prefetch=2, progress=None, cancel=None):
+    """
+    Reads the waveform of a channel and saves it to a capture file.
+
+    Reads of the internal memory (modes RAW and MAXimum) are streamed:
+    each chunk is compressed and written while the next ones are
+    transferred in a background thread (see :py:meth:`ds1054z.DS1054Z.iter_waveform_chunks`).
+    If the transfer fails or is cancelled, the file is left incomplete.
+
+    :param ds: The scope
+    :param path: The file to write
+    :param int prefetch: The number of chunks to read ahead
+    Other arguments as for :py:meth:`ds1054z.DS1054Z.get_waveform` and :py:class:`CaptureWriter`.
+    :return: The number of data bytes saved
+    :rtype: int
+    """
+    channel = ds._interpret_channel(channel)
+    if mode.upper().startswith('NORM'):
+        waveform = ds.get_waveform(channel, mode=mode, fmt=fmt, start=start, stop=stop, time_range=time_range,
+                                   progress=progress, cancel=cancel)
+        save_waveform(waveform, path, codec=codec, level=level, delta=delta)
+        return len(waveform.data)
+    # the preamble read along with selecting the source (not queried again)
+    preamble, chunks = ds._iter_waveform_chunks(channel, mode, fmt, start, stop, time_range, prefetch, progress, cancel)
+    keys = 'fmt, typ, pnts, cnt, xinc, xorig, xref, yinc, yorig, yref'.split(', ')
+    first = DS1054Z.waveform_window(dict(zip(keys, preamble)), start, stop, time_range)[0]
+    with CaptureWriter(path, preamble, channel=channel, mode=mode, fmt=fmt, first=first,
+                       codec=codec, level=level, delta=delta) as writer:
+        for offset, chunk in chunks:
+            writer.write(chunk)
+    return writer.nbytes
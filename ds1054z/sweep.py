@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.sweep` - Parameter sweeps with batched acquisition
+================================================================================
+
+A sweep steps through a grid of scope settings, captures the requested
+channels at every point and streams the waveform data to a
+:py:class:`ColumnStore` on disk:
+
+>>> from ds1054z.sweep import Sweep
+>>> grid = {
+...     'timebase.scale': [1e-6, 10e-6, 100e-6],
+...     'channels.CHAN1.scale': [0.1, 1.0],
+...     'trigger.level': [0.05, 0.5],
+... }
+>>> sweep = Sweep(scope, grid, channels=['CHAN1', 'CHAN2'], directory='sweep_data')
+>>> store = sweep.run()
+
+The parameters are named like ``<section>.<setting>`` or ``channels.<channel>.<setting>``
+after the entries of a profile (see :py:mod:`ds1054z.profiles`).
+The last parameter of the grid varies fastest. Per step, only the settings
+that changed with respect to the previous step are sent to the scope.
+
+Steps already found in the store are skipped, so an interrupted sweep can
+be resumed by simply running it again with the same directory.
+
+The frames of a waveform recording (see :py:meth:`ds1054z.DS1054Z.start_recording`)
+can be downloaded into the same kind of store with :py:func:`save_recorded_frames`.
+"""
+
+import itertools
+import json
+import os
+
+from ds1054z import Waveform
+
+def expand_grid(grid):
+    """
+    All combinations of the parameter values in the grid.
+
+    :param grid: The parameter names and their values
+    :type grid: dict or list of (name, values) tuples
+    :return: One dictionary of parameter values per step
+    :rtype: list of dict
+    """
+    items = list(grid.items()) if isinstance(grid, dict) else list(grid)
+    names = [name for name, values in items]
+    return [dict(zip(names, values)) for values in itertools.product(*(values for name, values in items))]
+
+def params_to_profile(params):
+    """
+    Converts sweep parameters like ``{'channels.CHAN1.scale': 0.1}`` to a profile.
+
+    :rtype: dict
+    """
+    profile = {}
+    for name, value in params.items():
+        path = name.split('.')
+        section = profile
+        for key in path[:-1]:
+            section = section.setdefault(key, {})
+        section[path[-1]] = value
+    return profile
+
+class ColumnStore(object):
+    """
+    Append-only on-disk store with one file per column (channel).
+
+    The waveform bytes of each step are appended to ``<column>.bin``
+    in the store directory. The file ``index.jsonl`` holds one line per completed
+    step with its parameters and, for every column, the offset and length of the
+    data in the column file plus the waveform preamble needed to convert it
+    to volts (and the first sample and mask of the :py:class:`ds1054z.Waveform`). A step only counts as completed once its index line is written,
+    so data of a step interrupted half way is discarded when reopening the store.
+
+    :param str directory: The directory to store the data in (created if missing).
+    """
+
+    INDEX_FILENAME = 'index.jsonl'
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.records = []
+        index_path = os.path.join(directory, self.INDEX_FILENAME)
+        if os.path.exists(index_path):
+            # the index is only ever appended to, the completed records are never rewritten
+            end = 0
+            with open(index_path, 'r+b') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError('incomplete line')
+                        self.records.append(json.loads(line.decode('utf-8')))
+                    except ValueError:
+                        # incomplete last line of an interrupted write
+                        break
+                    end += len(line)
+                f.truncate(end)
+        self._truncate_columns()
+        self._index = open(index_path, 'a')
+        self._columns = {}
+
+    def _column_path(self, column):
+        return os.path.join(self.directory, column + '.bin')
+
+    def _truncate_columns(self):
+        """ Cuts the column files to the data referenced in the index """
+        ends = {}
+        for record in self.records:
+            for column, entry in record['columns'].items():
+                ends[column] = max(ends.get(column, 0), entry['offset'] + entry['length'])
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.bin'):
+                continue
+            column = filename[:-4]
+            with open(self._column_path(column), 'r+b') as f:
+                f.truncate(ends.get(column, 0))
+
+    def _column_file(self, column):
+        if column not in self._columns:
+            self._columns[column] = open(self._column_path(column), 'ab')
+        return self._columns[column]
+
+    def completed_steps(self):
+        """ The set of step numbers already stored """
+        return set(record['step'] for record in self.records)
+
+    def append(self, step, params, columns):
+        """
+        Stores the data of one step.
+
+        :param int step: The step number
+        :param dict params: The parameters of this step
+        :param dict columns: {column: waveform} with waveform as :py:class:`ds1054z.Waveform`
+                             or as (data, preamble) tuple with data as bytes and preamble as tuple
+                             (see :py:attr:`ds1054z.DS1054Z.waveform_preamble`)
+        """
+        record = {'step': step, 'params': params, 'columns': {}}
+        for column, waveform in columns.items():
+            if not isinstance(waveform, Waveform):
+                waveform = Waveform(*waveform)
+            f = self._column_file(column)
+            offset = f.tell()
+            f.write(waveform.data)
+            f.flush()
+            record['columns'][column] = {'offset': offset, 'length': len(waveform.data),
+                                         'preamble': list(waveform.preamble), 'first': waveform.first,
+                                         'mask': list(waveform.mask) if waveform.mask else None}
+        self._index.write(json.dumps(record) + '\n')
+        self._index.flush()
+        self.records.append(record)
+
+    def read(self, step, column):
+        """
+        Reads back the data of a column for a step.
+
+        :return: (data, preamble)
+        :rtype: tuple
+        """
+        entry = self._entry(step, column)
+        if column in self._columns:
+            self._columns[column].flush()
+        with open(self._column_path(column), 'rb') as f:
+            f.seek(entry['offset'])
+            return f.read(entry['length']), tuple(entry['preamble'])
+
+    def _entry(self, step, column):
+        for record in self.records:
+            if record['step'] == step:
+                return record['columns'][column]
+        raise KeyError('Step {0} not found in the store'.format(step))
+
+    def read_waveform(self, step, column):
+        """
+        Reads back the data of a column for a step as :py:class:`ds1054z.Waveform`
+        (with the padding of screen reads masked like when it was captured).
+
+        :rtype: ds1054z.Waveform
+        """
+        data, preamble = self.read(step, column)
+        entry = self._entry(step, column)
+        # (not in the records of older stores)
+        mask = entry.get('mask')
+        return Waveform(data, preamble, channel=column, first=entry.get('first', 1),
+                        mask=tuple(mask) if mask else None)
+
+    def close(self):
+        for f in self._columns.values():
+            f.close()
+        self._columns = {}
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Sweep(object):
+    """
+    Runs a parameter sweep on a :py:class:`ds1054z.DS1054Z` instance.
+
+    :param ds: The scope
+    :param grid: The parameter names and their values (see :py:func:`expand_grid`)
+    :param channels: The channels to capture at each step
+    :param str directory: Where to store the data (see :py:class:`ColumnStore`)
+    :param str mode: The waveform mode to read: NORMal, MAXimum or RAW
+    :param float timeout: Maximum time to wait for a trigger per step in seconds.
+    :param bool force_trigger: Force a trigger if the timeout elapsed.
+                               Otherwise the step is skipped and remains open for a later run.
+    """
+
+    def __init__(self, ds, grid, channels, directory, mode='NORMal', timeout=10.0, force_trigger=False):
+        self.ds = ds
+        self.steps = expand_grid(grid)
+        self.channels = [ds._interpret_channel(channel) for channel in channels]
+        self.directory = directory
+        self.mode = mode
+        self.timeout = timeout
+        self.force_trigger = force_trigger
+
+    def run(self, progress=None):
+        """
+        Runs all steps not yet found in the store.
+
+        :param progress: Optional callable called as ``progress(step, number_of_steps, params)``
+                         after each completed step.
+        :return: The store holding the results (already closed)
+        :rtype: ColumnStore
+        """
+        store = ColumnStore(self.directory)
+        done = store.completed_steps()
+        previous = None
+        try:
+            for step, params in enumerate(self.steps):
+                if step in done:
+                    continue
+                if previous is None:
+                    # state of the scope is unknown: compare with its current settings
+                    self.ds.apply_profile(params_to_profile(params))
+                else:
+                    changed = {k: v for k, v in params.items() if previous.get(k) != v}
+                    for name in list(changed):
+                        if name.startswith('channels.') and name.endswith('.probe_ratio'):
+                            # the new probe ratio rescales the channel: send its scale and offset again
+                            prefix = name[:-len('probe_ratio')]
+                            changed.update((k, v) for k, v in params.items()
+                                           if k in (prefix + 'scale', prefix + 'offset'))
+                    if changed:
+                        self.ds.apply_profile(params_to_profile(changed), force=True)
+                previous = params
+                if not self.ds.acquire_single(timeout=self.timeout):
+                    if not self.force_trigger:
+                        continue
+                    self.ds.tforce()
+                    self.ds.wait_for_status('STOP', timeout=self.timeout)
+                columns = {}
+                for channel in self.channels:
+                    columns[channel] = self.ds.get_waveform(channel, mode=self.mode)
+                store.append(step, params, columns)
+                if progress:
+                    progress(step, len(self.steps), params)
+        finally:
+            store.close()
+        return store
+
+def save_recorded_frames(ds, channels, directory, first=1, last=None, mode='RAW', progress=None):
+    """
+    Downloads the frames of a waveform recording into a :py:class:`ColumnStore`.
+
+    Each frame is stored as a step (with the frame number as step number
+    and ``{'frame': frame}`` as parameters). Frames already found in the store
+    are skipped, so an interrupted download can be resumed.
+
+    :param ds: The scope
+    :param channels: The channels to read
+    :param str directory: Where to store the data
+    :param int first: The first frame to read
+    :param int last: The last frame to read, defaults to all recorded frames
+    :param str mode: The waveform mode to read: NORMal, MAXimum or RAW
+    :param progress: Optional callable called as ``progress(frame, last)`` after each frame.
+    :return: The store holding the frames (already closed)
+    :rtype: ColumnStore
+    """
+    channels = [ds._interpret_channel(channel) for channel in channels]
+    if last is None:
+        last = ds.recorded_frames
+    store = ColumnStore(directory)
+    done = store.completed_steps()
+    try:
+        for frame in range(first, last + 1):
+            if frame in done:
+                continue
+            columns = {}
+            with ds.transaction():
+                ds.write(":FUNCtion:WREPlay:FCURrent {0}".format(frame))
+                for channel in channels:
+                    columns[channel] = ds.get_waveform(channel, mode=mode)
+            store.append(frame, {'frame': frame}, columns)
+            if progress:
+                progress(frame, last)
+    finally:
+        store.close()
+    return store
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.transport` - Raw SCPI socket connection
+=====================================================================
+
+Besides VXI-11, the DS1000Z series listens for plain SCPI
+messages on TCP port 5555. Without the ONC-RPC framing and the
+VXI-11 link protocol, every message costs a single ``send()`` and
+the answer comes back as a plain byte stream:
+
+>>> scope = DS1054Z('192.168.0.23', transport='tcp')
+
+The answers are delimited by a newline character, binary answers
+(IEEE definite-length blocks like those of ``:WAVeform:DATA?``) are
+read by their length given in the block header.
+
+Everything :py:class:`ds1054z.DS1054Z` offers works the same with both
+transports, except for the VXI-11 specific device operations
+of :py:class:`vxi11.Instrument` (like trigger(), clear(), lock() or local()).
+"""
+
+import socket
+
+#: The raw SCPI socket port of the DS1000Z series
+SCPI_PORT = 5555
+
+class ScpiSocket(object):
+    """
+    A SCPI connection over a plain TCP socket.
+
+    :param str host: The host name or IP address of the scope
+    :param int port: The raw SCPI port
+    :param int recv_size: The number of bytes to ask the socket for at once
+    """
+
+    def __init__(self, host, port=SCPI_PORT, recv_size=65536):
+        self.host = host
+        self.port = port
+        self.recv_size = recv_size
+        self.sock = None
+        self._buffer = bytearray()
+
+    def open(self, timeout=10.0):
+        if self.sock is not None:
+            return
+        self.sock = socket.create_connection((self.host, self.port), timeout=timeout)
+        # short messages shall go out right away instead of waiting for more data (Nagle's algorithm)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buffer = bytearray()
+
+    def close(self):
+        if self.sock is None:
+            return
+        self.sock.close()
+        self.sock = None
+
+    def write_raw(self, data, timeout=10.0):
+        """ Sends a message (a newline is appended if missing) """
+        self.open(timeout)
+        self.sock.settimeout(timeout)
+        if not data.endswith(b'\n'):
+            data += b'\n'
+        self.sock.sendall(data)
+
+    def read_raw(self, num=-1, timeout=10.0):
+        """
+        Reads the next answer: a line of text (including the newline character)
+        or a complete IEEE block (including its header).
+        ``num`` is ignored, it is only accepted for compatibility with :py:meth:`vxi11.Instrument.read_raw`.
+
+        :rtype: bytes
+        """
+        self.open(timeout)
+        self.sock.settimeout(timeout)
+        self._fill(1)
+        if self._buffer[0:1] == b'#':
+            header, length = self._read_block_header()
+            block = bytearray(len(header) + length)
+            block[:len(header)] = header
+            self._receive_block_data(memoryview(block)[len(header):], length)
+            return bytes(block)
+        return self._read_line()
+
+    def read_ieee_block(self, into=None, timeout=10.0):
+        """
+        Reads the data part of an IEEE definite-length block.
+
+        The data is received right into the buffer into, the number of
+        bytes to read is taken from the block header. Pass a view of the
+        right place of a larger buffer to receive several blocks into
+        it one after the other (like :py:class:`ds1054z.DS1054Z` does
+        with the chunks of a waveform).
+
+        :param into: Optional writable buffer (bytearray or memoryview) at least as large as the data.
+                     Without it, a bytearray of the size of the data is allocated.
+        :return: The data: into or the part of it filled
+        :rtype: bytearray or memoryview
+        """
+        self.open(timeout)
+        self.sock.settimeout(timeout)
+        length = self._read_block_header()[1]
+        if into is None:
+            into = bytearray(length)
+        elif len(into) < length:
+            raise IOError('Received a block of {0} bytes, expected at most {1}'.format(length, len(into)))
+        self._receive_block_data(memoryview(into), length)
+        return into if len(into) == length else memoryview(into)[:length]
+
+    def _read_block_header(self):
+        """ Reads the header of an IEEE block, returns it along with the length of the data """
+        self._fill(2)
+        n_header_bytes = int(chr(self._buffer[1])) + 2
+        self._fill(n_header_bytes)
+        header = bytes(self._buffer[:n_header_bytes])
+        del self._buffer[:n_header_bytes]
+        return header, int(header[2:].decode('ascii'))
+
+    def _receive_block_data(self, view, length):
+        """ Receives the data part of a block into the memoryview (and drops the terminating newline) """
+        # first take what's already buffered, then receive the rest directly
+        done = min(length, len(self._buffer))
+        view[:done] = self._buffer[:done]
+        del self._buffer[:done]
+        while done < length:
+            n = self.sock.recv_into(view[done:length], length - done)
+            if not n:
+                raise socket.error('Connection closed by the scope')
+            done += n
+        view.release()
+        self._fill(1)
+        if self._buffer[0:1] == b'\n':
+            del self._buffer[:1]
+
+    def _fill(self, size):
+        """ Receives data until the buffer holds at least ``size`` bytes """
+        while len(self._buffer) < size:
+            chunk = self.sock.recv(self.recv_size)
+            if not chunk:
+                raise socket.error('Connection closed by the scope')
+            self._buffer += chunk
+
+    def _read_line(self):
+        start = 0
+        while True:
+            pos = self._buffer.find(b'\n', start)
+            if pos >= 0:
+                line = bytes(self._buffer[:pos + 1])
+                del self._buffer[:pos + 1]
+                return line
+            start = len(self._buffer)
+            self._fill(start + 1)
@@ -43,6 +43,7 @@ setup(name='ds1054z',
       extras_require = {
           'savescreen':  ["Pillow",],
           'discovery':   ["zeroconf",],
+          'zstd':        ["zstandard",],
       },
       package_data = {
           '': ['resources/*.png'],
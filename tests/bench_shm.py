@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of publishing captures to local consumers via ds1054z.shm:
+
+    PYTHONPATH=. python tests/bench_shm.py [samples] [captures]
+
+Captures of the given size (default: 24M samples, the deep memory of the scope)
+are published one after the other while a consumer in a separate process waits
+for them, once busy waiting (poll=0) and once with the default poll interval.
+The copy into the shared memory is timed, as is the latency from the
+end of the publication to the consumer having the capture in its hands.
+"""
+
+import sys, time, subprocess, os
+
+from ds1054z import Waveform
+from ds1054z.shm import CapturePublisher, CaptureSubscriber
+
+NAME = 'ds1054z_bench_{0}'.format(os.getpid())
+
+PREAMBLE = (0, 2, 0, 1, 1e-09, -0.012, 0, 0.04, 0, 127)
+
+def consume(name, captures, poll):
+    with CaptureSubscriber(name, poll=poll) as subscriber:
+        print('ready', flush=True)
+        for _ in range(captures):
+            frame = subscriber.wait(timeout=30.0)
+            received = time.time()
+            print(frame.seq, received, flush=True)
+            frame.release()
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 24000000
+    captures = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    waveform = Waveform(bytes(bytearray(i % 251 for i in range(samples))), PREAMBLE, channel='CHAN1', mode='RAW')
+    publisher = CapturePublisher(NAME, slots=4, slot_size=samples)
+    print('{0} captures of {1} samples'.format(captures, samples))
+    print('{0:>8s} {1:>12s} {2:>14s} {3:>14s}'.format('poll', 'publish MB/s', 'median latency', 'max latency'))
+    try:
+        for poll in (0.0, 0.0005):
+            consumer = subprocess.Popen([sys.executable, __file__, 'consume', NAME, str(captures), str(poll)],
+                                        stdout=subprocess.PIPE, universal_newlines=True)
+            consumer.stdout.readline()
+            published = {}
+            copy_time = 0.0
+            for _ in range(captures):
+                start = time.time()
+                seq = publisher.publish(waveform)
+                published[seq] = time.time()
+                copy_time += published[seq] - start
+                # give the consumer time to process the capture, like the scope would
+                time.sleep(0.05)
+            output, _ = consumer.communicate()
+            latencies = sorted(float(received) - published[int(seq)]
+                               for seq, received in (line.split() for line in output.splitlines()))
+            print('{0:8.4f} {1:12.1f} {2:11.1f} us {3:11.1f} us'.format(
+                poll, captures * samples / copy_time / 1e6, latencies[len(latencies) // 2] * 1e6, latencies[-1] * 1e6))
+    finally:
+        publisher.close()
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['consume']:
+        consume(sys.argv[2], int(sys.argv[3]), float(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the codecs of ds1054z.storage with and without the delta filter
+on representative 8 bit data (no hardware needed): pulses of random spacing,
+amplitude and width with exponential edges on a noisy baseline, and an
+oversampled sine with the same noise:
+
+    PYTHONPATH=. python tests/bench_storage.py [samples] [noise]
+
+For every codec and level, the speed of writing and reading (in MB of
+waveform data per second, including the delta filter) and the
+compression ratio (original size / file size) are printed.
+The noise is the standard deviation in ADC counts (default 1.0).
+The zstd codec is only included if the zstandard package is installed.
+"""
+
+import sys, os, time, math, random, tempfile, shutil
+
+from ds1054z.storage import CaptureWriter, CaptureReader
+
+CODECS = ((None, None), ('gzip', 1), ('gzip', 6), ('gzip', 9), ('lzma', 0), ('lzma', 6), ('zstd', 3), ('zstd', 19))
+
+PREAMBLE = (0, 2, 0, 1, 1e-09, -0.012, 0, 0.04, 0, 127)
+
+def pulse_data(samples, noise=1.0, seed=1):
+    rnd = random.Random(seed)
+    baseline = 40
+    data = bytearray()
+    while len(data) < samples:
+        gap = rnd.randint(500, 5000)
+        width = rnd.randint(20, 400)
+        height = rnd.randint(60, 200)
+        tau = rnd.uniform(2.0, 15.0)
+        level = 0.0
+        for i in range(gap + width):
+            target = height if gap <= i else 0.0
+            level += (target - level) / tau
+            data.append(min(255, max(0, int(round(baseline + level + rnd.gauss(0, noise))))))
+    return bytes(data[:samples])
+
+def sine_data(samples, noise=1.0, period=5000, seed=1):
+    rnd = random.Random(seed)
+    return bytes(bytearray(min(255, max(0, int(round(127 + 100 * math.sin(2 * math.pi * i / period) + rnd.gauss(0, noise)))))
+                           for i in range(samples)))
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 2400000
+    noise = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    chunk = 250000
+    directory = tempfile.mkdtemp()
+    try:
+        for name, data in (('pulses', pulse_data(samples, noise)), ('sine', sine_data(samples, noise))):
+            print('{0} samples of {1} data, written in chunks of {2}'.format(samples, name, chunk))
+            print('{0:6s} {1:>5s} {2:>6s} {3:>10s} {4:>10s} {5:>8s}'.format(
+                'codec', 'level', 'delta', 'write MB/s', 'read MB/s', 'ratio'))
+            for codec, level in CODECS:
+                for delta in (False, True):
+                    path = os.path.join(directory, 'capture')
+                    start = time.time()
+                    try:
+                        with CaptureWriter(path, PREAMBLE, channel='CHAN1', mode='RAW',
+                                           codec=codec, level=level, delta=delta) as writer:
+                            for pos in range(0, samples, chunk):
+                                writer.write(data[pos:pos+chunk])
+                    except ImportError:
+                        break
+                    write_time = time.time() - start
+                    start = time.time()
+                    with CaptureReader(path) as reader:
+                        read = reader.read()
+                    read_time = time.time() - start
+                    assert read == data
+                    print('{0:6s} {1:>5s} {2:>6s} {3:10.1f} {4:10.1f} {5:8.2f}'.format(
+                        str(codec), str(level), str(delta), samples / write_time / 1e6, samples / read_time / 1e6,
+                        samples / float(os.path.getsize(path))))
+            print('')
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
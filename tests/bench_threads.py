@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of several threads sharing a DS1054Z instance
+against a single thread doing the same work one read after the other.
+The scope is the simulated one of fake_scope.py served via VXI-11 (no hardware needed):
+
+    PYTHONPATH=. python tests/bench_threads.py [raw_points] [reads_per_thread] [latency]
+
+Every read is compared with the reference data of its channel,
+so requests of different threads getting mixed up would show.
+The server runs in a separate process, like a real scope it doesn't
+compete with the client threads for the interpreter. The latency
+(in seconds per RPC call, default 1 ms) is in the range of a real scope.
+"""
+
+import sys, time, threading, multiprocessing
+
+from vxi11 import vxi11
+
+from ds1054z import DS1054Z
+from fake_scope import FakeScope, FakeVxi11Server
+
+CHANNELS = (1, 2, 3, 4)
+
+def read_all(scope, jobs, expected, errors):
+    for channel, mode in jobs:
+        if mode == 'RAW':
+            data = scope.get_waveform_bytes(channel, mode='RAW')
+        else:
+            data = scope.get_waveform(channel).data
+        if data != expected[channel, mode]:
+            errors.append((channel, mode))
+
+def serve(raw_points, latency, ports, done):
+    server = FakeVxi11Server(FakeScope(raw_points=raw_points), latency=latency)
+    ports.put(server.port)
+    done.wait()
+    server.close()
+
+def main():
+    raw_points = int(sys.argv[1]) if len(sys.argv) > 1 else 600000
+    reads = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.001
+    ports = multiprocessing.Queue()
+    done = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(raw_points, latency, ports, done))
+    server.daemon = True
+    server.start()
+    scope = DS1054Z('127.0.0.1', lazy=True)
+    scope.client = vxi11.CoreClient('127.0.0.1', port=ports.get())
+    scope.stop()
+    expected = {}
+    for channel in CHANNELS:
+        for mode in ('RAW', 'NORMal'):
+            expected[channel, mode] = scope.get_waveform_bytes(channel, mode=mode)
+    # every thread reads one channel: alternating deep memory and screen reads
+    jobs = {channel: [(channel, ('RAW', 'NORMal')[i % 2]) for i in range(reads)] for channel in CHANNELS}
+    total = sum(len(expected[job]) for channel in CHANNELS for job in jobs[channel])
+    print('{0} threads with {1} reads each, {2} samples of deep memory'.format(len(CHANNELS), reads, raw_points))
+    print('{0:10s} {1:>10s} {2:>10s} {3:>8s}'.format('', 'seconds', 'MB/s', 'errors'))
+
+    errors = []
+    start = time.time()
+    read_all(scope, [job for channel in CHANNELS for job in jobs[channel]], expected, errors)
+    duration = time.time() - start
+    print('{0:10s} {1:10.3f} {2:10.1f} {3:8d}'.format('sequential', duration, total / duration / 1e6, len(errors)))
+
+    errors = []
+    threads = [threading.Thread(target=read_all, args=(scope, jobs[channel], expected, errors)) for channel in CHANNELS]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.time() - start
+    print('{0:10s} {1:10.3f} {2:10.1f} {3:8d}'.format('threads', duration, total / duration / 1e6, len(errors)))
+    scope.close()
+    done.set()
+    server.join()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the raw SCPI socket transport against VXI-11,
+both served locally by the simulated scope in fake_scope.py (no hardware needed):
+
+    PYTHONPATH=. python tests/bench_transport.py [raw_points] [queries]
+"""
+
+import sys, time
+
+from fake_scope import FakeScope, FakeScpiServer, FakeVxi11Server
+
+def main():
+    raw_points = int(sys.argv[1]) if len(sys.argv) > 1 else 1200000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    print('{0} small queries, RAW read of {1} samples'.format(queries, raw_points))
+    print('{0:8s} {1:>14s} {2:>14s}'.format('transport', 'query/ms', 'bulk/MB/s'))
+    for name, server_class in (('vxi11', FakeVxi11Server), ('tcp', FakeScpiServer)):
+        server = server_class(FakeScope(raw_points=raw_points))
+        scope = server.client()
+        scope.stop()
+        # let the simulated scope generate its memory content beforehand
+        server.scope.memory('CHAN1')
+        start = time.time()
+        for _ in range(queries):
+            scope.query(':TIMebase:MAIN:SCALe?')
+        latency = (time.time() - start) / queries
+        start = time.time()
+        data = scope.get_waveform_bytes(1, mode='RAW')
+        throughput = len(data) / (time.time() - start)
+        assert len(data) == raw_points
+        print('{0:8s} {1:14.3f} {2:14.1f}'.format(name, latency * 1e3, throughput / 1e6))
+        scope.close()
+        server.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the waveform transfer formats BYTE, WORD and ASCii
+against the simulated scope in fake_scope.py (no hardware needed).
+
+Transfer and decoding time are measured separately:
+
+    PYTHONPATH=. python tests/bench_waveform_formats.py [raw_points] [bandwidth in bytes/s]
+"""
+
+import sys, time
+
+from ds1054z import DS1054Z
+
+from fake_scope import FakeScope, FakeDS1054Z
+
+def main():
+    raw_points = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    bandwidth = float(sys.argv[2]) if len(sys.argv) > 2 else 1e6
+    print('{0} samples, link at {1:.0f} kB/s, 1 ms latency'.format(raw_points, bandwidth / 1e3))
+    print('{0:8s} {1:>12s} {2:>12s} {3:>12s}'.format('format', 'bytes', 'transfer/s', 'decode/s'))
+    for fmt in ('BYTE', 'WORD', 'ASCii'):
+        scope = FakeDS1054Z(FakeScope(raw_points=raw_points), latency=1e-3, bandwidth=bandwidth)
+        start = time.time()
+        buff = scope.get_waveform_bytes(1, mode='RAW', fmt=fmt)
+        transfer = time.time() - start
+        preamble = None if fmt == 'ASCii' else scope.waveform_preamble
+        start = time.time()
+        samples = DS1054Z.decode_waveform_data(buff, fmt, preamble)
+        decode = time.time() - start
+        assert len(samples) == raw_points
+        print('{0:8s} {1:12d} {2:12.3f} {3:12.3f}'.format(fmt, len(buff), transfer, decode))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,498 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+A simulated DS1000Z scope for running tests and benchmarks without hardware.
+
+:py:class:`FakeScope` interprets the subset of SCPI commands used by this package
+and :py:class:`FakeDS1054Z` is a :py:class:`ds1054z.DS1054Z` talking to it through
+a stand-in for the VXI-11 core client (optionally with simulated link latency
+and bandwidth).
+
+:py:class:`FakeScpiServer` and :py:class:`FakeVxi11Server` serve a :py:class:`FakeScope`
+on a local TCP port, speaking the raw SCPI socket protocol and VXI-11 respectively.
+"""
+
+import json
+import math
+import re
+import socket
+import threading
+import time
+
+from vxi11 import rpc, vxi11
+
+from ds1054z import DS1054Z
+
+IDN = 'RIGOL TECHNOLOGIES,DS1104Z,DS1ZA000000001,00.04.04.SP3'
+
+BOOL_NODES = ('DISP', 'INV', 'NREJ', 'ENAB')
+INT_HEADERS = ('WAV:STAR', 'WAV:STOP', 'FUNC:WREC:FEND', 'FUNC:WREP:FCUR')
+MAX_CHUNK = {'BYTE': 250000, 'WORD': 125000, 'ASC': 15625}
+
+def short_form(node):
+    """ SCPI short form of a command node or enumeration value: 'CHANnel1' -> 'CHAN1' """
+    match = re.match(r'^([A-Za-z*]*)(\d*)$', node)
+    if not match:
+        return node
+    letters, suffix = match.groups()
+    if letters == letters.lower():
+        # all lowercase is just as valid as all uppercase
+        letters = letters.upper()
+    if letters != letters.upper():
+        letters = ''.join(c for c in letters if c.isupper())
+    elif len(letters) > 4:
+        letters = letters[:3] if letters[3] in 'AEIOU' else letters[:4]
+    return letters + suffix
+
+def ieee_block(data):
+    return '#9{0:09d}'.format(len(data)).encode('ascii') + data + b'\n'
+
+class FakeScope(object):
+    """
+    A (very incomplete) simulation of the SCPI interface of a DS1000Z scope.
+
+    :param int raw_points: number of samples in the deep memory of each channel
+    :param bool concatenation: whether ``;``-concatenated queries are answered in a single message.
+                               If not, each query gets an answer of its own (see :py:attr:`unsent`).
+    :param int trigger_after: number of ``:TRIGger:STATus?`` polls after ``:SINGle``
+                              before the scope triggers (None: only ``:TFORce`` triggers)
+
+    :ivar int faults: number of upcoming ``:WAVeform:DATA?`` answers to cut short
+    :ivar list unsent: further answers to the last message, queued after the one returned by :py:meth:`handle`
+    """
+
+    def __init__(self, raw_points=12000, concatenation=True, trigger_after=None):
+        self.idn = IDN
+        self.raw_points = raw_points
+        self.screen_points = DS1054Z.SAMPLES_ON_DISPLAY
+        self.screen_missing_at_begin = False
+        self.concatenation = concatenation
+        self.trigger_after = trigger_after
+        self.status = 'RUN'
+        self.polls = 0
+        self.generation = 0
+        self.messages = 0
+        self.faults = 0
+        self.writes = []
+        self.unsent = []
+        self._memory = {}
+        self.state = {
+            'TIM:MAIN:SCAL': '1.000000e-03', 'TIM:MAIN:OFFS': '0.000000e+00',
+            'TIM:MODE': 'MAIN', 'TIM:DEL:ENAB': '0',
+            'ACQ:TYPE': 'NORM', 'ACQ:MDEP': 'AUTO', 'ACQ:SRAT': '1.000000e+06',
+            'TRIG:MODE': 'EDGE', 'TRIG:EDG:SOUR': 'CHAN1', 'TRIG:EDG:SLOP': 'POS',
+            'TRIG:EDG:LEV': '0.000000e+00', 'TRIG:NREJ': '0', 'TRIG:COUP': 'DC',
+            'WAV:SOUR': 'CHAN1', 'WAV:FORM': 'BYTE', 'WAV:MODE': 'NORM',
+            'WAV:STAR': '1', 'WAV:STOP': '1200',
+            'MATH:DISP': '0',
+            'FUNC:WREC:ENAB': '0', 'FUNC:WREC:FEND': '0', 'FUNC:WREC:OPER': 'STOP',
+            'FUNC:WREP:FCUR': '1', 'FUNC:WREP:FEND': '0',
+        }
+        for ch in range(1, 5):
+            self.state.update({
+                'CHAN{0}:DISP'.format(ch): '1' if ch == 1 else '0',
+                'CHAN{0}:SCAL'.format(ch): '1.000000e+00',
+                'CHAN{0}:OFFS'.format(ch): '0.000000e+00',
+                'CHAN{0}:PROB'.format(ch): '1.000000e+00',
+                'CHAN{0}:COUP'.format(ch): 'DC',
+                'CHAN{0}:BWL'.format(ch): 'OFF',
+                'CHAN{0}:INV'.format(ch): '0',
+                'CHAN{0}:UNIT'.format(ch): 'VOLT',
+            })
+        self._defaults = dict(self.state)
+
+    # ---- waveform memory ----
+
+    def memory(self, channel):
+        """ The deep memory bytes of a channel for the current acquisition """
+        key = (channel, self.generation, self.state['FUNC:WREP:FCUR'], self.raw_points)
+        if key not in self._memory:
+            n = int(channel[-1]) if channel[-1].isdigit() else 5
+            period = 200.0 * n
+            phase = (self.generation + int(self.state['FUNC:WREP:FCUR'])) * 0.1
+            # keep the other channels of the same acquisition
+            self._memory = {k: v for k, v in self._memory.items() if k[1:] == key[1:]}
+            self._memory[key] = bytes(bytearray(
+                int(127 + 100 * math.sin(2 * math.pi * i / period + phase))
+                for i in range(self.raw_points)))
+        return self._memory[key]
+
+    def waveform_points(self):
+        mode = self.state['WAV:MODE']
+        if mode == 'NORM' or (mode == 'MAX' and self.status != 'STOP'):
+            return self.screen_points, True
+        return self.raw_points, False
+
+    def preamble(self):
+        fmt = ('BYTE', 'WORD', 'ASC').index(self.state['WAV:FORM'])
+        typ = ('NORM', 'MAX', 'RAW').index(self.state['WAV:MODE'])
+        pnts, screen = self.waveform_points()
+        scale = float(self.state['TIM:MAIN:SCAL'])
+        if screen:
+            xinc = scale * DS1054Z.H_GRID / DS1054Z.SAMPLES_ON_DISPLAY
+        else:
+            xinc = 1.0 / float(self.state['ACQ:SRAT'])
+        xorig = -xinc * pnts / 2 + float(self.state['TIM:MAIN:OFFS'])
+        channel = self.state['WAV:SOUR']
+        yinc = float(self.state.get(channel + ':SCAL', '1')) / 25.0
+        yorig = int(round(-float(self.state.get(channel + ':OFFS', '0')) / yinc))
+        return '{0},{1},{2},1,{3:e},{4:e},0,{5:e},{6},127'.format(
+            fmt, typ, pnts, xinc, xorig, yinc, yorig)
+
+    def waveform_data(self):
+        pnts, screen = self.waveform_points()
+        fmt = self.state['WAV:FORM']
+        start = int(self.state['WAV:STAR'])
+        stop = int(self.state['WAV:STOP'])
+        if stop - start + 1 > MAX_CHUNK[fmt]:
+            return ieee_block(b'')
+        memory = self.memory(self.state['WAV:SOUR'])
+        if screen:
+            memory = memory[:DS1054Z.SAMPLES_ON_DISPLAY]
+            if pnts < DS1054Z.SAMPLES_ON_DISPLAY:
+                offset = DS1054Z.SAMPLES_ON_DISPLAY - pnts if self.screen_missing_at_begin else 0
+                start, stop = max(start, offset + 1), min(stop, offset + pnts)
+        data = memory[start-1:stop]
+        if fmt == 'WORD':
+            data = b''.join(bytes(bytearray((b, 0))) for b in bytearray(data))
+        elif fmt == 'ASC':
+            _, _, _, _, _, _, _, yinc, yorig, yref = self.preamble().split(',')
+            yinc, yorig, yref = float(yinc), int(yorig), int(yref)
+            data = ''.join('{0:e},'.format((b - yorig - yref) * yinc) for b in bytearray(data))
+            data = data.encode('ascii')
+        return ieee_block(data)
+
+    # ---- SCPI interpreter ----
+
+    def handle(self, message):
+        """ Processes a message sent to the scope and returns the answer (or None) """
+        self.messages += 1
+        if message.upper().startswith(b':SYST:SET ') or message.upper().startswith(b':SYSTEM:SETUP '):
+            block = message.split(b' ', 1)[1]
+            self.restore_setup(DS1054Z.decode_ieee_block(block))
+            self.writes.append(':SYST:SET')
+            return None
+        commands = message.decode('ascii').strip().split(';')
+        answers = []
+        for command in commands:
+            answer = self.command(command.strip())
+            if answer is not None:
+                answers.append(answer)
+        if not answers:
+            return None
+        if len(answers) == 1 or not self.concatenation:
+            self.unsent = answers[1:]
+            return answers[0]
+        return b';'.join(a.rstrip(b'\n') for a in answers) + b'\n'
+
+    def command(self, command):
+        header, _, arg = command.partition(' ')
+        query = header.endswith('?')
+        header = header.rstrip('?').lstrip(':')
+        header = ':'.join(short_form(node) for node in header.split(':'))
+        header = header.upper()
+        if not query:
+            self.writes.append(command)
+        if header == '*IDN':
+            return (self.idn + '\n').encode('ascii')
+        if header == '*OPC':
+            return b'1\n'
+        if header == '*RST':
+            self.state = dict(self._defaults)
+            return None
+        if header in ('RUN', 'STOP', 'SING', 'TFOR'):
+            self.action(header)
+            return None
+        if header == 'TRIG:STAT':
+            self.polls += 1
+            if self.status == 'WAIT' and self.trigger_after is not None and self.polls > self.trigger_after:
+                self.action('TFOR')
+            return (self.status + '\n').encode('ascii')
+        if header == 'WAV:PRE':
+            return (self.preamble() + '\n').encode('ascii')
+        if header == 'WAV:DATA':
+            if self.faults:
+                self.faults -= 1
+                return self.waveform_data()[:-100]
+            return self.waveform_data()
+        if header == 'DISP:DATA':
+            return ieee_block(b'\x89PNG\r\n\x1a\n' + b'\x00' * 60000)
+        if header == 'SYST:SET':
+            return ieee_block(json.dumps(self.setup_state(), sort_keys=True).encode('ascii'))
+        if header == 'MEAS:STAT:ITEM':
+            return self.measurement(*arg.split(','))
+        if query:
+            return (self.state.get(header, '0') + '\n').encode('ascii')
+        self.set(header, arg)
+        return None
+
+    def action(self, header):
+        if header == 'RUN':
+            self.status = 'RUN'
+        elif header == 'STOP':
+            self.status = 'STOP'
+        elif header == 'SING':
+            self.status = 'WAIT'
+            self.polls = 0
+        elif header == 'TFOR' and self.status in ('WAIT', 'RUN'):
+            self.generation += 1
+            if self.status == 'WAIT':
+                self.status = 'STOP'
+
+    def set(self, header, arg):
+        arg = arg.strip()
+        if header.split(':')[-1] in BOOL_NODES:
+            value = {'ON': '1', 'OFF': '0'}.get(arg.upper(), arg)
+        elif header in INT_HEADERS or header == 'ACQ:MDEP' and arg.upper() != 'AUTO':
+            value = str(int(float(arg)))
+            if header == 'WAV:STAR' and not self.start_valid(int(value)):
+                return
+        else:
+            try:
+                value = '{0:e}'.format(float(arg))
+            except ValueError:
+                value = short_form(arg).upper()
+        self.state[header] = value
+        if header == 'FUNC:WREC:OPER' and value == 'RUN' and self.state['FUNC:WREC:ENAB'] == '1':
+            # recording finishes instantly
+            self.generation += int(self.state['FUNC:WREC:FEND'])
+            self.state['FUNC:WREP:FEND'] = self.state['FUNC:WREC:FEND']
+            self.state['FUNC:WREC:OPER'] = 'STOP'
+            self.status = 'STOP'
+
+    def start_valid(self, start):
+        pnts, screen = self.waveform_points()
+        if not screen or pnts >= DS1054Z.SAMPLES_ON_DISPLAY:
+            return True
+        if self.screen_missing_at_begin:
+            return start > DS1054Z.SAMPLES_ON_DISPLAY - pnts
+        return start <= pnts
+
+    def measurement(self, typ, item, channel):
+        """ Only vpp of displayed channels is simulated, everything else is invalid """
+        value = 9.9e37
+        if item == 'vpp' and self.state.get(channel + ':DISP') == '1':
+            value = 8 * float(self.state[channel + ':SCAL'])
+        return ('{0:e}\n'.format(value)).encode('ascii')
+
+    def setup_state(self):
+        return {k: v for k, v in self.state.items() if not k.startswith('WAV:')}
+
+    def restore_setup(self, blob):
+        self.state.update(json.loads(blob.decode('ascii')))
+
+class FakeCoreClient(object):
+    """
+    Stand-in for :py:class:`vxi11.vxi11.CoreClient` passing messages to a :py:class:`FakeScope`.
+
+    :param float latency: simulated round trip time per VXI-11 call (in seconds)
+    :param float bandwidth: simulated link throughput (in bytes per second)
+    """
+
+    def __init__(self, scope, latency=0.0, bandwidth=None):
+        self.scope = scope
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.message = b''
+        self.pending = b''
+        # complete answers waiting behind the pending one
+        self.queued = []
+        self.calls = 0
+        self.sock = self
+
+    def settimeout(self, timeout):
+        pass
+
+    def delay(self, nbytes):
+        self.calls += 1
+        delay = self.latency
+        if self.bandwidth:
+            delay += nbytes / float(self.bandwidth)
+        if delay:
+            time.sleep(delay)
+
+    def device_write(self, link, timeout, lock_timeout, flags, data):
+        self.delay(len(data))
+        self.message += data
+        if flags & 0x08:
+            answer = self.scope.handle(self.message)
+            self.message = b''
+            if answer is not None:
+                # answers not read yet come first (like the output queue of the scope)
+                self.queued += [answer] + self.scope.unsent
+                self.scope.unsent = []
+        return 0, len(data)
+
+    def device_read(self, link, request_size, timeout, lock_timeout, flags, term_char):
+        if not self.pending and self.queued:
+            self.pending = self.queued.pop(0)
+        if not self.pending:
+            # VXI-11 I/O timeout
+            return 15, 0, b''
+        data, self.pending = self.pending[:request_size], self.pending[request_size:]
+        self.delay(len(data))
+        return 0, (0 if self.pending else 0x04), data
+
+    def destroy_link(self, link):
+        pass
+
+    def close(self):
+        pass
+
+class FakeDS1054Z(DS1054Z):
+    """ A :py:class:`ds1054z.DS1054Z` connected to a :py:class:`FakeScope` """
+
+    def __init__(self, scope=None, latency=0.0, bandwidth=None, *args, **kwargs):
+        self.scope = scope or FakeScope()
+        self.fake_client = FakeCoreClient(self.scope, latency=latency, bandwidth=bandwidth)
+        super(FakeDS1054Z, self).__init__('fake-scope', *args, **kwargs)
+
+    def open(self):
+        if self.link is not None:
+            return
+        self.client = self.fake_client
+        # a new link doesn't see answers pending on the old one
+        self.fake_client.pending = b''
+        self.fake_client.queued = []
+        self.link = 1
+        self.max_recv_size = 1024*1024
+
+    def close(self):
+        self.link = None
+        self.client = None
+
+class FakeScpiServer(object):
+    """
+    Serves a :py:class:`FakeScope` like the raw SCPI socket (port 5555) of the scope does,
+    on a random local port.
+
+    :param float latency: simulated delay per message (in seconds)
+    """
+
+    def __init__(self, scope=None, latency=0.0):
+        self.scope = scope or FakeScope()
+        self.latency = latency
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1)
+        self.port = self.sock.getsockname()[1]
+        thread = threading.Thread(target=self.loop)
+        thread.daemon = True
+        thread.start()
+
+    def client(self, **kwargs):
+        """ A :py:class:`ds1054z.DS1054Z` connected to this server """
+        kwargs.setdefault('lazy', True)
+        return DS1054Z('127.0.0.1', transport='tcp', port=self.port, **kwargs)
+
+    def close(self):
+        self.sock.close()
+
+    def loop(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except (socket.error, OSError):
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with conn:
+                self.session(conn)
+
+    @staticmethod
+    def next_message(buff):
+        """ Splits off the first message (taking IEEE blocks into account) """
+        line_end = buff.find(b'\n')
+        block = buff.find(b' #')
+        if 0 <= block < (line_end if line_end >= 0 else len(buff)) and len(buff) > block + 2:
+            n = int(buff[block+2:block+3])
+            if len(buff) < block + 3 + n:
+                return None, buff
+            end = block + 3 + n + int(buff[block+3:block+3+n])
+            if len(buff) < end + 1:
+                return None, buff
+            return buff[:end], buff[end+1:]
+        if line_end < 0:
+            return None, buff
+        return buff[:line_end], buff[line_end+1:]
+
+    def session(self, conn):
+        buff = b''
+        while True:
+            try:
+                data = conn.recv(65536)
+            except socket.error:
+                return
+            if not data:
+                return
+            buff += data
+            while True:
+                message, buff = self.next_message(buff)
+                if message is None:
+                    break
+                if self.latency:
+                    time.sleep(self.latency)
+                answer = self.scope.handle(message)
+                if answer is not None:
+                    conn.sendall(answer + b''.join(self.scope.unsent))
+                    self.scope.unsent = []
+
+class FakeVxi11Server(rpc.TCPServer):
+    """
+    Serves a :py:class:`FakeScope` via VXI-11 (without a portmapper) on a random local port.
+
+    :param float latency: simulated delay per RPC call (in seconds)
+    """
+
+    def __init__(self, scope=None, latency=0.0):
+        self.scope = scope or FakeScope()
+        self.core = FakeCoreClient(self.scope, latency=latency)
+        rpc.TCPServer.__init__(self, '127.0.0.1', vxi11.DEVICE_CORE_PROG, vxi11.DEVICE_CORE_VERS, 0)
+        self.sock.listen(1)
+        thread = threading.Thread(target=self.loop)
+        thread.daemon = True
+        thread.start()
+
+    def client(self, **kwargs):
+        """ A :py:class:`ds1054z.DS1054Z` connected to this server """
+        kwargs.setdefault('lazy', True)
+        scope = DS1054Z('127.0.0.1', **kwargs)
+        # no portmapper here: connect to the core channel directly
+        scope.client = vxi11.CoreClient('127.0.0.1', port=self.port)
+        return scope
+
+    def close(self):
+        self.sock.close()
+
+    def addpackers(self):
+        self.packer = vxi11.Packer()
+        self.unpacker = vxi11.Unpacker('')
+
+    def loop(self):
+        while True:
+            try:
+                conn = self.sock.accept()
+            except (socket.error, OSError):
+                return
+            conn[0].setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.session(conn)
+
+    def handle_10(self):
+        self.unpacker.unpack_create_link_parms()
+        self.turn_around()
+        self.packer.pack_create_link_resp((0, 1, 0, 1024*1024))
+
+    def handle_11(self):
+        params = self.unpacker.unpack_device_write_parms()
+        self.turn_around()
+        self.packer.pack_device_write_resp(self.core.device_write(*params))
+
+    def handle_12(self):
+        params = self.unpacker.unpack_device_read_parms()
+        self.turn_around()
+        self.packer.pack_device_read_resp(self.core.device_read(*params))
+
+    def handle_23(self):
+        self.unpacker.unpack_device_link()
+        self.turn_around()
+        self.packer.pack_device_error(0)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+Tests of the capture catalog in ds1054z.catalog against the simulated scope.
+"""
+
+import unittest, tempfile, shutil, os
+
+from ds1054z.catalog import CaptureCatalog, summarize
+
+from fake_scope import FakeDS1054Z
+
+class CaptureCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.scope = FakeDS1054Z()
+        self.catalog = CaptureCatalog(os.path.join(self.directory, 'captures.sqlite'))
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.directory)
+
+    def test_register_capture(self):
+        self.scope.display_channel(2)
+        waveforms = [self.scope.get_waveform(channel) for channel in (1, 2)]
+        capture_id = self.catalog.register_capture(self.scope, 'pulse.csv', 'data', waveforms, timestamp=1000.0)
+        capture, = self.catalog.find()
+        self.assertEqual(capture['id'], capture_id)
+        self.assertEqual((capture['path'], capture['kind'], capture['serial']), ('pulse.csv', 'data', self.scope.serial))
+        self.assertEqual(capture['channels'], ['CHAN1', 'CHAN2'])
+        self.assertEqual(capture['preambles']['CHAN2'], waveforms[1].preamble)
+        self.assertEqual(capture['measurements']['CHAN1'], summarize(waveforms[0].volts))
+        self.assertEqual(len(capture['settings_hash']), 40)
+
+    def test_find(self):
+        for i in range(10):
+            self.catalog.register('pulse_{0}.csv'.format(i), 'data', timestamp=1000.0 + i, serial='A',
+                                  measurements={'CHAN1': {'vmax': 0.5 * i}, 'CHAN2': {'vmax': 1.0}})
+        self.catalog.register('screen.png', 'screenshot', timestamp=1005.5, channels=['CHAN1'])
+        found = self.catalog.find(since=1003.0, until=1008.0, conditions=[('CHAN1', 'vmax', '>=', 2.0)])
+        self.assertEqual([c['path'] for c in found], ['pulse_7.csv', 'pulse_6.csv', 'pulse_5.csv', 'pulse_4.csv'])
+        self.assertEqual([c['path'] for c in self.catalog.find(kind='screenshot')], ['screen.png'])
+        self.assertEqual(len(self.catalog.find(channel='CHAN1')), 11)
+        self.assertEqual(len(self.catalog.find(channel='CHAN2', limit=3)), 3)
+        self.assertEqual(self.catalog.find(conditions=[('CHAN2', 'vmax', '!=', 1.0)]), [])
+        with self.assertRaises(NameError):
+            self.catalog.find(conditions=[('CHAN1', 'vmax', '; DROP TABLE captures', 1.0)])
+
+    def test_remove_and_reopen(self):
+        first = self.catalog.register('a.csv', 'data', measurements={'CHAN1': {'vmax': 1.0}})
+        self.catalog.register('b.json', 'json', info={'note': 'ok'})
+        self.catalog.remove(first)
+        self.catalog.close()
+        self.catalog = CaptureCatalog(os.path.join(self.directory, 'captures.sqlite'))
+        capture, = self.catalog.find()
+        self.assertEqual((capture['path'], capture['info']), ('b.json', {'note': 'ok'}))
+        self.assertEqual(self.catalog.find(conditions=[('CHAN1', 'vmax', '=', 1.0)]), [])
+
+    def test_summarize(self):
+        nan = float('nan')
+        self.assertEqual(summarize([nan, 1.0, 3.0, nan]), {'vmax': 3.0, 'vmin': 1.0, 'vpp': 2.0, 'vavg': 2.0})
+        self.assertEqual(summarize([nan])['vmax'], None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -79,6 +79,20 @@ class DS1054zTest(unittest.TestCase):
             full_data = self.scope.get_waveform_bytes(1, mode='RAW')
             self.assertEqual(len(full_data), int(mdepth))
 
+    def test_host_measurements(self):
+        from ds1054z.measure import measure_channel
+        self.scope.display_only_channel(1)
+        self.scope.single()
+        self.scope.tforce()
+        self.scope.wait_for_status('STOP')
+        items = ('vmax', 'vmin', 'vpp', 'vavg', 'frequency')
+        host = measure_channel(self.scope, 1, items=items)
+        for item in items:
+            value = self.scope.get_channel_measurement(1, item)
+            if value is None:
+                continue
+            self.assertAlmostEqual(host[item], value, delta=0.05 * abs(value) + 0.02)
+
 
 def main():
     global HOST
@@ -95,6 +109,7 @@ def main():
     suite.addTest(DS1054zTest('test_get_screenshot'))
     suite.addTest(DS1054zTest('test_nbytes_displayed'))
     suite.addTest(DS1054zTest('test_nbytes_full'))
+    suite.addTest(DS1054zTest('test_host_measurements'))
     unittest.TextTestRunner(verbosity=2).run(suite)
 
 if __name__ == '__main__':
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""
+Tests of the host-side measurements in ds1054z.measure on synthetic waveforms.
+"""
+
+import unittest, math
+
+from ds1054z.measure import measure, measure_delay, measure_channel, crossings, ITEMS, _Calculation
+
+from fake_scope import FakeDS1054Z
+
+XINC = 1e-6
+
+def trapezoid(periods=5, period=1000, ramp=10, high=1.0, low=0.0, shift=0):
+    """ A pulse train with linear edges and 50% duty cycle (at vmid) """
+    samples = []
+    for i in range(periods * period):
+        t = (i - shift) % period
+        if t < ramp:
+            v = low + (high - low) * t / ramp
+        elif t < period // 2:
+            v = high
+        elif t < period // 2 + ramp:
+            v = high - (high - low) * (t - period // 2) / ramp
+        else:
+            v = low
+        samples.append(v)
+    return samples
+
+class MeasureTest(unittest.TestCase):
+
+    def test_pulse(self):
+        m = measure(trapezoid(), XINC)
+        self.assertEqual((m['vtop'], m['vbase'], m['vpp']), (1.0, 0.0, 1.0))
+        self.assertAlmostEqual(m['vmid'], 0.5)
+        self.assertAlmostEqual(m['period'], 1e-3)
+        self.assertAlmostEqual(m['frequency'], 1e3)
+        self.assertAlmostEqual(m['rtime'], 8 * XINC)
+        self.assertAlmostEqual(m['ftime'], 8 * XINC)
+        self.assertAlmostEqual(m['pwidth'], 500 * XINC)
+        self.assertAlmostEqual(m['pduty'], 0.5)
+        self.assertAlmostEqual(m['nduty'], 0.5)
+        self.assertAlmostEqual(m['pslewrate'], 0.8 / (8 * XINC))
+        self.assertAlmostEqual(m['mparea'], 500 * XINC, places=7)
+        self.assertEqual(m['overshoot'], 0.0)
+        self.assertEqual(set(m), set(ITEMS))
+
+    def test_sine(self):
+        samples = [2 * math.sin(2 * math.pi * i / 400.0) for i in range(4000)]
+        m = measure(samples, XINC, xorig=-2e-3, items=['vpp', 'vrms', 'vavg', 'frequency', 'tvmax'])
+        self.assertAlmostEqual(m['vpp'], 4.0)
+        self.assertAlmostEqual(m['vrms'], 2 / math.sqrt(2))
+        self.assertAlmostEqual(m['vavg'], 0.0)
+        self.assertAlmostEqual(m['frequency'], 2500.0)
+        self.assertAlmostEqual(m['tvmax'], -2e-3 + 100 * XINC)
+
+    def test_invalid(self):
+        m = measure([float('nan')] * 10 + [0.5] * 100, XINC, items=['vavg', 'period', 'tvmax'])
+        self.assertEqual(m, {'vavg': 0.5, 'period': None, 'tvmax': 10 * XINC})
+        with self.assertRaises(NameError):
+            measure([0.0], XINC, items=['foo'])
+
+    def test_only_requested(self):
+        calculation = _Calculation(trapezoid(), XINC, 0.0)
+        self.assertAlmostEqual(calculation['pduty'], 0.5)
+        self.assertNotIn('vrms', calculation.values)
+        self.assertNotIn('rtime', calculation.values)
+        calculation = _Calculation(trapezoid(), XINC, 0.0)
+        self.assertEqual(calculation['vpp'], 1.0)
+        self.assertEqual(set(calculation.values), {'vpp', 'vmax', 'vmin'})
+
+    def test_channel(self):
+        scope = FakeDS1054Z()
+        waveform = scope.get_waveform(1)
+        wp = waveform.preamble_dict
+        expected = measure(waveform.samples(), wp['xinc'], wp['xorig'], items=['vpp', 'tvmax'])
+        capture_waveform = scope._capture_waveform
+
+        def interrupted(*args):
+            capture = capture_waveform(*args)
+            # another thread changes the timebase right after the samples were read
+            scope.write(':TIMebase:MAIN:SCALe 0.1')
+            return capture
+
+        scope._capture_waveform = interrupted
+        self.assertEqual(measure_channel(scope, 1, items=['vpp', 'tvmax']), expected)
+
+    def test_delay(self):
+        a = trapezoid()
+        b = trapezoid(shift=250)
+        m = measure_delay(a, b, XINC)
+        self.assertAlmostEqual(m['rdelay'], 250 * XINC)
+        self.assertAlmostEqual(m['fdelay'], 250 * XINC)
+        self.assertAlmostEqual(m['rphase'], 90.0)
+
+    def test_crossings(self):
+        self.assertEqual(crossings([0, 1, 0, 1], 0.5), [0.5, 2.5])
+        self.assertEqual(crossings([0, 1, 0, 1], 0.5, rising=False), [1.5])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+Tests of the measurement logger in ds1054z.monitor against the simulated scope.
+"""
+
+import unittest, tempfile, shutil, os, time, math, array
+
+from fake_scope import FakeDS1054Z
+
+class MeasurementLoggerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.scope = FakeDS1054Z()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ring_buffer(self):
+        filename = os.path.join(self.directory, 'log.csv')
+        mlog = self.scope.measurement_logger([1, 2], ['vpp'], capacity=4, filename=filename, flush_every=3)
+        for _ in range(10):
+            mlog.poll()
+        self.assertEqual(mlog.total, 10)
+        rows = mlog.latest(10)
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[-1][1], 8.0)
+        self.assertTrue(math.isnan(rows[-1][2]))
+        stats = mlog.statistics()
+        self.assertEqual(stats['CHAN1.vpp']['count'], 10)
+        self.assertEqual(stats['CHAN1.vpp']['mean'], 8.0)
+        self.assertEqual(stats['CHAN2.vpp']['invalid'], 10)
+        mlog.flush()
+        with open(filename) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], 'time,CHAN1.vpp,CHAN2.vpp')
+        self.assertEqual(len(lines), 11)
+
+    def test_failed_flush(self):
+        filename = os.path.join(self.directory, 'missing', 'log.csv')
+        mlog = self.scope.measurement_logger([1], ['vpp'], filename=filename, flush_every=2)
+        mlog.poll()
+        with self.assertRaises(IOError):
+            mlog.poll()
+        os.mkdir(os.path.dirname(filename))
+        mlog.poll()
+        mlog.flush()
+        with open(filename) as f:
+            self.assertEqual(len(f.read().splitlines()), 4)
+
+    def test_background_thread(self):
+        filename = os.path.join(self.directory, 'log.bin')
+        with self.scope.measurement_logger([1], ['vpp', 'frequency'], interval=0.01,
+                                           filename=filename, file_format='bin') as mlog:
+            time.sleep(0.1)
+        self.assertFalse(mlog.running)
+        self.assertGreater(mlog.total, 3)
+        data = array.array('d')
+        with open(filename, 'rb') as f:
+            data.frombytes(f.read())
+        self.assertEqual(len(data), 3 * mlog.total)
+        self.assertEqual(data[-2], 8.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+import unittest, socket, threading, time
+
+from ds1054z.netscan import scan_network, probe_host
+
+RIGOL_IDN = b'RIGOL TECHNOLOGIES,DS1104Z,DS1ZA000000001,00.04.04.SP3\n'
+OTHER_IDN = b'KEYSIGHT TECHNOLOGIES,E36103A,MY00000001,1.0.0\n'
+
+class FakeScpiListener(object):
+    """ Answers every request on a raw SCPI socket with a fixed identification string """
+
+    def __init__(self, ip, port, idn):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((ip, port))
+        self.sock.listen(8)
+        self.port = self.sock.getsockname()[1]
+        self.idn = idn
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                if conn.recv(64):
+                    conn.sendall(self.idn)
+
+    def close(self):
+        self.sock.close()
+
+class NetscanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = FakeScpiListener('127.0.0.2', 0, RIGOL_IDN)
+        self.other = FakeScpiListener('127.0.0.5', self.scope.port, OTHER_IDN)
+
+    def tearDown(self):
+        self.scope.close()
+        self.other.close()
+
+    def test_probe_host(self):
+        self.assertEqual(probe_host('127.0.0.2', self.scope.port, vxi11_fallback=False),
+                         RIGOL_IDN.decode().strip())
+        self.assertIsNone(probe_host('127.0.0.5', self.scope.port, vxi11_fallback=False))
+        self.assertIsNone(probe_host('127.0.0.3', self.scope.port, vxi11_fallback=False))
+
+    def test_scan_network(self):
+        start = time.time()
+        devices = scan_network('127.0.0.0/24', port=self.scope.port, vxi11_fallback=False)
+        self.assertLess(time.time() - start, 2.0)
+        self.assertEqual(len(devices), 1)
+        self.assertEqual(devices[0]['ip'], '127.0.0.2')
+        self.assertEqual(devices[0]['model'], 'DS1104Z')
+
+if __name__ == '__main__':
+    unittest.main()
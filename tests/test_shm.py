@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""
+Tests of the shared memory publication of captures in ds1054z.shm.
+"""
+
+import unittest, os, sys, subprocess, hashlib
+
+from ds1054z import Waveform
+from ds1054z.shm import CapturePublisher, CaptureSubscriber
+
+from fake_scope import FakeDS1054Z
+
+PREAMBLE = (0, 2, 1000, 1, 1e-09, -5e-07, 0, 0.04, 0, 127)
+
+PRODUCER = """
+import sys
+from ds1054z import Waveform
+from ds1054z.shm import CapturePublisher
+publisher = CapturePublisher(sys.argv[1], slots=3, slot_size=4096)
+publisher.publish(Waveform(b'\\x05' * 1000, (0, 2, 1000, 1, 1e-09, -5e-07, 0, 0.04, 0, 127), channel='CHAN4'))
+publisher.close(unlink=False)
+"""
+
+CONSUMER = """
+import sys, hashlib
+from ds1054z.shm import CaptureSubscriber
+with CaptureSubscriber(sys.argv[1], poll=0) as subscriber:
+    print('ready', flush=True)
+    frame = subscriber.wait(timeout=10.0)
+    print(frame.seq, frame.channel, hashlib.sha1(frame.data).hexdigest(), frame.valid())
+    frame.release()
+"""
+
+class SharedMemoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.name = 'ds1054z_test_{0}'.format(os.getpid())
+        self.publisher = CapturePublisher(self.name, slots=3, slot_size=4096)
+
+    def tearDown(self):
+        self.publisher.close()
+
+    def waveform(self, value, channel='CHAN1'):
+        return Waveform(bytes(bytearray([value]) * 1000), PREAMBLE, channel=channel, mode='RAW', first=11)
+
+    def test_publish_and_wait(self):
+        subscriber = CaptureSubscriber(self.name)
+        self.assertIsNone(subscriber.latest())
+        self.assertIsNone(subscriber.wait(timeout=0.01))
+        for value in range(5):
+            self.assertEqual(self.publisher.publish(self.waveform(value), timestamp=100.0 + value), value + 1)
+        frame = subscriber.latest()
+        self.assertEqual((frame.seq, frame.timestamp, frame.channel, frame.mode, frame.fmt, frame.first),
+                         (5, 104.0, 'CHAN1', 'RAW', 'BYTE', 11))
+        self.assertEqual(frame.preamble, PREAMBLE)
+        self.assertEqual(frame.waveform().volts, self.waveform(4).volts)
+        # the ring holds the last three, older ones are skipped
+        frames = [subscriber.wait(timeout=0.01) for _ in range(3)]
+        self.assertEqual([f.seq for f in frames], [3, 4, 5])
+        self.assertEqual(bytes(frames[0].data), bytes(bytearray([2]) * 1000))
+        self.assertIsNone(subscriber.wait(timeout=0.01))
+        self.publisher.publish(self.waveform(9, channel='CHAN2'))
+        self.assertFalse(frames[0].valid())
+        self.assertTrue(frames[1].valid())
+        self.assertEqual(subscriber.wait().channel, 'CHAN2')
+        self.assertIsNone(subscriber.frame(1))
+        for f in frames + [frame]:
+            f.release()
+        subscriber.close()
+
+    def test_limits(self):
+        with self.assertRaises(ValueError):
+            self.publisher.publish(Waveform(bytes(5000), PREAMBLE))
+        self.publisher.publish(self.waveform(1))
+        # a restarted publisher continues the sequence
+        self.publisher.close(unlink=False)
+        self.publisher = CapturePublisher(self.name, slots=3, slot_size=4096)
+        self.assertEqual(self.publisher.publish(self.waveform(2)), 2)
+
+    def test_restart_in_other_process(self):
+        self.publisher.close()
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+        def produce():
+            producer = subprocess.Popen([sys.executable, '-c', PRODUCER, self.name], stderr=subprocess.PIPE,
+                                        env=env, universal_newlines=True)
+            errors = producer.communicate(timeout=10.0)[1]
+            self.assertEqual((producer.returncode, errors), (0, ''))
+
+        produce()
+        # still there after the publisher exited
+        subscriber = CaptureSubscriber(self.name)
+        frame = subscriber.latest()
+        self.assertEqual((frame.seq, frame.channel, bytes(frame.data)), (1, 'CHAN4', b'\x05' * 1000))
+        frame.release()
+        # a restarted publisher reaches the attached subscribers
+        produce()
+        frame = subscriber.wait(timeout=1.0)
+        self.assertEqual(frame.seq, 2)
+        frame.release()
+        self.publisher = CapturePublisher(self.name, slots=3, slot_size=4096)
+        self.assertEqual(self.publisher.publish(self.waveform(3)), 3)
+        frame = subscriber.wait(timeout=1.0)
+        self.assertEqual(frame.seq, 3)
+        frame.release()
+        subscriber.close()
+
+    def test_scope_capture(self):
+        scope = FakeDS1054Z()
+        waveform = scope.get_waveform(1)
+        self.publisher.close()
+        self.publisher = CapturePublisher(self.name, slots=2, slot_size=scope.SAMPLES_ON_DISPLAY)
+        self.publisher.publish(waveform)
+        with CaptureSubscriber(self.name) as subscriber:
+            frame = subscriber.latest()
+            self.assertEqual(frame.mask, waveform.mask)
+            self.assertEqual(str(frame.waveform(copy=True).samples()), str(waveform.samples()))
+            frame.release()
+
+    def test_other_process(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        consumer = subprocess.Popen([sys.executable, '-c', CONSUMER, self.name], stdout=subprocess.PIPE, env=env,
+                                    universal_newlines=True)
+        self.assertEqual(consumer.stdout.readline().strip(), 'ready')
+        waveform = self.waveform(7, channel='CHAN3')
+        self.publisher.publish(waveform)
+        output, _ = consumer.communicate(timeout=10.0)
+        self.assertEqual(output.split(), ['1', 'CHAN3', hashlib.sha1(waveform.data).hexdigest(), 'True'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,757 @@
+#!/usr/bin/env python
+
+"""
+Tests of the DS1054Z class running against the simulated scope in fake_scope.py
+(no hardware needed).
+"""
+
+import unittest, tempfile, shutil, os, threading, json, time, math
+
+from ds1054z import DS1054Z, ValueLadder, TransferCancelled, Waveform
+
+from fake_scope import FakeScope, FakeDS1054Z, FakeScpiServer, FakeVxi11Server
+
+class IdentificationTest(unittest.TestCase):
+
+    def test_eager(self):
+        scope = FakeDS1054Z()
+        self.assertEqual(scope.scope.messages, 1)
+        self.assertEqual(scope.product, 'DS1104Z')
+
+    def test_known_idn(self):
+        scope = FakeDS1054Z(idn='RIGOL TECHNOLOGIES,DS1054Z,DS1ZA1,00.04.04')
+        self.assertEqual(scope.scope.messages, 0)
+        self.assertEqual(scope.product, 'DS1054Z')
+        with self.assertRaises(NameError):
+            FakeDS1054Z(idn='ACME,SCOPE,1,1')
+
+    def test_lazy(self):
+        scope = FakeDS1054Z(lazy=True)
+        self.assertEqual(scope.scope.messages, 0)
+        scope.run()
+        self.assertEqual(scope.scope.messages, 2)
+        self.assertEqual(scope.serial, 'DS1ZA000000001')
+        self.assertEqual(scope.scope.messages, 2)
+
+    def test_lazy_unknown_device(self):
+        fake = FakeScope()
+        fake.idn = 'ACME,SCOPE,1,1'
+        scope = FakeDS1054Z(fake, lazy=True)
+        with self.assertRaises(NameError):
+            scope.run()
+        self.assertNotIn(':RUN', fake.writes)
+
+class QueryManyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = FakeDS1054Z()
+
+    def test_query_many(self):
+        messages = self.scope.scope.messages
+        answers = self.scope.query_many([':CHAN1:DISPlay?', ':CHANnel2:DISPlay?', ':TIMebase:MAIN:SCALe?'])
+        self.assertEqual(answers, ['1', '0', '1.000000e-03'])
+        self.assertEqual(self.scope.scope.messages - messages, 1)
+
+    def test_query_many_splits_long_messages(self):
+        self.scope.MAX_CONCATENATED_LENGTH = 40
+        messages = self.scope.scope.messages
+        answers = self.scope.query_many([':CHAN{0}:SCALe?'.format(ch) for ch in range(1, 5)])
+        self.assertEqual(answers, ['1.000000e+00'] * 4)
+        self.assertEqual(self.scope.scope.messages - messages, 2)
+
+    def test_query_many_fallback(self):
+        scope = FakeDS1054Z(FakeScope(concatenation=False))
+        answers = scope.query_many([':CHAN1:DISPlay?', ':CHAN2:DISPlay?', ':CHAN1:SCALe?'])
+        self.assertEqual(answers, ['1', '0', '1.000000e+00'])
+        self.assertFalse(scope.concatenated_queries)
+        self.assertEqual(scope.query(':TIMebase:MAIN:SCALe?'), '1.000000e-03')
+
+    def test_displayed_channels(self):
+        self.scope.display_channel(3)
+        messages = self.scope.scope.messages
+        self.assertEqual(self.scope.displayed_channels, ['CHAN1', 'CHAN3'])
+        self.assertEqual(self.scope.scope.messages - messages, 1)
+
+    def test_channel_measurements(self):
+        self.scope.display_channel(3)
+        messages = self.scope.scope.messages
+        table = self.scope.get_channel_measurements([1, 'CHAN2', 3], ['vpp', 'frequency'])
+        self.assertEqual(self.scope.scope.messages - messages, 1)
+        self.assertEqual(table['CHAN1'], {'vpp': 8.0, 'frequency': None})
+        self.assertEqual(table['CHAN2']['vpp'], None)
+        self.assertEqual(table['CHAN3']['vpp'], 8.0)
+        self.assertEqual(self.scope.get_channel_measurement(1, 'vpp'), 8.0)
+
+    def test_channel_settings(self):
+        self.scope.set_probe_ratio(2, 10)
+        self.scope.write(':CHAN2:INVert ON')
+        settings = self.scope.get_channel_settings()
+        self.assertEqual(sorted(settings), ['CHAN1', 'CHAN2', 'CHAN3', 'CHAN4'])
+        self.assertEqual(settings['CHAN2']['probe_ratio'], 10.0)
+        self.assertTrue(settings['CHAN2']['invert'])
+        self.assertFalse(settings['CHAN2']['display'])
+        self.assertEqual(settings['CHAN1']['coupling'], 'DC')
+
+class SetupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = FakeDS1054Z()
+
+    def test_ieee_block_roundtrip(self):
+        block = self.scope.encode_ieee_block(b'\x00\x01;abc')
+        self.assertEqual(block, b'#16\x00\x01;abc')
+        self.assertEqual(self.scope.decode_ieee_block(block), b'\x00\x01;abc')
+
+    def test_save_restore_setup(self):
+        blob = self.scope.save_setup()
+        self.scope.set_channel_scale(1, 5.0)
+        self.assertTrue(self.scope.restore_setup(blob))
+        self.assertEqual(self.scope.get_channel_scale(1), 1.0)
+
+    def test_restore_identical_setup_skipped(self):
+        blob = self.scope.save_setup()
+        self.assertFalse(self.scope.restore_setup(blob))
+        self.scope.get_waveform_bytes(1)
+        self.assertFalse(self.scope.restore_setup(blob))
+        self.assertTrue(self.scope.restore_setup(blob, force=True))
+        self.scope.set_channel_offset(1, 0.5)
+        self.assertTrue(self.scope.restore_setup(blob))
+        self.assertEqual(self.scope.scope.writes.count(':SYST:SET'), 2)
+
+    def test_restore_setup_with_question_mark(self):
+        state = json.loads(self.scope.save_setup().decode('ascii'))
+        state['DISP:NOTE'] = 'why?'
+        blob = json.dumps(state).encode('ascii')
+        self.scope.set_probe_ratio(1, 10)
+        self.scope.get_waveform_bytes(1)
+        generation = self.scope.acquisition_generation
+        self.assertTrue(self.scope.restore_setup(blob))
+        self.assertEqual(self.scope._probe_ratios, {})
+        self.assertGreater(self.scope.acquisition_generation, generation)
+        self.assertIsNone(self.scope._waveform_source)
+
+class ProfileTest(unittest.TestCase):
+
+    PROFILE = {
+        'acquire':  {'type': 'NORMal', 'memory_depth': 'AUTO'},
+        'timebase': {'mode': 'MAIN', 'delay_enable': False, 'scale': 48e-6, 'offset': 200e-6},
+        'channels': {
+            1: {'coupling': 'DC', 'invert': False, 'probe_ratio': 1000, 'scale': 480, 'offset': -1000},
+            'CHAN2': {'units': 'AMPere', 'probe_ratio': 10, 'scale': 1, 'offset': -2},
+        },
+        'trigger':  {'mode': 'EDGE', 'source': 'CHANnel2', 'slope': 'POSitive',
+                     'noise_reject': True, 'level': 0.5},
+    }
+
+    def setUp(self):
+        self.scope = FakeDS1054Z()
+
+    def test_apply_profile(self):
+        commands = self.scope.apply_profile(self.PROFILE)
+        self.assertIn(':TIMebase:MAIN:SCALe 5e-05', commands)
+        self.assertIn(':CHAN1:SCALe 500.0', commands)
+        self.assertIn(':TRIGger:NREJect ON', commands)
+        self.assertNotIn(':ACQuire:TYPE NORMal', commands)
+        self.assertNotIn(':CHAN1:COUPling DC', commands)
+        profile = self.scope.get_profile([1, 2])
+        self.assertEqual(profile['channels']['CHAN1']['probe_ratio'], 1000.0)
+        self.assertEqual(profile['channels']['CHAN2']['units'], 'AMP')
+        self.assertEqual(profile['trigger']['source'], 'CHAN2')
+        self.assertTrue(profile['trigger']['noise_reject'])
+
+    def test_reapply_profile_is_free(self):
+        self.scope.apply_profile(self.PROFILE)
+        messages = self.scope.scope.messages
+        self.assertEqual(self.scope.apply_profile(self.PROFILE), [])
+        self.assertEqual(self.scope.scope.messages - messages, 1)
+
+    def test_profile_diff(self):
+        self.scope.apply_profile(self.PROFILE)
+        other = {'channels': {2: {'scale': 2}}, 'trigger': {'level': 1.0}}
+        self.assertEqual(self.scope.apply_profile(other),
+                         [':CHAN2:SCALe 2.0', ':TRIGger:EDGe:LEVel 1.0'])
+
+    def test_unknown_setting(self):
+        with self.assertRaises(KeyError):
+            self.scope.apply_profile({'trigger': {'lvl': 1.0}})
+
+class LadderTest(unittest.TestCase):
+
+    def test_closest(self):
+        ladder = ValueLadder.from_range(1e-3, 10)
+        self.assertEqual(len(ladder), 13)
+        self.assertEqual(ladder.closest(0), 1e-3)
+        self.assertEqual(ladder.closest(1e3), 10)
+        self.assertEqual(ladder.closest(0.0031), 0.002)
+        self.assertEqual(ladder.closest(0.0036), 0.005)
+        self.assertEqual(ladder.closest(0.2), 0.2)
+
+    def test_scaled(self):
+        ladder = DS1054Z.CHANNEL_SCALE_LADDER
+        self.assertIs(ladder.scaled(10), ladder.scaled(10.0))
+        self.assertEqual(ladder.scaled(1000).closest(480), 500)
+
+    def test_memory_depth(self):
+        self.assertEqual(DS1054Z.MEMORY_DEPTH_LADDER.closest(1.1e6), 1200000)
+        self.assertIn(24000000, DS1054Z.possible_memory_depth_values)
+
+    def test_set_channel_scale_without_probe_query(self):
+        scope = FakeDS1054Z()
+        scope.set_probe_ratio(1, 10)
+        messages = scope.scope.messages
+        for volts in (0.3, 3, 30):
+            scope.set_channel_scale(1, volts, use_closest_match=True, probe_ratio=10)
+        self.assertEqual(scope.scope.messages - messages, 3)
+        self.assertEqual(scope.get_channel_scale(1), 20.0)
+
+    def test_set_channel_scale_after_reset(self):
+        scope = FakeDS1054Z()
+        scope.set_probe_ratio(1, 10)
+        scope.get_waveform_bytes(1)
+        scope.write('*RST')
+        self.assertEqual((scope._probe_ratios, scope._waveform_source), ({}, None))
+        # the probe ratio is back at 1x, the scale is taken from its ladder
+        scope.set_channel_scale(1, 30, use_closest_match=True)
+        self.assertEqual(scope.get_channel_scale(1), 10.0)
+        # the probe ratio changed on the front panel is queried as well
+        scope.scope.state['CHAN1:PROB'] = '1.000000e+01'
+        scope.set_channel_scale(1, 30, use_closest_match=True)
+        self.assertEqual(scope.get_channel_scale(1), 20.0)
+
+class WaveformFormatTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = FakeDS1054Z()
+        self.scope.set_channel_offset(1, 0.5)
+
+    def test_formats_agree(self):
+        for mode in ('NORMal', 'RAW'):
+            byte_samples = self.scope.get_waveform_samples(1, mode=mode)
+            for fmt in ('WORD', 'ASCii'):
+                samples = self.scope.get_waveform_samples(1, mode=mode, fmt=fmt)
+                self.assertEqual(len(samples), len(byte_samples))
+                for a, b in zip(samples, byte_samples):
+                    self.assertAlmostEqual(a, b, places=5)
+
+    def test_word_chunking(self):
+        scope = FakeDS1054Z(FakeScope(raw_points=300000))
+        data = scope.get_waveform_bytes(1, mode='RAW', fmt='WORD')
+        self.assertEqual(len(data), 2 * 300000)
+        self.assertEqual(scope.scope.writes.count(':WAVeform:STARt 125001'), 1)
+
+    def test_decode_word(self):
+        preamble = (1, 2, 2, 1, 1.0, 0.0, 0, 0.5, 0, 127)
+        self.assertEqual(DS1054Z.decode_waveform_data(b'\x80\x00\x7f\x01', 'WORD', preamble),
+                         [0.5, 128.0])
+
+class WaveformObjectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = FakeDS1054Z()
+
+    def test_lazy_volts(self):
+        waveform = self.scope.get_waveform(1, mode='RAW', start=101, stop=600)
+        self.assertEqual(len(waveform), 500)
+        self.assertEqual(waveform.channel, 'CHAN1')
+        self.assertIsNone(waveform._volts)
+        self.assertEqual(list(waveform.volts), self.scope.get_waveform_samples(1, mode='RAW', start=101, stop=600))
+        self.assertIs(waveform.volts, waveform.volts)
+        wp = waveform.preamble_dict
+        self.assertAlmostEqual(waveform.times[0], wp['xorig'] + 100 * wp['xinc'])
+        waveform.clear_cache()
+        self.assertIsNone(waveform._volts)
+        with self.assertRaises(AttributeError):
+            waveform.extra = 1
+
+    def test_padding_mask(self):
+        self.scope.scope.screen_points = 1000
+        for at_begin in (False, True):
+            self.scope.scope.screen_missing_at_begin = at_begin
+            waveform = self.scope.get_waveform(1)
+            self.assertEqual(waveform.mask, (0, 200) if at_begin else (1000, 1200))
+            volts = waveform.volts
+            self.assertEqual(len(volts), 1200)
+            invalid = [i for i, v in enumerate(volts) if v != v]
+            self.assertEqual(invalid, list(range(*waveform.mask)))
+
+    def test_from_bytes(self):
+        preamble = (0, 2, 3, 1, 1e-3, -1e-3, 0, 0.5, 0, 127)
+        waveform = Waveform(b'\x7f\x80\x81', preamble)
+        self.assertEqual(list(waveform.volts), [0.0, 0.5, 1.0])
+        self.assertEqual(list(waveform.times), [-1e-3, 0.0, 1e-3])
+
+class EnvelopeTest(unittest.TestCase):
+
+    def test_envelope(self):
+        scope = FakeDS1054Z(FakeScope(raw_points=300000))
+        samples = scope.get_waveform_samples(1, mode='RAW')
+        mins, maxs, bucket = scope.get_waveform_envelope(1, points=7000)
+        self.assertEqual(bucket, 43)
+        self.assertEqual(len(mins), 6977)
+        self.assertEqual(len(maxs), 6977)
+        self.assertEqual(min(mins), min(samples))
+        self.assertEqual(max(maxs), max(samples))
+        for i in (0, 2908, 5813, 6976):
+            part = samples[i*bucket:(i+1)*bucket]
+            self.assertEqual((mins[i], maxs[i]), (min(part), max(part)))
+
+class PrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = FakeDS1054Z(FakeScope(raw_points=600000))
+
+    def test_prefetched_samples(self):
+        samples = self.scope.get_waveform_samples(1, mode='RAW')
+        chunks = list(self.scope.iter_waveform_samples(1, mode='RAW', prefetch=2))
+        self.assertEqual([offset for offset, chunk in chunks], [0, 250000, 500000])
+        self.assertEqual(sum((chunk for offset, chunk in chunks), []), samples)
+
+    def test_early_close(self):
+        chunks = self.scope.iter_waveform_chunks(1, mode='RAW', prefetch=1)
+        offset, chunk = next(chunks)
+        chunks.close()
+        self.assertEqual(len(chunk), 250000)
+        self.assertEqual(self.scope.idn, self.scope.scope.idn)
+
+    def test_error_in_producer(self):
+        self.scope.CHUNK_RETRIES = 0
+        chunks = self.scope.iter_waveform_chunks(1, mode='RAW', prefetch=1)
+        def broken_link(message):
+            raise IOError('link lost')
+        self.scope.query_raw = broken_link
+        with self.assertRaises(IOError):
+            list(chunks)
+
+    def run_briefly(self, function):
+        """ Runs function in a thread, failing instead of hanging if it doesn't return """
+        result = []
+        def run():
+            try:
+                result.append(function())
+            except Exception as e:
+                result.append(e)
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        thread.join(10.0)
+        self.assertFalse(thread.is_alive(), 'deadlock')
+        return result[0]
+
+    def test_within_transaction(self):
+        samples = self.scope.get_waveform_samples(1, mode='RAW')
+        def read():
+            with self.scope.transaction():
+                envelope = self.scope.get_waveform_envelope(1, points=100)
+                chunks = list(self.scope.iter_waveform_samples(1, mode='RAW'))
+            return envelope, chunks
+        (mins, maxs, bucket), chunks = self.run_briefly(read)
+        self.assertEqual((len(mins), bucket), (100, 6000))
+        self.assertEqual(sum((chunk for offset, chunk in chunks), []), samples)
+
+    def test_transaction_during_prefetch(self):
+        self.scope.WAVEFORM_FORMATS = dict(self.scope.WAVEFORM_FORMATS, BYT=(1, 10000))
+        chunks = self.scope.iter_waveform_chunks(1, mode='RAW', prefetch=1)
+        next(chunks)
+        time.sleep(0.05)
+        def read():
+            with self.scope.transaction():
+                for offset, chunk in chunks:
+                    pass
+        self.assertIsInstance(self.run_briefly(read), RuntimeError)
+        self.assertEqual(self.scope.get_waveform_bytes(1, mode='RAW', stop=100), self.scope.scope.memory('CHAN1')[:100])
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = FakeDS1054Z(FakeScope(raw_points=600000))
+        self.scope.CHUNK_RETRY_DELAY = 0
+        self.data = self.scope.get_waveform_bytes(1, mode='RAW')
+
+    def test_chunk_retried(self):
+        self.scope.scope.faults = 2
+        writes = len(self.scope.scope.writes)
+        self.assertEqual(self.scope.get_waveform_bytes(1, mode='RAW'), self.data)
+        self.assertEqual(self.scope.scope.writes[writes:].count(':WAVeform:STARt 1'), 3)
+        self.assertEqual(self.scope.scope.writes[writes:].count(':WAVeform:STARt 250001'), 1)
+
+    def test_give_up(self):
+        self.scope.scope.faults = 4
+        with self.assertRaises(IOError):
+            self.scope.get_waveform_bytes(1, mode='RAW')
+
+    def test_resume(self):
+        transfer = self.scope.start_waveform_transfer(1)
+        self.scope.CHUNK_RETRIES = 0
+        real_read = self.scope._read_waveform_chunk
+        calls = []
+        def flaky_read(source, pos, end_pos):
+            calls.append(pos)
+            if len(calls) == 2:
+                raise IOError('link lost')
+            return real_read(source, pos, end_pos)
+        self.scope._read_waveform_chunk = flaky_read
+        with self.assertRaises(IOError):
+            transfer.read()
+        self.assertEqual(transfer.position, 250001)
+        self.assertEqual(transfer.resume(), self.data)
+        self.assertEqual(calls, [1, 250001, 250001, 500001])
+        self.assertTrue(transfer.done)
+
+    def test_resume_changed_waveform(self):
+        transfer = self.scope.start_waveform_transfer(1)
+        self.scope.set_channel_scale(1, 2.0)
+        with self.assertRaises(IOError):
+            transfer.resume()
+
+class CancelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = FakeDS1054Z(FakeScope(raw_points=600000))
+
+    def test_progress(self):
+        reports = []
+        def progress(done, total, rate):
+            reports.append((done, total))
+        self.scope.get_waveform_bytes(1, mode='RAW', fmt='WORD', progress=progress)
+        self.assertEqual(reports, [(250000, 1200000), (500000, 1200000), (750000, 1200000),
+                                   (1000000, 1200000), (1200000, 1200000)])
+        del reports[:]
+        self.assertEqual(len(self.scope.get_waveform_samples(1, progress=progress)), 1200)
+        self.assertEqual(reports, [(1200, 1200)])
+
+    def test_cancel_between_chunks(self):
+        cancel = threading.Event()
+        def progress(done, total, rate):
+            if done >= 500000:
+                cancel.set()
+        with self.assertRaises(TransferCancelled):
+            self.scope.get_waveform_bytes(1, mode='RAW', progress=progress, cancel=cancel)
+        self.assertEqual(self.scope.scope.writes.count(':WAVeform:STARt 500001'), 0)
+        # nothing left pending: the scope answers the next request right away
+        self.assertEqual(len(self.scope.get_waveform_bytes(1, mode='RAW')), 600000)
+
+    def test_display_data(self):
+        reports = []
+        cancel = threading.Event()
+        def progress(done, total, rate):
+            reports.append(done)
+            if len(reports) == 2:
+                cancel.set()
+        with self.assertRaises(TransferCancelled):
+            self.scope.get_display_data(progress=progress, cancel=cancel)
+        self.assertEqual(reports, [16384, 32768])
+        self.assertEqual(self.scope.query(':CHAN1:DISPlay?'), '1')
+        del reports[:]
+        self.assertEqual(len(self.scope.get_display_data(progress=progress)), 60008)
+        self.assertEqual(reports[-1], 60020)
+
+class ThreadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = FakeDS1054Z(FakeScope(raw_points=600000))
+        self.scope.stop()
+        self.expected = {ch: self.scope.get_waveform_bytes(ch, mode='RAW') for ch in (1, 2)}
+
+    def test_interleaved_chunks(self):
+        chunks = self.scope.iter_waveform_chunks(1, mode='RAW')
+        data = []
+        for offset, chunk in chunks:
+            data.append(chunk)
+            # reading another channel in between selects a different source
+            self.assertEqual(self.scope.get_waveform_bytes(2, mode='RAW', stop=1000), self.expected[2][:1000])
+        self.assertEqual(b"".join(data), self.expected[1])
+
+    def test_concurrent_reads(self):
+        self.scope.scope.screen_points = 1000
+        errors = []
+        def reader(channel, mode):
+            try:
+                for _ in range(3):
+                    if mode == 'RAW':
+                        self.assertEqual(self.scope.get_waveform_bytes(channel, mode='RAW'), self.expected[channel])
+                    else:
+                        waveform = self.scope.get_waveform(channel)
+                        self.assertEqual((len(waveform), waveform.mask), (1200, (1000, 1200)))
+                    self.assertEqual(self.scope.query(':{0}:DISPlay?'.format(self.scope._interpret_channel(channel))),
+                                     '1' if channel == 1 else '0')
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=reader, args=args) for args in ((1, 'RAW'), (2, 'RAW'), (1, 'NORM'))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = FakeDS1054Z(FakeScope(raw_points=600000), cache_size=1500000)
+        self.data = self.scope.get_waveform_bytes(1, mode='RAW')
+
+    def test_repeated_read(self):
+        messages = self.scope.scope.messages
+        self.assertEqual(self.scope.get_waveform_bytes(1, mode='RAW'), self.data)
+        # only the trigger status was asked for
+        self.assertEqual(self.scope.scope.messages - messages, 1)
+        self.assertEqual(len(self.scope.get_waveform(1, mode='RAW', start=1, stop=10)), 10)
+        self.assertEqual(self.scope.waveform_cache.hits, 1)
+
+    def test_time_range_list(self):
+        wp = self.scope.waveform_preamble_dict
+        time_range = [wp['xorig'], wp['xorig'] + 99 * wp['xinc']]
+        data = self.scope.get_waveform_bytes(1, mode='RAW', time_range=time_range)
+        self.assertEqual(data, self.data[:100])
+        self.assertEqual(self.scope.get_waveform_bytes(1, mode='RAW', time_range=tuple(time_range)), data)
+        self.assertEqual(self.scope.waveform_cache.hits, 1)
+
+    def test_new_acquisition(self):
+        for action in (self.scope.run, self.scope.single, self.scope.tforce,
+                       lambda: self.scope.set_channel_scale(1, 2.0)):
+            generation = self.scope.acquisition_generation
+            action()
+            self.scope.stop()
+            self.assertGreater(self.scope.acquisition_generation, generation)
+            misses = self.scope.waveform_cache.misses
+            self.scope.get_waveform_bytes(1, mode='RAW')
+            self.assertEqual(self.scope.waveform_cache.misses, misses + 1)
+
+    def test_trigger_status_change(self):
+        # started at the front panel
+        self.scope.scope.status = 'RUN'
+        messages = self.scope.scope.messages
+        self.scope.get_waveform_bytes(1, mode='RAW')
+        self.assertGreater(self.scope.scope.messages - messages, 1)
+
+    def test_lru_eviction(self):
+        self.scope.get_waveform_bytes(2, mode='RAW')
+        self.scope.get_waveform_bytes(1, mode='RAW')
+        self.scope.get_waveform_bytes(3, mode='RAW')
+        cache = self.scope.waveform_cache
+        self.assertEqual(cache.nbytes, 1200000)
+        self.assertEqual(sorted(key[0] for key in cache._entries), ['CHAN1', 'CHAN3'])
+        # larger than the whole budget: not cached
+        cache.max_bytes = 100
+        cache.put(cache.generation, 'big', b'x' * 101, 101)
+        self.assertEqual(cache.get(cache.generation, 'big'), None)
+
+class WindowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = FakeDS1054Z(FakeScope(raw_points=600000))
+        self.samples = self.scope.get_waveform_samples(1, mode='RAW')
+        self.wp = self.scope.waveform_preamble_dict
+
+    def test_sample_window(self):
+        samples = self.scope.get_waveform_samples(1, mode='RAW', start=249990, stop=250010)
+        self.assertEqual(samples, self.samples[249989:250010])
+
+    def test_time_window(self):
+        xinc = self.wp['xinc']
+        messages = self.scope.scope.messages
+        samples = self.scope.get_waveform_samples(1, mode='RAW', time_range=(-10 * xinc, 10 * xinc))
+        self.assertEqual(self.scope.scope.messages - messages, 9)
+        first = DS1054Z.waveform_window(self.wp, time_range=(-10 * xinc, 10 * xinc))[0]
+        self.assertAlmostEqual(self.wp['xorig'] + (first - 1) * xinc, -10 * xinc)
+        self.assertEqual(samples, self.samples[first-1:first+20])
+
+    def test_window_clipped(self):
+        self.assertEqual(DS1054Z.waveform_window(self.wp, start=-5, time_range=(-1e3, 1e3)), (1, 600000))
+        with self.assertRaises(NameError):
+            self.scope.get_waveform_bytes(1, mode='NORMal', start=10)
+
+class RecordingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = FakeDS1054Z(FakeScope(raw_points=1000))
+        self.scope.start_recording(5)
+
+    def test_iter_recorded_frames(self):
+        self.assertFalse(self.scope.recording)
+        self.assertEqual(self.scope.recorded_frames, 5)
+        frames = []
+        buffers = set()
+        for frame, data in self.scope.iter_recorded_frames(1, first=2):
+            self.assertEqual(len(data), 1000)
+            buffers.add(id(data.obj))
+            frames.append((frame, bytes(data)))
+        self.assertEqual([frame for frame, data in frames], [2, 3, 4, 5])
+        self.assertEqual(len(buffers), 1)
+        self.assertNotEqual(frames[0][1], frames[1][1])
+        self.scope.write(':FUNCtion:WREPlay:FCURrent 3')
+        self.assertEqual(self.scope.get_waveform_bytes(1, mode='RAW'), frames[1][1])
+
+    def test_save_recorded_frames(self):
+        from ds1054z.sweep import save_recorded_frames, ColumnStore
+        directory = tempfile.mkdtemp()
+        try:
+            save_recorded_frames(self.scope, [1, 2], directory)
+            with ColumnStore(directory) as store:
+                self.assertEqual(store.completed_steps(), set(range(1, 6)))
+                data, preamble = store.read(4, 'CHAN2')
+                self.assertEqual(len(data), 1000)
+        finally:
+            shutil.rmtree(directory)
+
+class TransportTest(unittest.TestCase):
+
+    def check_scope(self, scope):
+        self.assertEqual(scope.product, 'DS1104Z')
+        self.assertEqual(scope.query_many([':CHAN1:DISPlay?', ':CHAN2:DISPlay?']), ['1', '0'])
+        blob = scope.save_setup()
+        scope.set_channel_scale(1, 5.0)
+        self.assertTrue(scope.restore_setup(blob))
+        self.assertEqual(scope.get_channel_scale(1), 1.0)
+        self.assertEqual(len(scope.display_data), 60008)
+        return scope.get_waveform_bytes(1, mode='RAW')
+
+    def test_tcp_and_vxi11(self):
+        tcp_server = FakeScpiServer(FakeScope(raw_points=300000))
+        vxi11_server = FakeVxi11Server(FakeScope(raw_points=300000))
+        try:
+            tcp_scope = tcp_server.client()
+            vxi11_scope = vxi11_server.client()
+            data = self.check_scope(tcp_scope)
+            self.assertEqual(len(data), 300000)
+            self.assertEqual(data, self.check_scope(vxi11_scope))
+            tcp_scope.close()
+            vxi11_scope.close()
+        finally:
+            tcp_server.close()
+            vxi11_server.close()
+
+    def test_tcp_receives_into_buffer(self):
+        server = FakeScpiServer(FakeScope(raw_points=600000))
+        try:
+            scope = server.client()
+            read_ieee_block = scope.transport.read_ieee_block
+            buffers = []
+
+            def spy(into=None, timeout=10.0):
+                buffers.append(None if into is None else into.obj)
+                return read_ieee_block(into=into, timeout=timeout)
+
+            scope.transport.read_ieee_block = spy
+            data = scope.get_waveform_bytes(1, mode='RAW')
+            self.assertIsInstance(data, bytearray)
+            self.assertEqual(len(buffers), 3)
+            self.assertTrue(all(buff is data for buff in buffers))
+            self.assertEqual(data, server.scope.memory('CHAN1'))
+            image = scope.display_data
+            self.assertIsInstance(image, bytearray)
+            self.assertEqual(len(image), 60008)
+            scope.close()
+        finally:
+            server.close()
+
+    def test_tcp_query_many_fallback(self):
+        server = FakeScpiServer(FakeScope(concatenation=False))
+        try:
+            scope = server.client()
+            self.assertEqual(scope.query_many([':CHAN1:DISPlay?', ':CHAN2:DISPlay?', ':CHAN1:SCALe?']),
+                             ['1', '0', '1.000000e+00'])
+            self.assertEqual(scope.query(':TIMebase:MAIN:SCALe?'), '1.000000e-03')
+            scope.close()
+        finally:
+            server.close()
+
+    def test_next_message(self):
+        message, rest = FakeScpiServer.next_message(b':SYST:SET #13a\nb\n*IDN?\n')
+        self.assertEqual((message, rest), (b':SYST:SET #13a\nb', b'*IDN?\n'))
+
+    def test_unknown_transport(self):
+        with self.assertRaises(NameError):
+            DS1054Z('127.0.0.1', transport='usb', lazy=True)
+
+class SweepTest(unittest.TestCase):
+
+    GRID = {'timebase.scale': [1e-6, 1e-5], 'trigger.level': [0.1, 0.2, 0.3]}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.scope = FakeDS1054Z(FakeScope(trigger_after=1))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_acquire_single(self):
+        self.assertTrue(self.scope.acquire_single(timeout=1))
+        scope = FakeDS1054Z(FakeScope(trigger_after=None))
+        self.assertFalse(scope.acquire_single(timeout=0.05))
+
+    def test_acquire_single_immediate_trigger(self):
+        scope = FakeDS1054Z(FakeScope(trigger_after=0))
+        start = time.time()
+        for _ in range(5):
+            self.assertTrue(scope.acquire_single(timeout=1))
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_sweep(self):
+        from ds1054z.sweep import Sweep, ColumnStore
+        Sweep(self.scope, self.GRID, channels=[1, 2], directory=self.directory).run()
+        level_writes = [w for w in self.scope.scope.writes if w.startswith(':TRIGger:EDGe:LEVel')]
+        scale_writes = [w for w in self.scope.scope.writes if w.startswith(':TIMebase:MAIN:SCALe')]
+        self.assertEqual(len(level_writes), 6)
+        self.assertEqual(len(scale_writes), 2)
+        with ColumnStore(self.directory) as store:
+            self.assertEqual(store.completed_steps(), set(range(6)))
+            data, preamble = store.read(4, 'CHAN2')
+            self.assertEqual(len(data), 1200)
+            self.assertEqual(preamble[2], 1200)
+            self.assertEqual(store.records[4]['params'], {'timebase.scale': 1e-5, 'trigger.level': 0.2})
+            waveform = store.read_waveform(4, 'CHAN2')
+            self.assertEqual((len(waveform.volts), waveform.channel), (1200, 'CHAN2'))
+
+    def test_screen_padding_kept(self):
+        from ds1054z.sweep import Sweep, ColumnStore
+        self.scope.scope.screen_points = 1000
+        Sweep(self.scope, {'trigger.level': [0.1]}, channels=[1], directory=self.directory).run()
+        with ColumnStore(self.directory) as store:
+            waveform = store.read_waveform(0, 'CHAN1')
+            self.assertEqual((waveform.mask, waveform.first), ((1000, 1200), 1))
+            self.assertTrue(math.isnan(waveform.volts[1100]))
+            window = self.scope.get_waveform(1, mode='RAW', start=101, stop=200)
+            store.append(1, {}, {'CHAN1': window})
+            self.assertEqual(store.read_waveform(1, 'CHAN1').times, window.times)
+
+    def test_probe_ratio_rescales(self):
+        from ds1054z.sweep import Sweep
+        grid = [('channels.CHAN1.scale', [2.0]), ('channels.CHAN1.offset', [0.5]),
+                ('channels.CHAN1.probe_ratio', [1, 10])]
+        Sweep(self.scope, grid, channels=[1], directory=self.directory).run()
+        writes = [w for w in self.scope.scope.writes if w.startswith(':CHAN1:')]
+        self.assertEqual(writes[-3:], [':CHAN1:PROBe 10.0', ':CHAN1:SCALe 2.0', ':CHAN1:OFFSet 0.5'])
+
+    def test_resume(self):
+        from ds1054z.sweep import Sweep, ColumnStore
+        Sweep(self.scope, self.GRID, channels=[1], directory=self.directory).run()
+        index = os.path.join(self.directory, ColumnStore.INDEX_FILENAME)
+        with open(index) as f:
+            lines = f.readlines()
+        with open(index, 'w') as f:
+            f.writelines(lines[:4] + [lines[4][:10]])
+        progress = []
+        Sweep(self.scope, self.GRID, channels=[1], directory=self.directory).run(
+            progress=lambda step, steps, params: progress.append(step))
+        self.assertEqual(progress, [4, 5])
+        with ColumnStore(self.directory) as store:
+            self.assertEqual(store.completed_steps(), set(range(6)))
+            self.assertEqual(os.path.getsize(os.path.join(self.directory, 'CHAN1.bin')), 6 * 1200)
+
+    def test_resume_keeps_index(self):
+        from ds1054z.sweep import Sweep, ColumnStore
+        Sweep(self.scope, self.GRID, channels=[1], directory=self.directory).run()
+        index = os.path.join(self.directory, ColumnStore.INDEX_FILENAME)
+        with open(index, 'rb') as f:
+            lines = f.readlines()
+        # a complete record without its line end counts as interrupted
+        with open(index, 'wb') as f:
+            f.writelines(lines[:5] + [lines[5].rstrip(b'\n')])
+        store = ColumnStore(self.directory)
+        with open(index, 'rb') as f:
+            self.assertEqual(f.read(), b''.join(lines[:5]))
+        self.assertEqual(store.completed_steps(), set(range(5)))
+        store.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+import unittest, subprocess, sys
+
+# Time budget (in seconds) for importing the CLI module, excluding interpreter startup
+STARTUP_BUDGET = 0.25
+
+HEAVY_MODULES = ('pkg_resources', 'PIL', 'zeroconf', 'csv', 'numpy')
+
+def run_python(code):
+    return subprocess.check_output([sys.executable, '-c', code]).decode('utf-8').strip()
+
+class StartupTest(unittest.TestCase):
+
+    def test_no_heavy_imports(self):
+        code = ("import sys, ds1054z.cli\n"
+                "print(' '.join(m for m in {0!r} if m in sys.modules))".format(HEAVY_MODULES))
+        self.assertEqual(run_python(code), '')
+
+    def test_import_time_budget(self):
+        code = ("import time\n"
+                "start = time.perf_counter()\n"
+                "import ds1054z.cli\n"
+                "print(time.perf_counter() - start)")
+        elapsed = min(float(run_python(code)) for _ in range(3))
+        self.assertLess(elapsed, STARTUP_BUDGET)
+
+    def test_help(self):
+        out = subprocess.check_output([sys.executable, '-m', 'ds1054z.cli', '--help'])
+        self.assertIn(b'<action>', out)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""
+Tests of the compressed capture files in ds1054z.storage against the simulated scope.
+"""
+
+import unittest, tempfile, shutil, os, random
+
+from ds1054z.storage import (CaptureWriter, CaptureReader, delta_encode, delta_decode, detect_codec,
+                             open_compressed, codec_from_filename, save_capture, load_waveform)
+
+from fake_scope import FakeScope, FakeDS1054Z
+
+PREAMBLE = (0, 2, 5000, 1, 1e-09, -2.5e-06, 0, 0.04, 0, 127)
+
+class DeltaFilterTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        rnd = random.Random(1)
+        data = bytes(bytearray(rnd.getrandbits(8) for _ in range(20000)))
+        encoded = delta_encode(data, previous=7)
+        self.assertEqual(encoded, bytes(bytearray((b - a) & 0xff for a, b in zip((7,) + tuple(data), data))))
+        self.assertEqual(delta_decode(encoded, previous=7), data)
+
+    def test_streamed(self):
+        data = bytes(bytearray(range(256))) * 50
+        encoded = delta_encode(data[:1000]) + delta_encode(data[1000:], previous=data[999])
+        self.assertEqual(encoded, b'\x00' + b'\x01' * (len(data) - 1))
+        self.assertEqual(delta_decode(encoded[:3333]) + delta_decode(encoded[3333:], previous=data[3332]), data)
+        self.assertEqual(delta_encode(b''), b'')
+
+class CaptureFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_and_read(self, codec, fmt='BYTE'):
+        path = os.path.join(self.directory, 'capture')
+        data = bytes(bytearray(int(40 + (i // 7) % 50) for i in range(10000)))
+        with CaptureWriter(path, PREAMBLE, channel='CHAN1', mode='RAW', fmt=fmt, first=11, codec=codec) as writer:
+            for pos in range(0, len(data), 3000):
+                writer.write(data[pos:pos+3000])
+        self.assertEqual(writer.nbytes, len(data))
+        self.assertEqual(detect_codec(path), codec)
+        with CaptureReader(path) as reader:
+            chunks = list(reader.iter_chunks(chunk_size=4096))
+        self.assertEqual(b''.join(chunk for offset, chunk in chunks), data)
+        self.assertEqual([offset for offset, chunk in chunks][:2], [0, len(chunks[0][1])])
+        waveform = load_waveform(path)
+        self.assertEqual((waveform.data, waveform.preamble), (data, PREAMBLE))
+        self.assertEqual((waveform.channel, waveform.mode, waveform.fmt, waveform.first), ('CHAN1', 'RAW', fmt, 11))
+        return path, reader.header
+
+    def test_codecs(self):
+        for codec in (None, 'gzip', 'lzma'):
+            path, header = self.write_and_read(codec)
+            self.assertEqual(header['filter'], 'delta')
+            if codec is not None:
+                self.assertLess(os.path.getsize(path), 2000)
+
+    def test_zstd(self):
+        try:
+            import zstandard
+        except ImportError:
+            self.skipTest('zstandard is not installed')
+        self.write_and_read('zstd')
+
+    def test_word_data_unfiltered(self):
+        path, header = self.write_and_read('gzip', fmt='WORD')
+        self.assertEqual(header['filter'], None)
+
+    def test_not_a_capture(self):
+        path = os.path.join(self.directory, 'data.csv.xz')
+        self.assertEqual(codec_from_filename(path), (path[:-3], 'lzma'))
+        with open_compressed(path, 'wt', 'lzma', newline='') as f:
+            f.write('TIME,CHAN1\r\n')
+        with open_compressed(path, 'rt', newline='') as f:
+            self.assertEqual(f.read(), 'TIME,CHAN1\r\n')
+        with self.assertRaises(IOError):
+            CaptureReader(path)
+
+class SaveCaptureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.scope = FakeDS1054Z(FakeScope(raw_points=600000))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_raw(self):
+        path = os.path.join(self.directory, 'raw.cap.gz')
+        self.assertEqual(save_capture(self.scope, 2, path, start=1001, stop=400000), 399000)
+        waveform = load_waveform(path)
+        self.assertEqual(waveform.data, self.scope.get_waveform_bytes(2, mode='RAW', start=1001, stop=400000))
+        self.assertEqual((waveform.channel, waveform.first), ('CHAN2', 1001))
+        self.assertEqual(waveform.preamble, self.scope.waveform_preamble)
+        self.assertLess(os.path.getsize(path), 399000 // 4)
+
+    def test_single_preamble_query(self):
+        queries = []
+        query = self.scope.query
+        def recording_query(message, *args, **kwargs):
+            queries.append(message)
+            return query(message, *args, **kwargs)
+        self.scope.query = recording_query
+        path = os.path.join(self.directory, 'raw.cap')
+        save_capture(self.scope, 1, path, codec=None)
+        self.assertEqual(queries.count(':WAVeform:PREamble?'), 1)
+        self.assertEqual(load_waveform(path).preamble, self.scope.waveform_preamble)
+
+    def test_screen(self):
+        path = os.path.join(self.directory, 'screen.cap.gz')
+        save_capture(self.scope, 1, path, mode='NORMal')
+        waveform = load_waveform(path)
+        self.assertEqual(waveform.volts, self.scope.get_waveform(1).volts)
+
+if __name__ == '__main__':
+    unittest.main()